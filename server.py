@@ -11,16 +11,22 @@ import sys
 #from flask_limiter.util import get_remote_address
 import logging
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+import instrumentation
+
 app = Flask(__name__)
-CORS(app, origins=["https://daniel-lee-user.github.io", "http://127.0.0.1:5500"], methods=["GET", "POST", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization"])
+CORS(app, origins=["https://daniel-lee-user.github.io", "http://127.0.0.1:5500"], methods=["GET", "POST", "DELETE", "OPTIONS"], allow_headers=["Content-Type", "Authorization"], expose_headers=["Server-Timing"])
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 logger = logging.getLogger('waitress')
+# Set PERFECT_PACE_PROFILE=1 to record per-stage timings and return them in a Server-Timing header
+PROFILING = instrumentation.enable_from_env()
 #limiter = Limiter(get_remote_address, app=app, default_limits=["200 per day", "50 per hour"])
 
 @app.route('/upload', methods=['POST'])
 #@limiter.limit("10 per minute")
 def upload_file():
     logger.info("RECEIVED REQUEST")
+    instrumentation.reset()
     file = request.files.get('file')
     filename = request.form.get('filename')
     from pathlib import Path
@@ -52,17 +58,27 @@ def upload_file():
     
     # Paths for the output JSON and TXT files
     output_base_path = os.path.join(save_directory, 'results')
+    timings_path = None
 
     try:
         # Run the Python script with the flags
         logger.info(file_path)
         file_path = os.path.realpath(file_path)
         os.chdir("src/")
-        result = subprocess.run(
-            [sys.executable, 'segment_script.py', '-f', file_path, '-t', time, '-o', output_base_path],
-            capture_output=True,
-            text=True
-        )
+        command = [sys.executable, 'segment_script.py', '-f', file_path, '-t', time, '-o', output_base_path]
+        if PROFILING:
+            # A file per request, so concurrent requests do not read each other's timings
+            timings_fd, timings_path = tempfile.mkstemp(prefix='timings_', suffix='.json')
+            os.close(timings_fd)
+            command += ['--timings', timings_path]
+            if instrumentation.is_tracing_memory():
+                command.append('--trace-memory')
+        with instrumentation.span('script'):
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True
+            )
         logger.info(result)
     except Exception as e:
         logger.info(f"Error: {e}")
@@ -85,19 +101,30 @@ def upload_file():
     for required_file in required_files:
         if not os.path.exists(required_file):
             logger.error(f"Missing required file: {required_file}")
+            if timings_path is not None:
+                os.remove(timings_path)
             return jsonify({'error': f"Missing required file: {os.path.basename(required_file)}"}), 500
     
     # Create a zip file containing all the required frontend files
     zip_filename = f"{file.filename.split('.')[0]}_results.zip"
     zip_file_path = os.path.join(save_directory, zip_filename)
-    with zipfile.ZipFile(zip_file_path, 'w') as zipf:
-        for required_file in required_files:
-            zipf.write(required_file, os.path.basename(required_file))
+    with instrumentation.span('zip'):
+        with zipfile.ZipFile(zip_file_path, 'w') as zipf:
+            for required_file in required_files:
+                zipf.write(required_file, os.path.basename(required_file))
 
     logger.info(f"Generated zip file: {zip_file_path}")
 
     # Return the zip file to the frontend
-    return send_file(zip_file_path, as_attachment=True, mimetype='application/zip')
+    response = send_file(zip_file_path, as_attachment=True, mimetype='application/zip')
+    if PROFILING:
+        if timings_path is not None and os.path.getsize(timings_path) > 0:
+            instrumentation.add_spans(instrumentation.load_spans(timings_path), prefix='script')
+        if timings_path is not None:
+            os.remove(timings_path)
+        instrumentation.log_spans(logger, request='upload', file=os.path.basename(file_path))
+        response.headers['Server-Timing'] = instrumentation.server_timing_header()
+    return response
 
 @app.route('/delete', methods=['DELETE'])
 #@limiter.limit("10 per minute")
@@ -0,0 +1,251 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import gpx_parser
+import segment_view
+from race_course import RealRaceCourse
+from pacing_plan import PacingPlanAvgPace
+from planning_context import PlanningContext
+from main import PACING_PLAN_METHODS
+from segment_script import SEGMENTING_METHODS
+
+DEFAULT_SEGMENTS = [100, 250, 500, 1000, 2000]
+DEFAULT_PACES = [1, 5, 10]
+# Defaults are relative to the repository root, whatever the working directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_COURSES = os.path.join(REPO_ROOT, 'data', '*.gpx')
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, 'data', 'benchmark-results', 'latest.json')
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'data', 'benchmark-results', 'baseline.json')
+
+# The exact DP is quadratic in the number of segments (and keeps a dense cost matrix) and the
+# MILPs scale worse, so they are only run up to these sizes unless overridden with --max-segments.
+METHOD_MAX_SEGMENTS = {
+    "BFA": 1000,
+    "BFS": 2000,
+    "LPA": 100,
+    "LPS": 100,
+}
+
+def init_parser() -> argparse.ArgumentParser:
+    '''
+    Initializes the command line flag parser for this file.
+
+    Flags:
+
+    [OPTIONAL]
+    -c, --courses       ==> gpx files to benchmark (default: data/*.gpx)
+    -n, --segments      ==> N_SEGMENTS values to sweep
+    -p, --paces         ==> total_paces values to sweep
+    -m, --methods       ==> pacing plan / segmenting methods to run
+    -r, --repeat        ==> timing repetitions per stage (the minimum is kept)
+    -o, --output        ==> path of the json results file
+    -b, --baseline      ==> path of the json baseline to compare against
+    --save-baseline     ==> overwrite the baseline with this run (required if there is none yet)
+    --max-segments      ==> per method segment limits, e.g. BFS=500
+    --time-tolerance    ==> allowed relative slowdown before flagging a regression
+    --memory-tolerance  ==> allowed relative peak memory growth before flagging a regression
+    -h                  ==> opens help menu
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--courses", nargs="+", default=None, help="gpx files to benchmark (default: data/*.gpx)")
+    parser.add_argument("-n", "--segments", nargs="+", type=int, default=DEFAULT_SEGMENTS, help="N_SEGMENTS values to sweep")
+    parser.add_argument("-p", "--paces", nargs="+", type=int, default=DEFAULT_PACES, help="total_paces values to sweep")
+    parser.add_argument("-m", "--methods", nargs="+", default=None,
+                        help="methods to run. Options are: " + ", ".join(list(PACING_PLAN_METHODS.keys()) + [f"seg_{k}" for k in SEGMENTING_METHODS.keys()]))
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="timing repetitions per stage")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="path of the json results file")
+    parser.add_argument("-b", "--baseline", default=DEFAULT_BASELINE, help="path of the json baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with the results of this run")
+    parser.add_argument("--max-segments", nargs="+", default=[], help="per method segment limits, e.g. BFS=500 LPS=100")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative peak memory growth")
+    return parser
+
+def measure(func, repeat):
+    """
+    Runs func [repeat] times untraced and keeps the fastest wall time, then runs it once more
+    under tracemalloc to record the peak memory allocated during the call.
+    """
+    best_time = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best_time, peak / 2**20
+
+def record(results, course_name, n_segments, total_paces, stage, func, repeat):
+    try:
+        elapsed, peak_mb = measure(func, repeat)
+    except Exception as e:
+        # A failing solver should not abort the remaining stages of the sweep
+        print(f"{course_name:<20} {stage:<12} failed: {e}")
+        results.append({
+            "course": course_name,
+            "n_segments": n_segments,
+            "total_paces": total_paces,
+            "stage": stage,
+            "error": str(e),
+        })
+        return
+    results.append({
+        "course": course_name,
+        "n_segments": n_segments,
+        "total_paces": total_paces,
+        "stage": stage,
+        "time_s": elapsed,
+        "peak_mb": peak_mb,
+    })
+    segments_txt = '-' if n_segments is None else n_segments
+    paces_txt = '-' if total_paces is None else total_paces
+    print(f"{course_name:<20} {segments_txt:>6} {paces_txt:>4}  {stage:<12} {elapsed*1000:>10.2f} ms {peak_mb:>9.2f} MB")
+
+def run_pacing_plan(pacing_plan_class, course, view, target_time, total_paces, context=None):
+    course.change_view(view)
+    plan = pacing_plan_class(course, target_time, total_paces, context)
+    plan.calculate_recommendations(eps=1e-1)
+
+def run_segmenting_plan(segmenting_plan_class, course, view, context=None):
+    course.change_view(view)
+    plan = segmenting_plan_class(course, context)
+    plan.calculate_segments()
+
+def benchmark_course(file_path, args, max_segments, results):
+    course_name = os.path.basename(file_path).split('.')[0]
+    record(results, course_name, None, None, 'parse', lambda: gpx_parser.parse_gpx(file_path), args.repeat)
+
+    for n_segments in args.segments:
+        record(results, course_name, n_segments, None, 'course',
+               lambda: RealRaceCourse(course_name, file_path, N_SEGMENTS=n_segments), args.repeat)
+
+        # Solvers run on the uniformly interpolated view at this resolution
+        course = RealRaceCourse(course_name, file_path, N_SEGMENTS=n_segments)
+        view = segment_view.SegmentViewImperial(segment_view.SegmentViewInterpUniform(course.metric_view, n_segments))
+        course.change_view(view)
+        target_time = course.total_distance * 8
+
+        for method_name, segmenting_plan_class in SEGMENTING_METHODS.items():
+            stage = f'seg_{method_name}'
+            if args.methods and stage not in args.methods:
+                continue
+            record(results, course_name, n_segments, None, stage,
+                   lambda: run_segmenting_plan(segmenting_plan_class, course, view), args.repeat)
+
+        for total_paces in args.paces:
+            # Construction of a plan without a shared context builds its own PlanningContext
+            # (grade adjustments, optimal paces and the prefix sums of the weighted paces);
+            # 'context' times that precompute alone
+            course.change_view(view)
+            record(results, course_name, n_segments, total_paces, 'plan',
+                   lambda: PacingPlanAvgPace(course, target_time, total_paces), args.repeat)
+            record(results, course_name, n_segments, total_paces, 'context',
+                   lambda: PlanningContext(course, target_time), args.repeat)
+
+            for method_name, pacing_plan_class in PACING_PLAN_METHODS.items():
+                if args.methods and method_name not in args.methods:
+                    continue
+                if n_segments > max_segments.get(method_name, np.inf):
+                    continue
+                record(results, course_name, n_segments, total_paces, method_name,
+                       lambda: run_pacing_plan(pacing_plan_class, course, view, target_time, total_paces), args.repeat)
+
+def result_key(result):
+    return (result["course"], result["n_segments"], result["total_paces"], result["stage"])
+
+def compare_to_baseline(results, baseline, time_tolerance, memory_tolerance, min_time_delta=5e-3, min_memory_delta=1.0):
+    """
+    Returns the list of results that are slower or use more peak memory than the baseline
+    by more than the given relative tolerance. Small absolute differences are ignored as noise.
+    """
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = baseline_results.get(result_key(result))
+        if base is None or "error" in result or "error" in base:
+            continue
+        slower = result["time_s"] > base["time_s"] * (1 + time_tolerance) and result["time_s"] - base["time_s"] > min_time_delta
+        larger = result["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) and result["peak_mb"] - base["peak_mb"] > min_memory_delta
+        if slower or larger:
+            regressions.append((result, base))
+    return regressions
+
+def main():
+    parser = init_parser()
+    args = parser.parse_args()
+
+    courses = args.courses if args.courses else sorted(glob.glob(DEFAULT_COURSES))
+    max_segments = dict(METHOD_MAX_SEGMENTS)
+    for limit in args.max_segments:
+        method, value = limit.split('=')
+        max_segments[method] = int(value)
+
+    results = []
+    for file_path in courses:
+        benchmark_course(file_path, args, max_segments, results)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "segments": args.segments,
+            "paces": args.paces,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    output_directory = os.path.dirname(args.output)
+    if output_directory and not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nSaved results to {args.output}")
+
+    if args.save_baseline:
+        baseline_directory = os.path.dirname(args.baseline)
+        if baseline_directory and not os.path.exists(baseline_directory):
+            os.makedirs(baseline_directory)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        # Baselines are machine specific, so none is committed; a missing one must not pass the gate
+        print(f"No baseline found at {args.baseline}. Run with --save-baseline on this machine first")
+        sys.exit(2)
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for result, base in regressions:
+        course_name, n_segments, total_paces, stage = result_key(result)
+        print(f"REGRESSION {course_name} n={n_segments} p={total_paces} {stage}: "
+              f"{base['time_s']*1000:.2f} -> {result['time_s']*1000:.2f} ms, "
+              f"{base['peak_mb']:.2f} -> {result['peak_mb']:.2f} MB")
+
+    if regressions:
+        sys.exit(1)
+    print("No regressions against baseline")
+
+if __name__ == '__main__':
+    main()
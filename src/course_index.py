@@ -0,0 +1,172 @@
+import weakref
+import numpy as np
+from scipy.spatial import cKDTree
+import simplify
+
+SAMPLE_SPACING = 20         # Meters, largest gap between the indexed points of a segment
+AMBIGUITY_DISTANCE = 30     # Meters, segments this close to the nearest one are told apart by the prior position
+TRACKER_LOOKAHEAD = 1000    # Meters, how far ahead of its last position a tracker searches first
+TRACKER_BACKTRACK = 50      # Meters, how far behind its last position a tracker may move
+
+def get_pass_minima(offsets, is_connected=None):
+    """
+    Mask of the local minima of the offsets of consecutive points along the course, the closest
+    point of each pass of the course by a position. is_connected[i] tells whether points i and
+    i + 1 are neighbours (all are by default).
+    """
+    if is_connected is None:
+        is_connected = np.ones(len(offsets) - 1, dtype=bool)
+    is_minimum = np.ones(len(offsets), dtype=bool)
+    is_minimum[1:] &= ~is_connected | (offsets[1:] <= offsets[:-1])
+    is_minimum[:-1] &= ~is_connected | (offsets[:-1] <= offsets[1:])
+    return is_minimum
+
+class CourseIndex:
+    """
+    Spatial index of the segments of the current view of a course, for snapping GPS positions (a
+    live fix, a map click) to a segment and a distance along the course.
+
+    The track is projected to meters around its mean and points are sampled along every segment,
+    at most SAMPLE_SPACING apart, into a KD-tree. A query finds the nearest sample in O(log n), then
+    the exact distance to each segment with a sample within that distance plus the sampling gap,
+    so the nearest segment is exact and not only the nearest point.
+
+    Distances along the course are in the view's units (miles for imperial views); offsets from
+    the course are in meters.
+    """
+    def __init__(self, race_course, sample_spacing=SAMPLE_SPACING):
+        self.race_course = race_course
+        self.start_distances = race_course.start_distances
+        self.segment_lengths = race_course.segment_lengths
+        self.n_segments = len(self.segment_lengths)
+        self.origin = (float(np.mean(race_course.lats)), float(np.mean(race_course.lons)))
+        x, y = simplify.project_track(race_course.lats, race_course.lons, self.origin)
+        self.x, self.y = x[:-1], y[:-1]
+        self.dx, self.dy = np.diff(x), np.diff(y)
+        self.squared_lengths = self.dx**2 + self.dy**2
+        projected_lengths = np.sqrt(self.squared_lengths)
+        self.units_per_meter = race_course.total_distance / max(projected_lengths.sum(), 1e-9)
+
+        # Samples at the middle of equal parts of each segment, so every point of a segment is
+        # within slack of one of its samples
+        counts = np.maximum(np.ceil(projected_lengths / sample_spacing).astype(int), 1)
+        self.sample_segments = np.repeat(np.arange(self.n_segments), counts)
+        first_samples = np.cumsum(counts) - counts
+        fractions = (np.arange(len(self.sample_segments)) - first_samples[self.sample_segments] + 0.5) / counts[self.sample_segments]
+        sample_x = self.x[self.sample_segments] + fractions * self.dx[self.sample_segments]
+        sample_y = self.y[self.sample_segments] + fractions * self.dy[self.sample_segments]
+        self.slack = float(np.max(projected_lengths / (2 * counts)))
+        self.tree = cKDTree(np.column_stack((sample_x, sample_y)))
+
+    def project(self, lats, lons):
+        return simplify.project_track(np.atleast_1d(lats), np.atleast_1d(lons), self.origin)
+
+    def get_offsets(self, segments, x, y):
+        """
+        Distance in meters of each point (x, y) to its segment, and the distance of the closest
+        point of the segment along the course.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((x - self.x[segments]) * self.dx[segments] + (y - self.y[segments]) * self.dy[segments]) / self.squared_lengths[segments]
+        t = np.clip(np.nan_to_num(t), 0, 1)
+        offsets = np.hypot(x - self.x[segments] - t * self.dx[segments], y - self.y[segments] - t * self.dy[segments])
+        return offsets, self.start_distances[segments] + t * self.segment_lengths[segments]
+
+    def locate(self, lats, lons, prior_distances=None, ambiguity=AMBIGUITY_DISTANCE):
+        """
+        Snaps each position to the course. Returns the segment index, the distance along the
+        course and the offset from it in meters of each position.
+
+        Where the course passes within [ambiguity] meters of the nearest segment more than once
+        (out-and-back and loop courses), the pass closest along the course to the position's
+        [prior_distances] is taken, the nearest one if no prior is given.
+        """
+        x, y = self.project(lats, lons)
+        nearest, _ = self.tree.query(np.column_stack((x, y)))
+        balls = self.tree.query_ball_point(np.column_stack((x, y)), nearest + self.slack + ambiguity, return_sorted=False)
+        counts = np.fromiter((len(ball) for ball in balls), dtype=int, count=len(balls))
+        queries = np.repeat(np.arange(len(x)), counts)
+        segments = self.sample_segments[np.concatenate(balls).astype(int)]
+        offsets, distances = self.get_offsets(segments, x[queries], y[queries])
+
+        # Candidates of a query within [ambiguity] of each other along the course are one stretch
+        # of it; every local minimum of the offset along a stretch is a pass of the course
+        order = np.lexsort((distances, queries))
+        queries, segments, offsets, distances = queries[order], segments[order], offsets[order], distances[order]
+        is_connected = (queries[1:] == queries[:-1]) & (np.diff(distances) <= ambiguity * self.units_per_meter)
+        passes = get_pass_minima(offsets, is_connected)
+        queries, segments, offsets, distances = queries[passes], segments[passes], offsets[passes], distances[passes]
+
+        best_offsets = np.full(len(x), np.inf)
+        np.minimum.at(best_offsets, queries, offsets)
+        is_candidate = offsets <= best_offsets[queries] + ambiguity
+        if prior_distances is None:
+            scores = offsets
+        else:
+            prior_distances = np.broadcast_to(np.asarray(prior_distances, dtype=float), x.shape)
+            scores = np.abs(distances - prior_distances[queries])
+        # The best pass of each query, breaking ties by offset
+        order = np.lexsort((offsets, scores, ~is_candidate, queries))
+        _, firsts = np.unique(queries[order], return_index=True)
+        chosen = order[firsts]
+        return segments[chosen], distances[chosen], offsets[chosen]
+
+    def locate_segment(self, lat, lon, prior_distance=None):
+        """
+        Index of the segment at one position, e.g. a click on the map.
+        """
+        segments, _, _ = self.locate(lat, lon, prior_distance)
+        return int(segments[0])
+
+class CourseTracker:
+    """
+    Streams GPS fixes of a runner onto a course. Progress along a course is almost monotone, so a
+    fix is first snapped to the segments from [backtrack] meters behind to [lookahead] meters ahead
+    of the last position, which also tells apart the passes of out-and-back and loop courses. Only
+    when no segment there is within [ambiguity] meters is the whole course searched, with the last
+    position as the prior.
+    """
+    def __init__(self, index, lookahead=TRACKER_LOOKAHEAD, backtrack=TRACKER_BACKTRACK, ambiguity=AMBIGUITY_DISTANCE, start_distance=0.0):
+        self.index = index
+        self.lookahead = lookahead * index.units_per_meter
+        self.backtrack = backtrack * index.units_per_meter
+        self.ambiguity = ambiguity
+        self.distance = start_distance
+        self.segment = int(np.searchsorted(index.start_distances, start_distance, side='right') - 1)
+        self.offset = None
+        self.n_searches = 0 # fixes that needed the whole course
+
+    def update(self, lat, lon):
+        """
+        Moves the tracker to a fix. Returns its segment, distance along the course and offset in meters.
+        """
+        x, y = self.index.project(lat, lon)
+        first = max(int(np.searchsorted(self.index.start_distances, self.distance - self.backtrack, side='right')) - 1, 0)
+        last = int(np.searchsorted(self.index.start_distances, self.distance + self.lookahead, side='right'))
+        segments = np.arange(first, max(last, first + 1))
+        offsets, distances = self.index.get_offsets(segments, x, y)
+        offsets[distances < self.distance - self.backtrack] = np.inf
+        best_offset = offsets.min()
+        if best_offset <= self.ambiguity:
+            # The pass of the course through the window nearest the last position
+            passes = np.flatnonzero(get_pass_minima(offsets) & (offsets <= best_offset + self.ambiguity))
+            best = passes[np.argmin(np.abs(distances[passes] - self.distance))]
+            self.segment, self.distance, self.offset = int(segments[best]), float(distances[best]), float(offsets[best])
+        else:
+            self.n_searches += 1
+            segments, distances, offsets = self.index.locate(lat, lon, self.distance, self.ambiguity)
+            self.segment, self.distance, self.offset = int(segments[0]), float(distances[0]), float(offsets[0])
+        return self.segment, self.distance, self.offset
+
+# race course -> (end distances the index was built from, CourseIndex)
+_cache = weakref.WeakKeyDictionary()
+
+def get_course_index(race_course):
+    """
+    Returns the CourseIndex of the current view of [race_course], built once per view.
+    """
+    end_distances, index = _cache.get(race_course, (None, None))
+    if end_distances is not race_course.end_distances:
+        index = CourseIndex(race_course)
+        _cache[race_course] = (race_course.end_distances, index)
+    return index
@@ -0,0 +1,171 @@
+import os
+import re
+from collections import OrderedDict
+import numpy as np
+
+MAX_OPEN_TILES = 16         # Tiles kept memory-mapped by a DEMTileCache
+HGT_VOID = -32768           # Elevation of the missing samples of SRTM tiles
+HGT_NAME = re.compile(r'^([NS])(\d{2})([EW])(\d{3})\.hgt$', re.IGNORECASE)
+
+class DEMReport:
+    """
+    What correct_elevations changed in a track, for logging and for returning to the uploader.
+    """
+    def __init__(self, n_points):
+        self.n_points = n_points
+        self.n_covered = 0
+        self.n_corrected = 0
+        self.n_tiles = 0
+        self.mean_correction = 0.0
+        self.max_correction = 0.0
+
+    def to_dict(self):
+        return {
+            "n_points": self.n_points,
+            "n_covered": self.n_covered,
+            "n_corrected": self.n_corrected,
+            "n_tiles": self.n_tiles,
+            "mean_correction": self.mean_correction,
+            "max_correction": self.max_correction,
+        }
+
+    def __repr__(self):
+        if self.n_corrected == 0 and self.n_covered > 0:
+            return f"DEM: kept the GPX elevations, the tiles only cover {self.n_covered} of {self.n_points} points"
+        return (f"DEM: corrected {self.n_corrected} of {self.n_points} elevations from {self.n_tiles} tiles "
+                f"(mean change {self.mean_correction:.1f} m, max {self.max_correction:.1f} m)")
+
+def parse_tile_name(file_name):
+    """
+    Returns the (lat, lon) of the south west corner of an SRTM tile named like N42W072.hgt, or
+    None if the name is not one.
+    """
+    match = HGT_NAME.match(file_name)
+    if match is None:
+        return None
+    lat = int(match.group(2)) * (1 if match.group(1).upper() == 'N' else -1)
+    lon = int(match.group(4)) * (1 if match.group(3).upper() == 'E' else -1)
+    return lat, lon
+
+class DEMTileCache:
+    """
+    Elevations from the SRTM .hgt tiles of a directory (1 or 3 arc second, 1 degree tiles of big
+    endian int16 rows from north to south). The directory is indexed once; tiles are memory-mapped
+    on first use and the [max_tiles] most recently used stay open, so only the pages of a tile
+    that are sampled are read from disk.
+    """
+    def __init__(self, directory, max_tiles=MAX_OPEN_TILES):
+        self.directory = directory
+        self.max_tiles = max_tiles
+        self.tile_paths = {}
+        for file_name in os.listdir(directory):
+            corner = parse_tile_name(file_name)
+            if corner is not None:
+                self.tile_paths[corner] = os.path.join(directory, file_name)
+        self.tiles = OrderedDict()
+        self.n_opens = 0
+
+    def get_tile(self, corner):
+        """
+        The memory-mapped samples of the tile with south west [corner], None if there is no such tile.
+        """
+        if corner in self.tiles:
+            self.tiles.move_to_end(corner)
+            return self.tiles[corner]
+        path = self.tile_paths.get(corner)
+        if path is None:
+            return None
+        side = int(round(np.sqrt(os.path.getsize(path) / 2)))
+        if side * side * 2 != os.path.getsize(path):
+            raise ValueError(f"{path} is not a square grid of int16 samples")
+        tile = np.memmap(path, dtype='>i2', mode='r', shape=(side, side))
+        self.n_opens += 1
+        self.tiles[corner] = tile
+        if len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def get_corners(self, lats, lons):
+        """
+        South west corner of the tile sampled at each position. A position on the south or west
+        edge of its tile is also on the north or east edge of a neighbour, which is used instead
+        when the directory has no tile for the position's own corner.
+        """
+        corner_lats = np.floor(lats).astype(int)
+        corner_lons = np.floor(lons).astype(int)
+        on_edge = np.flatnonzero((lats == corner_lats) | (lons == corner_lons))
+        for i in on_edge.tolist():
+            corner = (int(corner_lats[i]), int(corner_lons[i]))
+            if corner in self.tile_paths:
+                continue
+            lat_steps = (0, 1) if lats[i] == corner[0] else (0,)
+            lon_steps = (0, 1) if lons[i] == corner[1] else (0,)
+            neighbours = [(corner[0] - dlat, corner[1] - dlon) for dlat in lat_steps for dlon in lon_steps]
+            covering = [neighbour for neighbour in neighbours if neighbour in self.tile_paths]
+            if covering:
+                corner_lats[i], corner_lons[i] = covering[0]
+        return corner_lats, corner_lons
+
+    def sample(self, lats, lons):
+        """
+        Bilinearly interpolated elevations in meters at each position, nan where no tile covers
+        it or a neighbouring sample is void. Positions are grouped by tile, so each tile is looked
+        up once per call. Returns the elevations and the number of tiles used.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        elevations = np.full(lats.shape, np.nan)
+        corner_lats, corner_lons = self.get_corners(lats, lons)
+        corners, tile_indices = np.unique(np.column_stack((corner_lats, corner_lons)), axis=0, return_inverse=True)
+        tile_indices = tile_indices.ravel()
+        n_tiles = 0
+        for i, (corner_lat, corner_lon) in enumerate(corners):
+            tile = self.get_tile((int(corner_lat), int(corner_lon)))
+            if tile is None:
+                continue
+            n_tiles += 1
+            points = np.flatnonzero(tile_indices == i)
+            steps = tile.shape[0] - 1
+            # Row 0 is the north edge of the tile
+            rows = (corner_lat + 1 - lats[points]) * steps
+            cols = (lons[points] - corner_lon) * steps
+            row0 = np.clip(np.floor(rows).astype(int), 0, steps - 1)
+            col0 = np.clip(np.floor(cols).astype(int), 0, steps - 1)
+            row_weights = rows - row0
+            col_weights = cols - col0
+            corner_values = [tile[row0 + dr, col0 + dc].astype(float) for dr in (0, 1) for dc in (0, 1)]
+            corner_values = [np.where(values == HGT_VOID, np.nan, values) for values in corner_values]
+            top = corner_values[0] * (1 - col_weights) + corner_values[1] * col_weights
+            bottom = corner_values[2] * (1 - col_weights) + corner_values[3] * col_weights
+            elevations[points] = top * (1 - row_weights) + bottom * row_weights
+        return elevations, n_tiles
+
+# directory -> DEMTileCache, so tiles stay open across courses
+_caches = {}
+
+def get_tile_cache(directory):
+    directory = os.path.abspath(directory)
+    if directory not in _caches:
+        _caches[directory] = DEMTileCache(directory)
+    return _caches[directory]
+
+def correct_elevations(lats, lons, elevations, tile_cache):
+    """
+    Replaces the (GPS or barometric) elevations of a track in meters with the DEM elevations of
+    [tile_cache]. The DEM and the GPX elevations can be tens of meters apart, so mixing them
+    would put a false hill at every edge of the coverage: unless the DEM covers every point
+    (no missing tile or void sample), the elevations are all kept and the report has
+    n_corrected 0. Returns the elevations and a DEMReport.
+    """
+    elevations = np.asarray(elevations, dtype=float)
+    report = DEMReport(len(elevations))
+    dem_elevations, report.n_tiles = tile_cache.sample(lats, lons)
+    covered = np.isfinite(dem_elevations)
+    report.n_covered = int(covered.sum())
+    if report.n_covered < report.n_points or report.n_points == 0:
+        return elevations, report
+    report.n_corrected = report.n_points
+    corrections = np.abs(dem_elevations - elevations)
+    report.mean_correction = float(corrections.mean())
+    report.max_correction = float(corrections.max())
+    return dem_elevations, report
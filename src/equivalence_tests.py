@@ -0,0 +1,184 @@
+import numpy as np
+
+import hill_detection
+import pacing_dp
+import utils
+from live_replanning import LiveReplanner
+from pacing_plan import PacingPlanBFSquare
+from planning_context import PlanningContext
+from race_course import RealRaceCourse
+
+# Reference versions of the loop-based hill detection and filler merging that hill_detection
+# replaced, to check that the vectorized versions give the same segments
+def reference_find_continuous_segments(hills, grades):
+    segments = []
+    start = None
+    n = len(hills)
+    i = 0
+    while i < n:
+        if hills[i]:
+            if start is None:
+                start = i
+            i += 1
+        else:
+            i += 1
+            if start is not None:
+                adjusted_start = reference_adjust_point(start, grades, -1)
+                adjusted_end = reference_adjust_point(i - 2, grades, 1)
+                segments.append((adjusted_start, adjusted_end))
+                start = None
+                i = adjusted_end + 1
+    if start is not None:
+        segments.append((reference_adjust_point(start, grades, -1), n - 1))
+    return segments
+
+def reference_adjust_point(index, grades, coeff=1):
+    n = len(grades)
+    while index > 0 and index < n-1 and grades[index + coeff] >= 0:
+        index += coeff
+    return index
+
+def reference_detect_hills(grades, start_distances, end_distances, elevations, uphill_cutoff, downhill_cutoff, min_length, min_height):
+    uphills = reference_find_continuous_segments(grades >= uphill_cutoff, grades)
+    downhills = reference_find_continuous_segments(grades <= -downhill_cutoff, -grades)
+    uphills = [(start, end) for start, end in uphills if end_distances[end] - start_distances[start] >= min_length]
+    downhills = [(start, end) for start, end in downhills if end_distances[end] - start_distances[start] >= min_length]
+    uphills = [(start, end) for start, end in uphills if max(elevations[start:end+1]) - min(elevations[start:end+1]) >= min_height]
+    downhills = [(start, end) for start, end in downhills if max(elevations[start:end+1]) - min(elevations[start:end+1]) >= min_height]
+    return uphills, downhills
+
+def reference_merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length):
+    merged_segments = []
+    remove_next_segment = False
+    for i, (start, end) in enumerate(full_course_segments):
+        if (start, end) in filler_segments:
+            if sum(distances[start:end+1]) < min_segment_length:
+                prev_segment = full_course_segments[i-1] if i > 0 else None
+                next_segment = full_course_segments[i+1] if i < len(full_course_segments) - 1 else None
+                segment_grade = utils.calculate_segment_grade(start, end, elevations, distances)
+                prev_grade = utils.calculate_segment_grade(prev_segment[0], prev_segment[1], elevations, distances) if prev_segment else None
+                next_grade = utils.calculate_segment_grade(next_segment[0], next_segment[1], elevations, distances) if next_segment else None
+                # The original compared against None here when there was no next segment, and raised
+                if prev_segment and (not next_segment or abs(prev_grade - segment_grade) <= abs(next_grade - segment_grade)):
+                    merged_segments[-1] = (prev_segment[0], end)
+                elif next_segment:
+                    merged_segments.append((start, next_segment[1]))
+                    remove_next_segment = True
+                else:
+                    merged_segments.append((start, end))
+            else:
+                merged_segments.append((start, end))
+        elif remove_next_segment:
+            remove_next_segment = False
+        else:
+            merged_segments.append((start, end))
+    return merged_segments
+
+def reference_get_spanning_segments(distances, elevations, uphill_segments, downhill_segments, min_segment_length):
+    full_course_segments = []
+    filler_segments = []
+    current_start = 0
+    for (start, end) in sorted(uphill_segments + downhill_segments, key=lambda x: x[0]):
+        if current_start < start:
+            full_course_segments.append((current_start, start - 1))
+            filler_segments.append((current_start, start - 1))
+        full_course_segments.append((start, end))
+        current_start = end + 1
+    if current_start < len(distances):
+        full_course_segments.append((current_start, len(distances) - 1))
+        filler_segments.append((current_start, len(distances) - 1))
+    return reference_merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length)
+
+def check_hill_detection(course):
+    """
+    hill_detection finds the same hills and spanning segments as the reference loops.
+    """
+    hills = hill_detection.get_course_hills(course)
+    thresholds = hill_detection.HillThresholds()
+    uphills, downhills = reference_detect_hills(hills.smoothed_grades, course.start_distances, course.end_distances, course.elevations,
+        thresholds.min_uphill_grade, thresholds.min_downhill_grade, thresholds.min_hill_distance, thresholds.min_hill_height)
+    segments = reference_get_spanning_segments(course.segment_lengths, course.elevations*utils.Conversions.FEET_TO_MILES.value,
+        uphills, downhills, thresholds.min_segment_length)
+    assert hills.uphills == uphills, f"{course.course_name}: uphills differ"
+    assert hills.downhills == downhills, f"{course.course_name}: downhills differ"
+    assert [tuple(map(int, segment)) for segment in hills.segments] == segments, f"{course.course_name}: spanning segments differ"
+
+def check_continuous_segments(rng, trials=2000):
+    """
+    find_continuous_segments matches the reference on random grades, including runs at both ends.
+    """
+    for _ in range(trials):
+        grades = rng.normal(0, 3, rng.integers(1, 40))
+        hills = grades >= 2
+        assert hill_detection.find_continuous_segments(hills, grades) == reference_find_continuous_segments(hills, grades), \
+            f"find_continuous_segments differs on {grades.tolist()}"
+
+def check_workers(stats, total_paces, min_segment_length):
+    """
+    The DP layers computed by worker processes, whole or in chunks, are bit-identical to the serial ones.
+    """
+    serial = pacing_dp.SuffixDP(stats, min_segment_length, memory_budget=None)
+    serial.extend(total_paces)
+    for workers in (2, 3):
+        for chunk_rows in (None, 37):
+            dp = pacing_dp.SuffixDP(stats, min_segment_length, memory_budget=None, workers=workers)
+            if chunk_rows is not None:
+                dp.memory_budget = dp.estimate_memory(total_paces, chunk_rows)
+            dp.extend(total_paces)
+            assert np.array_equal(serial.loss, dp.loss) and np.array_equal(serial.opt, dp.opt), \
+                f"{type(stats).__name__} with {workers} workers and {chunk_rows} chunk rows differs from serial"
+
+def check_pelt(stats, total_paces, min_segment_length):
+    """
+    solve_pelt finds a plan as good as the DP's for every number of paces.
+    """
+    dp = pacing_dp.SuffixDP(stats, min_segment_length, memory_budget=None)
+    for P in range(1, total_paces + 1):
+        result = pacing_dp.solve_pelt(stats, P, min_segment_length, dp=dp)
+        loss = dp.get_loss(P)
+        assert len(result.breakpoints) == P, f"pelt found {len(result.breakpoints)} paces instead of {P}"
+        assert abs(result.loss - loss) <= 1e-9 * max(loss, 1), f"pelt loss {result.loss} differs from the DP's {loss} with {P} paces"
+
+def check_replan(plan, checkpoints, total_paces):
+    """
+    A replan from each (fraction of the distance, fraction of the time) checkpoint gives the
+    breakpoints and loss of a new suffix DP over the rest of the course, and finishes on time.
+    """
+    replanner = LiveReplanner(plan, total_paces)
+    course = plan.race_course
+    for distance_fraction, time_fraction in checkpoints:
+        replan = replanner.replan(course.total_distance * distance_fraction, plan.target_time * time_fraction, total_paces)
+        start = replan.breakpoints[0]
+        stats = plan.get_stats()
+        suffix_stats = type(stats)(stats.paces[start:], stats.segment_lengths[start:])
+        dp = pacing_dp.SuffixDP(suffix_stats, plan.MIN_SEGMENT_LENGTH, memory_budget=None)
+        assert np.array_equal(dp.get_breakpoints(replan.total_paces) + start, replan.breakpoints), \
+            f"{course.course_name}: replan at {distance_fraction} differs from a new suffix DP"
+        loss = dp.get_loss(replan.total_paces)
+        assert abs(replan.loss - loss) <= 1e-9 * max(loss, 1), f"{course.course_name}: replan loss {replan.loss} differs from {loss}"
+        assert abs(replan.get_finish_time() - plan.target_time) <= 1e-9 * plan.target_time, \
+            f"{course.course_name}: replan finishes at {replan.get_finish_time()} instead of {plan.target_time}"
+
+def main():
+    course_names = ['boston', 'wineglass', 'FH-Fox', 'scurve', 'dodge', 'Freeville-Fly-In']
+    total_paces = 8
+    rng = np.random.default_rng(0)
+
+    check_continuous_segments(rng)
+    print("find_continuous_segments: ok")
+    for name in course_names:
+        for n_segments in [200, 1000]:
+            course = RealRaceCourse(name, f'data/{name}.gpx', N_SEGMENTS=n_segments)
+            context = PlanningContext(course, course.total_distance*8)
+            check_hill_detection(course)
+            check_pelt(context.get_weighted_square_stats(), total_paces, 3)
+            if n_segments == 200:
+                for loss_method in (np.square, np.abs):
+                    check_workers(context.get_interval_stats(loss_method), total_paces, 3)
+            plan = PacingPlanBFSquare(course, context.target_time, total_paces, context)
+            plan.calculate_recommendations()
+            check_replan(plan, [(0, 0), (0.2, 0.19), (0.5, 0.52), (0.9, 0.88)], total_paces)
+            print(f"{name} ({n_segments} segments): ok")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import time
+
+import race_course
+
+def init_parser() -> argparse.ArgumentParser:
+    '''
+    Initializes the command line flag parser for this file.
+
+    Flags:
+
+    [REQUIRED]
+    -o, --output        ==> directory to write the gpx files to
+    -n, --courses       ==> number of courses to generate
+
+    [OPTIONAL]
+    -s, --segments      ==> segments per course
+    -d, --distance      ==> distance of each course in miles
+    --hilliness         ==> scale of the elevation changes (1 is the RandomRaceCourse default)
+    --seed              ==> seed making the generated courses reproducible
+    --batch-size        ==> courses held in memory at once
+    --no-smoothing      ==> skip smoothing of the elevation changes
+    -h                  ==> opens help menu
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", required=True, help="directory to write the gpx files to")
+    parser.add_argument("-n", "--courses", type=int, required=True, help="number of courses to generate")
+    parser.add_argument("-s", "--segments", type=int, default=10000, help="segments per course")
+    parser.add_argument("-d", "--distance", type=float, default=26.2, help="distance of each course in miles")
+    parser.add_argument("--hilliness", type=float, default=1.0, help="scale of the elevation changes")
+    parser.add_argument("--seed", type=int, default=None, help="seed making the generated courses reproducible")
+    parser.add_argument("--batch-size", type=int, default=64, help="courses held in memory at once")
+    parser.add_argument("--no-smoothing", action="store_true", help="skip smoothing of the elevation changes")
+    return parser
+
+def main():
+    parser = init_parser()
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    file_paths = race_course.gen_random_gpx_files(args.output, args.courses, args.segments, args.distance, batch_size=args.batch_size,
+                                                  hilliness=args.hilliness, seed=args.seed, use_smoothing=not args.no_smoothing)
+    print(f"Wrote {len(file_paths)} courses of {args.segments} segments to {args.output} in {time.perf_counter() - start:.1f} s")
+
+if __name__ == '__main__':
+    main()
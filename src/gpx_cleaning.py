@@ -0,0 +1,146 @@
+import numpy as np
+from scipy import ndimage
+
+from utils import calculate_distance, find_runs
+
+DUPLICATE_DISTANCE = 0.1    # Meters, points closer than this to the first point of their group are merged into it
+DUPLICATE_SCAN_CHUNK = 64   # Points, scanned at once for the end of a group of duplicates
+SPIKE_WINDOW = 100          # Meters, window of the median filter at the track's median point spacing
+SPIKE_THRESHOLD = 10        # Meters, elevations further than this from the local median are clamped
+
+class CleaningReport:
+    """
+    What clean_track changed in a track, for logging and for returning to the uploader.
+    """
+    def __init__(self, n_points):
+        self.n_points = n_points
+        self.n_kept = n_points
+        self.n_missing_elevations = 0
+        self.n_duplicates_merged = 0
+        self.n_spikes_clamped = 0
+        self.max_spike = 0.0
+
+    def is_clean(self):
+        return self.n_missing_elevations == 0 and self.n_duplicates_merged == 0 and self.n_spikes_clamped == 0
+
+    def to_dict(self):
+        return {
+            "n_points": self.n_points,
+            "n_kept": self.n_kept,
+            "n_missing_elevations": self.n_missing_elevations,
+            "n_duplicates_merged": self.n_duplicates_merged,
+            "n_spikes_clamped": self.n_spikes_clamped,
+            "max_spike": self.max_spike,
+        }
+
+    def __repr__(self):
+        return (f"Cleaning: kept {self.n_kept} of {self.n_points} points, "
+                f"interpolated {self.n_missing_elevations} missing elevations, "
+                f"merged {self.n_duplicates_merged} duplicate points, "
+                f"clamped {self.n_spikes_clamped} elevation spikes (max {self.max_spike:.1f} m)")
+
+def merge_duplicates(lats, lons, elevations, duplicate_distance=DUPLICATE_DISTANCE):
+    """
+    Merges each group of consecutive points within [duplicate_distance] meters of the group's
+    first point into a single point, at the last position of the group with the mean of its known
+    elevations. GPS jitter while standing still is merged, while slow drift starts a new group
+    every [duplicate_distance]. Returns the merged arrays and the number of points removed.
+    """
+    steps = calculate_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    # A step over twice the distance leaves any group, so only runs of shorter steps are scanned
+    is_far = np.insert(steps > 2 * duplicate_distance, 0, True)
+    is_group_start = is_far.copy()
+    run_starts, run_ends = find_runs(~is_far[1:])
+    for run_start, run_end in zip(run_starts, run_ends + 1):
+        # Points [start, scanned] are in the current group; the rest are scanned a chunk at a time
+        start = scanned = run_start
+        while scanned < run_end:
+            stop = min(scanned + DUPLICATE_SCAN_CHUNK, run_end)
+            displacements = calculate_distance(lats[start], lons[start], lats[scanned + 1:stop + 1], lons[scanned + 1:stop + 1])
+            drifted = np.flatnonzero(displacements > duplicate_distance)
+            if len(drifted) == 0:
+                scanned = stop
+            else:
+                start = scanned = scanned + 1 + int(drifted[0])
+                is_group_start[start] = True
+    starts = np.flatnonzero(is_group_start)
+    if len(starts) == len(lats):
+        return lats, lons, elevations, 0
+
+    ends = np.append(starts[1:], len(lats)) - 1
+    known = np.isfinite(elevations)
+    elevation_sums = np.add.reduceat(np.where(known, elevations, 0), starts)
+    known_counts = np.add.reduceat(known.astype(int), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged_elevations = np.where(known_counts > 0, elevation_sums / known_counts, np.nan)
+    return lats[ends], lons[ends], merged_elevations, len(lats) - len(starts)
+
+def fill_missing_elevations(distances, elevations):
+    """
+    Linearly interpolates missing (nan) elevations by distance along the track. Missing elevations
+    before the first or after the last known one take the nearest known value.
+    """
+    missing = ~np.isfinite(elevations)
+    if not missing.any():
+        return elevations
+    if missing.all():
+        raise ValueError("The track has no elevation data")
+    elevations = elevations.copy()
+    elevations[missing] = np.interp(distances[missing], distances[~missing], elevations[~missing])
+    return elevations
+
+def get_spike_window(segment_lengths, window_distance=SPIKE_WINDOW):
+    """
+    Odd number of points spanning about [window_distance] meters at the median spacing of the
+    track, 0 if that is under 3 points: a sparse track cannot tell spikes from real summits.
+    """
+    spacing = np.median(segment_lengths)
+    window = int(window_distance / spacing) if spacing > 0 else 0
+    window -= window % 2 == 0
+    return window if window >= 3 else 0
+
+def clamp_spikes(elevations, window=5, threshold=SPIKE_THRESHOLD):
+    """
+    Replaces elevations further than [threshold] from the median of their [window] points with
+    that median. Returns the repaired elevations, the mask of clamped points and the largest spike.
+    """
+    medians = ndimage.median_filter(elevations, size=window, mode='nearest')
+    deviations = np.abs(elevations - medians)
+    spikes = deviations > threshold
+    max_spike = float(deviations[spikes].max()) if spikes.any() else 0.0
+    return np.where(spikes, medians, elevations), spikes, max_spike
+
+def clean_track(lats, lons, elevations, duplicate_distance=DUPLICATE_DISTANCE, spike_window=SPIKE_WINDOW, spike_threshold=SPIKE_THRESHOLD):
+    """
+    Repairs a parsed track (elevations in meters, nan where missing) instead of rejecting it:
+    duplicate points are merged, missing elevations are interpolated by distance and elevation
+    spikes are clamped with a median filter over about [spike_window] meters (see
+    get_spike_window; a [spike_threshold] of None turns it off). Each stage is a vectorized pass
+    over the points.
+
+    Returns the cleaned lats, lons and elevations, the segment lengths between them and a
+    CleaningReport.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+    report = CleaningReport(len(lats))
+    if len(lats) < 2:
+        raise ValueError(f"The track needs at least 2 points, found {len(lats)}")
+
+    report.n_missing_elevations = int(np.sum(~np.isfinite(elevations)))
+
+    lats, lons, elevations, report.n_duplicates_merged = merge_duplicates(lats, lons, elevations, duplicate_distance)
+    if len(lats) < 2:
+        raise ValueError("The track has no distance after merging duplicate points")
+    segment_lengths = calculate_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    distances = np.insert(np.cumsum(segment_lengths), 0, 0)
+
+    elevations = fill_missing_elevations(distances, elevations)
+    window = get_spike_window(segment_lengths, spike_window)
+    if spike_threshold is not None and window > 0:
+        elevations, spikes, report.max_spike = clamp_spikes(elevations, window, spike_threshold)
+        report.n_spikes_clamped = int(spikes.sum())
+
+    report.n_kept = len(lats)
+    return lats, lons, elevations, segment_lengths, report
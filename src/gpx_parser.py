@@ -2,44 +2,92 @@ import gpxpy
 import gpxpy.gpx
 import math
 import sys
+from array import array
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+import streaming
+from utils import calculate_distance
+
+class SegmentTable:
+    """
+    The segments between consecutive points of a track, stored as contiguous arrays (distances in
+    meters, slope angles in degrees, grades in percent) with every derived field computed in one
+    vectorized pass. Missing elevations are nan. Indexing or iterating yields lightweight Segment
+    row views.
+    """
+    __slots__ = ('start_lats', 'start_lons', 'end_lats', 'end_lons', 'start_eles', 'end_eles',
+                 'distances', 'elevation_changes', 'slope_angles', 'grades')
+
+    def __init__(self, start_lats, start_lons, end_lats, end_lons, start_eles, end_eles):
+        self.start_lats = np.asarray(start_lats, dtype=float)
+        self.start_lons = np.asarray(start_lons, dtype=float)
+        self.end_lats = np.asarray(end_lats, dtype=float)
+        self.end_lons = np.asarray(end_lons, dtype=float)
+        self.start_eles = np.asarray(start_eles, dtype=float)
+        self.end_eles = np.asarray(end_eles, dtype=float)
+
+        self.distances = calculate_distance(self.start_lats, self.start_lons, self.end_lats, self.end_lons)
+        self.elevation_changes = self.end_eles - self.start_eles
+        # Elevation changes larger than the distance (bad data) are treated as vertical
+        horizontal_distances = np.sqrt(np.maximum(self.distances**2 - self.elevation_changes**2, 0))
+        has_distance = self.distances > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.slope_angles = np.where(has_distance, np.degrees(np.arctan2(self.elevation_changes, horizontal_distances)), np.nan)
+            self.grades = np.where(has_distance, self.elevation_changes / self.distances * 100, 0.0)
+
+    @classmethod
+    def from_points(cls, lats, lons, elevations, segment_starts=None):
+        """
+        Builds the table of segments between consecutive points. [segment_starts] optionally lists
+        the indices of points starting a new gpx track segment, which are not joined to the point
+        before them.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        elevations = np.asarray(elevations, dtype=float)
+        ends = np.arange(1, len(lats))
+        if segment_starts is not None:
+            ends = np.setdiff1d(ends, segment_starts)
+        starts = ends - 1
+        return cls(lats[starts], lons[starts], lats[ends], lons[ends], elevations[starts], elevations[ends])
+
+    def __len__(self):
+        return len(self.distances)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"segment index {index} out of range")
+        return Segment(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Segment(self, index)
 
 class Segment:
-    def __init__(self, start_lat, start_lon, end_lat, end_lon, start_ele, end_ele):
-        self.start_lat = start_lat
-        self.start_lon = start_lon
-        self.end_lat = end_lat
-        self.end_lon = end_lon
-        self.start_ele = start_ele
-        self.end_ele = end_ele
-        self.distance = self.calculate_distance()
-        self.elevation_change = self.end_ele - self.start_ele if self.start_ele and self.end_ele else None
-        self.slope_angle = self.calculate_slope_angle()
-        self.grade = self.calculate_grade()
-
-    def calculate_distance(self):
-        radius = 6371
-        lat1, lon1, lat2, lon2 = map(math.radians, [self.start_lat, self.start_lon, self.end_lat, self.end_lon])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        distance = radius * c * 1000
-        return distance
-
-    def calculate_slope_angle(self):
-        if self.distance > 0:
-            elevation_change = self.elevation_change
-            try:
-                horizontal_distance = math.sqrt(self.distance**2 - elevation_change**2) if elevation_change else self.distance
-            except:
-                horizontal_distance = 0
-            return math.atan2(elevation_change, horizontal_distance) * (180 / math.pi)
-        return None
-    
-    def calculate_grade(self):
-        if self.distance == 0:
-            return 0
-        return self.elevation_change / self.distance * 100
+    """
+    Read-only view of one row of a SegmentTable.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    start_lat = property(lambda self: self.table.start_lats[self.index].item())
+    start_lon = property(lambda self: self.table.start_lons[self.index].item())
+    end_lat = property(lambda self: self.table.end_lats[self.index].item())
+    end_lon = property(lambda self: self.table.end_lons[self.index].item())
+    start_ele = property(lambda self: self.table.start_eles[self.index].item())
+    end_ele = property(lambda self: self.table.end_eles[self.index].item())
+    distance = property(lambda self: self.table.distances[self.index].item())
+    elevation_change = property(lambda self: self.table.elevation_changes[self.index].item())
+    slope_angle = property(lambda self: self.table.slope_angles[self.index].item())
+    grade = property(lambda self: self.table.grades[self.index].item())
 
     def __repr__(self):
         return f"Segment(Start: ({self.start_lat}, {self.start_lon}), End: ({self.end_lat}, {self.end_lon}), " \
@@ -58,34 +106,77 @@ def parse_gpx(file_path):
                 for segment in track.segments:
                     for i in range(len(segment.points)):
                         point = segment.points[i]
-                        if point.latitude is None or point.longitude is None or point.elevation is None:
+                        if point.latitude is None or point.longitude is None:
                             raise ValueError(f"some of the trackpoint info is missing: {point}")
                         
                         lats.append(point.latitude)
                         lons.append(point.longitude)
-                        elevations.append(point.elevation)
+                        # Missing elevations are filled in by gpx_cleaning.clean_track
+                        elevations.append(math.nan if point.elevation is None else point.elevation)
 
         return lats, lons, elevations
 
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" creator="perfect-pace" xmlns="http://www.topografix.com/GPX/1/1">\n'
+)
+
+def gen_gpx(target, lats, lons, elevations, name='', chunk_size=4096):
+    """
+    Writes a single track gpx file (elevations in meters) to a path or file-like object, formatting
+    [chunk_size] track points at a time.
+    """
+    with streaming.open_output(target) as f:
+        f.write(GPX_HEADER)
+        f.write(f'  <trk>\n    <name>{escape(name)}</name>\n    <trkseg>\n')
+        for start in range(0, len(lats), chunk_size):
+            end = start + chunk_size
+            f.write(''.join(
+                f'      <trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.2f}</ele></trkpt>\n'
+                for lat, lon, ele in zip(lats[start:end].tolist(), lons[start:end].tolist(), elevations[start:end].tolist())
+            ))
+        f.write('    </trkseg>\n  </trk>\n</gpx>\n')
+
+def read_track_points(file_path):
+    """
+    Streams the track points of a gpx file into arrays without building a gpxpy document.
+    Returns the lats, lons and elevations (nan where missing) and the indices of the points
+    starting each track segment.
+    """
+    lats = array('d')
+    lons = array('d')
+    elevations = array('d')
+    segment_starts = array('q')
+    elevation = math.nan
+    track_segment = None
+    for event, element in ElementTree.iterparse(file_path, events=('start', 'end')):
+        tag = element.tag.rpartition('}')[2]
+        if event == 'start':
+            if tag == 'trkseg':
+                segment_starts.append(len(lats))
+                track_segment = element
+            elif tag == 'trkpt':
+                elevation = math.nan
+            continue
+
+        if tag == 'ele' and element.text:
+            elevation = float(element.text)
+        elif tag == 'trkpt':
+            lat, lon = element.get('lat'), element.get('lon')
+            if lat is None or lon is None:
+                raise ValueError(f"some of the trackpoint info is missing: {ElementTree.tostring(element, encoding='unicode')}")
+            lats.append(float(lat))
+            lons.append(float(lon))
+            elevations.append(elevation)
+            # Drop the parsed points so the document is never held in memory
+            if track_segment is not None:
+                track_segment.clear()
+
+    return np.frombuffer(lats), np.frombuffer(lons), np.frombuffer(elevations), np.frombuffer(segment_starts, dtype=np.int64)
+
 def parse_gpx_DEPRECATED(file_path):
-    with open(file_path, 'r') as gpx_file:
-        gpx = gpxpy.parse(gpx_file)
-        segments = []
-        for track in gpx.tracks:
-            for segment in track.segments:
-                for i in range(len(segment.points) - 1):
-                    start_point = segment.points[i]
-                    end_point = segment.points[i + 1]
-                    seg = Segment(
-                        start_lat=start_point.latitude,
-                        start_lon=start_point.longitude,
-                        end_lat=end_point.latitude,
-                        end_lon=end_point.longitude,
-                        start_ele=start_point.elevation,
-                        end_ele=end_point.elevation
-                    )
-                    segments.append(seg)
-        return segments
+    lats, lons, elevations, segment_starts = read_track_points(file_path)
+    return SegmentTable.from_points(lats, lons, elevations, segment_starts)
 
 def main():
     if len(sys.argv) != 2:
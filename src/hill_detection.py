@@ -0,0 +1,245 @@
+import weakref
+
+import numpy as np
+
+import utils
+import smoothing
+
+MIN_HILL_DISTANCE = 350*utils.Conversions.METERS_TO_MILES.value # 350 Meters in Miles
+MIN_HILL_HEIGHT = 30    # Feet
+MIN_UPHILL_GRADE = 2    # Grade (smoothed)
+MIN_DOWNHILL_GRADE = 3  # Grade (smoothed)
+MIN_SEGMENT_LENGTH = .25    # Miles
+SMOOTHING_SIGMA = 3     # Segments
+
+class HillThresholds:
+    """
+    Parameters of the hill detection. Instances are hashable so they can key the hill cache.
+    """
+    __slots__ = ('min_uphill_grade', 'min_downhill_grade', 'min_hill_distance', 'min_hill_height', 'min_segment_length', 'smoothing_sigma')
+
+    def __init__(self, min_uphill_grade=MIN_UPHILL_GRADE, min_downhill_grade=MIN_DOWNHILL_GRADE, min_hill_distance=MIN_HILL_DISTANCE,
+                 min_hill_height=MIN_HILL_HEIGHT, min_segment_length=MIN_SEGMENT_LENGTH, smoothing_sigma=SMOOTHING_SIGMA):
+        self.min_uphill_grade = min_uphill_grade
+        self.min_downhill_grade = min_downhill_grade
+        self.min_hill_distance = min_hill_distance
+        self.min_hill_height = min_hill_height
+        self.min_segment_length = min_segment_length
+        self.smoothing_sigma = smoothing_sigma
+
+    def _key(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, HillThresholds) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return 'HillThresholds(' + ', '.join(f'{name}={getattr(self, name)}' for name in self.__slots__) + ')'
+
+class CourseHills:
+    """
+    Hills detected on one view of a course: the smoothed grades they were detected on, the
+    (start, end) segment ranges of the uphills and downhills, and the spanning segments that
+    partition the whole course into hills and merged filler segments.
+    """
+    def __init__(self, smoothed_grades, uphills, downhills, segments):
+        self.smoothed_grades = smoothed_grades
+        self.uphills = uphills
+        self.downhills = downhills
+        self.segments = segments
+
+# race course -> (grades the entry was computed from, {thresholds: CourseHills})
+_cache = weakref.WeakKeyDictionary()
+
+def get_smoothed_grades(grades, sigma=SMOOTHING_SIGMA):
+    """
+    Returns a gaussian smoothed copy of [grades]; the course's own grades are left untouched.
+    """
+    smoothed = smoothing.gaussian(grades, sigma)
+    smoothed.flags.writeable = False
+    return smoothed
+
+def get_course_hills(race_course, thresholds=None):
+    """
+    Returns the CourseHills of the current view of [race_course]. Results are cached per course and
+    thresholds, so every plan run on the same course shares a single detection. Changing the
+    course's view (and with it its grades array) invalidates the cache.
+    """
+    thresholds = HillThresholds() if thresholds is None else thresholds
+    grades = race_course.grades
+    cached_grades, entries = _cache.get(race_course, (None, None))
+    if cached_grades is not grades:
+        entries = {}
+        _cache[race_course] = (grades, entries)
+    if thresholds not in entries:
+        entries[thresholds] = _detect_course_hills(race_course, thresholds)
+    return entries[thresholds]
+
+def clear_cache(race_course=None):
+    if race_course is None:
+        _cache.clear()
+    else:
+        _cache.pop(race_course, None)
+
+def _detect_course_hills(race_course, thresholds):
+    smoothed_grades = get_smoothed_grades(race_course.grades, thresholds.smoothing_sigma)
+    elevations = race_course.elevations
+    distances = race_course.segment_lengths
+
+    uphills, downhills = detect_hills(smoothed_grades, race_course.start_distances, race_course.end_distances, elevations,
+        thresholds.min_uphill_grade, thresholds.min_downhill_grade, thresholds.min_hill_distance, thresholds.min_hill_height)
+
+    segments = get_spanning_segments(distances, elevations*utils.Conversions.FEET_TO_MILES.value, uphills, downhills, thresholds.min_segment_length)
+    return CourseHills(smoothed_grades, uphills, downhills, segments)
+
+def detect_hills(grades, start_distances, end_distances, elevations, uphill_cutoff, downhill_cutoff, min_length, min_height):    
+    significant_uphills = (grades >= uphill_cutoff)
+    significant_downhills = (grades <= -downhill_cutoff)
+
+    uphill_segments = find_continuous_segments(significant_uphills, grades)
+    downhill_segments = find_continuous_segments(significant_downhills, -grades)
+
+    filtered_uphill_segments = filter_short_segments(uphill_segments, min_length, start_distances, end_distances)
+    filtered_downhill_segments = filter_short_segments(downhill_segments, min_length, start_distances, end_distances)
+
+    # One range index answers the height of every candidate hill in O(1)
+    elevation_range = utils.RangeMinMax(elevations)
+    filtered_uphill_segments = filter_short_hills(filtered_uphill_segments, min_height, elevations, elevation_range)
+    filtered_downhill_segments = filter_short_hills(filtered_downhill_segments, min_height, elevations, elevation_range)
+
+    return filtered_uphill_segments, filtered_downhill_segments
+
+def filter_short_segments(segments, min_length, start_distances, end_distances):
+    if not segments:
+        return []
+    starts, ends = np.array(segments).T
+    keep = np.asarray(end_distances)[ends] - np.asarray(start_distances)[starts] >= min_length
+    return [segment for segment, is_kept in zip(segments, keep) if is_kept]
+
+def filter_short_hills(segments, min_height, elevations, elevation_range=None):
+    if not segments:
+        return []
+    if elevation_range is None:
+        elevation_range = utils.RangeMinMax(elevations)
+    starts, ends = np.array(segments).T
+    heights = elevation_range.max(starts, ends + 1) - elevation_range.min(starts, ends + 1)
+    return [segment for segment, is_kept in zip(segments, heights >= min_height) if is_kept]
+
+def find_continuous_segments(hills, grades):
+    """
+    Returns the (start, end) of every run of significant segments, with each end extended
+    forward and each start extended backward over non-negative [grades]. Runs swallowed by the
+    extension of a previous run are skipped, and a partially swallowed run starts after it.
+    """
+    n = len(hills)
+    run_starts, run_ends = utils.find_runs(hills)
+    if len(run_starts) == 0:
+        return []
+
+    # For each index, the closest negative grade at or before / at or after it
+    indices = np.arange(n)
+    is_negative = np.asarray(grades) < 0
+    prev_negative = np.maximum.accumulate(np.where(is_negative, indices, -1))
+    next_negative = np.minimum.accumulate(np.where(is_negative, indices, n)[::-1])[::-1]
+
+    segments = []
+    resume = 0
+    for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+        if end < resume:
+            continue
+        start = max(start, resume)
+        # Each end extends outwards over non-negative grades, except an end at the first or last index
+        adjusted_start = start if start == 0 or start >= n - 1 else int(prev_negative[start - 1]) + 1
+        if end == n - 1:
+            adjusted_end = n - 1
+        elif end == 0:
+            adjusted_end = 0
+        else:
+            adjusted_end = int(next_negative[end + 1]) - 1
+        segments.append((adjusted_start, adjusted_end))
+        resume = adjusted_end + 1
+
+    return segments
+
+def get_spanning_segments(distances, elevations, uphill_segments, downhill_segments, min_segment_length):
+    all_segments = sorted(uphill_segments + downhill_segments, key=lambda x: x[0])
+    full_course_segments = []
+    filler_segments = []
+    total_segments = len(distances)
+
+    current_start = 0
+    for (start, end) in all_segments:
+        if current_start < start:
+            full_course_segments.append((current_start, start - 1))
+            filler_segments.append((current_start, start - 1))
+        full_course_segments.append((start, end))        
+        current_start = end + 1
+    if current_start < total_segments:
+        full_course_segments.append((current_start, total_segments - 1))
+        filler_segments.append((current_start, total_segments - 1))
+
+    return merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length)
+
+# Row type of the segment table used when merging filler segments into their neighbours
+SEGMENT_TABLE_DTYPE = np.dtype([
+    ('start', np.int64),
+    ('end', np.int64),
+    ('is_filler', bool),
+    ('distance', float),
+    ('grade', float),
+])
+
+def build_segment_table(segments, filler_segments, distances, elevations):
+    """
+    Builds a structured array with the start, end, filler flag, total distance and grade (as in
+    calculate_segment_grade) of every segment, using prefix sums instead of per-segment slices.
+    """
+    table = np.zeros(len(segments), dtype=SEGMENT_TABLE_DTYPE)
+    if len(segments) == 0:
+        return table
+    filler_set = set(filler_segments)
+    starts, ends = np.array(segments, dtype=np.int64).T
+    distance_sums = np.insert(np.cumsum(distances), 0, 0)
+    elevation_sums = np.insert(np.cumsum(elevations), 0, 0)
+
+    table['start'] = starts
+    table['end'] = ends
+    table['is_filler'] = [segment in filler_set for segment in segments]
+    table['distance'] = distance_sums[ends + 1] - distance_sums[starts]
+    table['grade'] = utils.calculate_grade_scalar(elevation_sums[ends + 1] - elevation_sums[starts], table['distance'])
+    return table
+
+def merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length):
+    """
+    Merges every filler segment shorter than [min_segment_length] into the adjacent segment with
+    the closer grade, in a single pass over the segment table.
+    """
+    table = build_segment_table(full_course_segments, filler_segments, distances, elevations).tolist()
+    n_segments = len(table)
+    merged_segments = []
+    remove_next_segment = False
+    for i, (start, end, is_filler, distance, grade) in enumerate(table):
+        if not is_filler:
+            if remove_next_segment:
+                remove_next_segment = False
+            else:
+                merged_segments.append((start, end))
+            continue
+        if distance >= min_segment_length:
+            merged_segments.append((start, end))
+            continue
+
+        prev_segment = table[i-1] if i > 0 else None
+        next_segment = table[i+1] if i < n_segments - 1 else None
+        # Merge with the more similar adjacent segment
+        if prev_segment and (not next_segment or abs(prev_segment[4] - grade) <= abs(next_segment[4] - grade)):
+            merged_segments[-1] = (prev_segment[0], end)
+        elif next_segment:
+            merged_segments.append((start, next_segment[1])) # Assume next segment is not in filler
+            remove_next_segment = True
+        else:
+            merged_segments.append((start, end))
+    return merged_segments
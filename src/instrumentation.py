@@ -0,0 +1,186 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+# Instrumentation is off unless enabled explicitly or through the environment:
+#   PERFECT_PACE_PROFILE=1       ==> wall and cpu time per span
+#   PERFECT_PACE_PROFILE=memory  ==> also peak traced memory per span (slower)
+PROFILE_ENV_VAR = 'PERFECT_PACE_PROFILE'
+
+_enabled = False
+_trace_memory = False
+_state = threading.local()
+
+def _get_state():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+        _state.records = []
+    return _state
+
+class Span:
+    """
+    Context manager that records the wall time, cpu time and (if tracing memory) the peak
+    traced memory of the code it wraps. Nested spans are reported with their full path.
+    """
+    __slots__ = ('name', 'path', 'start_wall', 'start_cpu', 'start_memory', 'child_peak')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        state = _get_state()
+        parent = state.stack[-1] if state.stack else None
+        self.path = f'{parent.path}.{self.name}' if parent else self.name
+        self.child_peak = 0
+        if _trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is about to be reset, so hand the parent the peak it has seen so far
+            if parent:
+                parent.child_peak = max(parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+        state.stack.append(self)
+        self.start_cpu = time.thread_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.thread_time() - self.start_cpu
+        state = _get_state()
+        state.stack.pop()
+        parent = state.stack[-1] if state.stack else None
+
+        record = {
+            "name": self.path,
+            "wall_ms": wall * 1000,
+            "cpu_ms": cpu * 1000,
+        }
+        if _trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            record["peak_kb"] = max(peak - self.start_memory, 0) / 1024
+            if parent:
+                parent.child_peak = max(parent.child_peak, peak)
+        state.records.append(record)
+        return False
+
+class _NullSpan:
+    """Shared no-op span returned while instrumentation is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    """
+    Returns a context manager timing the enclosed block under [name].
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name)
+
+def timed(name=None):
+    """
+    Decorator version of span. Defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def enable(trace_memory=False):
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _trace_memory = False
+
+def is_enabled():
+    return _enabled
+
+def is_tracing_memory():
+    return _enabled and _trace_memory
+
+def enable_from_env():
+    """
+    Enables instrumentation according to the PERFECT_PACE_PROFILE environment variable.
+    """
+    value = os.environ.get(PROFILE_ENV_VAR, '').strip().lower()
+    if value in ('', '0', 'false', 'off'):
+        return False
+    enable(trace_memory=(value == 'memory'))
+    return True
+
+def get_spans():
+    """
+    Returns the spans finished on the current thread, in completion order.
+    """
+    return list(_get_state().records)
+
+def reset():
+    state = _get_state()
+    state.stack = []
+    state.records = []
+
+def add_spans(records, prefix=None):
+    """
+    Adds spans recorded elsewhere (e.g. in a subprocess) to the current thread's records.
+    """
+    state = _get_state()
+    for record in records:
+        record = dict(record)
+        if prefix:
+            record["name"] = f'{prefix}.{record["name"]}'
+        state.records.append(record)
+
+def save_spans(file_path):
+    with open(file_path, 'w') as f:
+        json.dump(get_spans(), f)
+
+def load_spans(file_path):
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+def log_spans(logger, records=None, **fields):
+    """
+    Logs one structured (json) line per span.
+    """
+    for record in (get_spans() if records is None else records):
+        logger.info(json.dumps({"event": "span", **fields, **record}))
+
+def server_timing_header(records=None):
+    """
+    Formats spans as the value of a Server-Timing response header.
+    """
+    entries = []
+    for record in (get_spans() if records is None else records):
+        metric = re.sub(r"[^A-Za-z0-9_.\-]", "_", record["name"])
+        desc = f'cpu={record["cpu_ms"]:.1f}ms'
+        if "peak_kb" in record:
+            desc += f' peak={record["peak_kb"]:.0f}KiB'
+        entries.append(f'{metric};dur={record["wall_ms"]:.1f};desc="{desc}"')
+    return ', '.join(entries)
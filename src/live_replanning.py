@@ -0,0 +1,109 @@
+import time
+import numpy as np
+import pacing_dp
+
+class Replan:
+    """
+    Plan for the rest of a race from a checkpoint: the first segment of each pace segment, its
+    pace (min/mile) and the distance still to run at it. The first pace segment starts at the
+    checkpoint, part way through its first segment.
+    """
+    def __init__(self, distance, elapsed_time, breakpoints, paces, distances, loss, seconds):
+        self.distance = distance
+        self.elapsed_time = elapsed_time
+        self.breakpoints = breakpoints
+        self.paces = paces
+        self.distances = distances
+        self.loss = loss
+        self.seconds = seconds
+
+    @property
+    def total_paces(self):
+        return len(self.paces)
+
+    def get_finish_time(self):
+        return self.elapsed_time + float(np.dot(self.paces, self.distances))
+
+    def __repr__(self):
+        return (f"Replan from mile {self.distance:.2f} at {self.elapsed_time:.2f} min: {self.total_paces} paces, "
+                f"finish {self.get_finish_time():.2f} min, loss {self.loss:.6g} ({self.seconds * 1000:.2f} ms)")
+
+class LiveReplanner:
+    """
+    Re-plans the rest of a race from a checkpoint (distance covered, elapsed time) with a given
+    number of remaining paces, reusing the suffix DP of a PacingPlanBF.
+
+    The losses of the DP only measure how far the optimal paces are from the mean of their pace
+    segment, so they do not change when every optimal pace is shifted by the same amount. Finishing
+    the rest of the course in the remaining time shifts the optimal paces of the remaining segments
+    by a constant, so the DP layers of the plan, which hold the best plan of every suffix for every
+    number of paces, already answer any checkpoint: a replan backtracks the suffix from the
+    checkpoint's segment and shifts the means of its pace segments. The layers up to max_paces are
+    computed once, after which a replan takes O(paces + log n).
+
+    The replanner needs a DP over every segment, so a compressed plan gets a DP of its own.
+    """
+    def __init__(self, plan, max_paces=None):
+        self.plan = plan
+        self.context = plan.context
+        self.race_course = plan.race_course
+        self.target_time = plan.target_time
+        self.max_paces = plan.total_paces if max_paces is None else max_paces
+        if self.max_paces < 1:
+            raise ValueError(f"max_paces must be at least 1, got {self.max_paces}")
+
+        self.dp = plan.get_dp()
+        if len(self.dp.positions) <= self.dp.n_segments:
+            stats = plan.get_stats()
+            self.dp = pacing_dp.SuffixDP(stats, plan.MIN_SEGMENT_LENGTH, memory_budget=plan.memory_budget, workers=plan.workers)
+        self.stats = self.dp.stats
+        self.dp.extend(self.max_paces)
+
+    def get_segment(self, distance):
+        """
+        Index of the segment the runner is on after [distance] miles, in [0, total_distance).
+        """
+        if not 0 <= distance < self.race_course.total_distance:
+            raise ValueError(f"The checkpoint distance must be in [0, {self.race_course.total_distance}) miles, got {distance}")
+        index = np.searchsorted(self.race_course.end_distances, distance, side='right')
+        return int(min(index, self.dp.n_segments - 1))
+
+    def get_max_paces(self, start):
+        """
+        Most paces (up to max_paces) the segments from [start] can be split into.
+        """
+        losses = self.dp.loss[:self.max_paces, self.dp.get_position(start)]
+        return int(np.flatnonzero(np.isfinite(losses))[-1]) + 1
+
+    def replan(self, distance, elapsed_time, total_paces, target_time=None):
+        """
+        Best plan with at most [total_paces] paces for the rest of the course, after [distance]
+        miles in [elapsed_time] minutes, finishing in [target_time] (default: the plan's). Fewer
+        paces are used if the rest of the course is too short for them, and at most max_paces.
+        A checkpoint at the finish gets an empty plan.
+        """
+        start_time = time.perf_counter()
+        if target_time is None:
+            target_time = self.target_time
+        if total_paces < 1:
+            raise ValueError(f"total_paces must be at least 1, got {total_paces}")
+        if not 0 <= distance <= self.race_course.total_distance:
+            raise ValueError(f"The checkpoint distance must be in [0, {self.race_course.total_distance}] miles, got {distance}")
+        if distance == self.race_course.total_distance:
+            return Replan(distance, elapsed_time, np.array([], dtype=int), np.array([]), np.array([]), 0.0, time.perf_counter() - start_time)
+        remaining_time = target_time - elapsed_time
+        if remaining_time <= 0:
+            raise ValueError(f"No time is left to finish in {target_time} minutes after {elapsed_time} minutes")
+
+        start = self.get_segment(distance)
+        total_paces = min(total_paces, self.get_max_paces(start))
+        breakpoints = self.dp.get_breakpoints(total_paces, start)
+        ends = np.append(breakpoints[1:], self.dp.n_segments)
+
+        # Mean optimal pace of each pace segment, shifted so the rest finishes in the remaining time
+        means = self.stats.get_weighted_paces(breakpoints, ends)
+        distances = self.stats.length_sums[ends] - self.stats.length_sums[breakpoints]
+        distances[0] -= distance - self.race_course.start_distances[start]
+        shift = (remaining_time - np.dot(means, distances)) / np.sum(distances)
+        loss = float(self.dp.loss[total_paces - 1, self.dp.get_position(start)])
+        return Replan(distance, elapsed_time, breakpoints, means + shift, distances, loss, time.perf_counter() - start_time)
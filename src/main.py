@@ -1,12 +1,19 @@
 import argparse
 import os
 import race_course
-from pacing_plan import PacingPlan, PacingPlanBFAbsolute, PacingPlanBFSquare, PacingPlanAvgPacePerMile, PacingPlanAvgPace, PacingPlanSegmenting
+from planning_context import PlanningContext
+from pacing_plan import PacingPlan, PacingPlanBFAbsolute, PacingPlanBFSquare, PacingPlanMultiresAbsolute, PacingPlanMultiresSquare, PacingPlanGreedyAbsolute, PacingPlanGreedySquare, PacingPlanTotalVariation, PacingPlanPELT, PacingPlanAvgPacePerMile, PacingPlanAvgPace, PacingPlanSegmenting
 from pacing_plan_lp import PacingPlanLPAbsolute, PacingPlanLPSquare
 
 PACING_PLAN_METHODS = {
     "BFA": PacingPlanBFAbsolute,
     "BFS": PacingPlanBFSquare,
+    "MRA": PacingPlanMultiresAbsolute,
+    "MRS": PacingPlanMultiresSquare,
+    "GSA": PacingPlanGreedyAbsolute,
+    "GSS": PacingPlanGreedySquare,
+    "TV": PacingPlanTotalVariation,
+    "PELT": PacingPlanPELT,
     "LPA": PacingPlanLPAbsolute,
     "LPS": PacingPlanLPSquare,
     "APPM": PacingPlanAvgPacePerMile,
@@ -30,8 +37,16 @@ def init_parser() -> argparse.ArgumentParser:
     -l, --loop      ==> if the course contains a loop
     -s, --smoothen  ==> if the course should be smoothened
     --random        ==> if a randomly generated course should be used
+    --seed          ==> seed of the randomly generated course
     -v, --verbose   ==> if the pacing plan should be generated in verbose mode
     -r, --repeat    ==> if the user wants to repeat generating pacing plans
+    --memory-budget ==> megabytes the pacing plan may use before it switches to slower, memory bounded computation
+    --workers       ==> processes computing the DP of the BF pacing plans
+    --compress      ==> min/mile, the BF pacing plans break only between runs of paces within it
+    --deadline      ==> milliseconds, return the best pacing plan found by then (BF and LP plans)
+    --dem           ==> directory of SRTM .hgt tiles replacing the GPX elevations
+    --elevation-tolerance ==> meters, variable length segments following the elevation profile within it
+    --track-tolerance ==> meters, simplify the raw GPX points within it before building the course
     -h              ==> opens help menu
     '''
     
@@ -43,10 +58,18 @@ def init_parser() -> argparse.ArgumentParser:
                         help="pacing plan method to use. Options are: " + ", ".join(PACING_PLAN_METHODS.keys()), required=True)
 
     parser.add_argument("-l", "--loop", action="store_true", help="include this flag if the course contains a loop")
-    parser.add_argument("-s", "--smoothen", help="include if the course should be smoothened. running_avg, loess")
+    parser.add_argument("-s", "--smoothen", help="include if the course should be smoothened. running_avg, gaussian, loess")
     parser.add_argument("--random", action="store_true", help="include this flag if you want a random course")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random course, for reproducible runs")
     parser.add_argument("-v", "--verbose", action="store_true", help="Include this flag if you would like to generate the pacing plan in verbose mode")
     parser.add_argument("-r", "--repeat", action="store_true", help="If you would like to repeat generating pacing plans")
+    parser.add_argument("--memory-budget", type=float, default=None, help="megabytes the pacing plan may use before it switches to slower, memory bounded computation")
+    parser.add_argument("--workers", type=int, default=1, help="processes computing the DP of the BF pacing plans")
+    parser.add_argument("--compress", type=float, default=None, help="min/mile, the BF pacing plans break only between runs of paces within it")
+    parser.add_argument("--deadline", type=float, default=None, help="milliseconds, return the best pacing plan found by then (BF and LP plans)")
+    parser.add_argument("--dem", default=None, help="directory of SRTM .hgt tiles whose elevations replace the GPX elevations")
+    parser.add_argument("--elevation-tolerance", type=float, default=None, help="meters, use variable length segments that follow the elevation profile within it")
+    parser.add_argument("--track-tolerance", type=float, default=None, help="meters, simplify the raw GPX points within it before building the course")
 
     return parser
 
@@ -73,9 +96,6 @@ def main():
     parser = init_parser()
     args = parser.parse_args()
 
-    if args.random:
-        raise RuntimeError("unimplemented")
-
     file_path = args.file
     use_loop = args.loop
     verbose = args.verbose
@@ -86,16 +106,21 @@ def main():
             print("\nGenerating Random Course\n")
         n_segments = int(input('n_segments: \t\t\t'))
         distance = float(input('distance (miles): \t\t'))
-        course_name = f'random {distance:.1f}'
-        course = race_course.RandomRaceCourse(course_name, n_segments, distance)
+        course_name = f'random {distance:.1f}' if args.seed is None else f'random {distance:.1f} seed {args.seed}'
+        course = race_course.RandomRaceCourse(course_name, n_segments, distance, rng=args.seed)
         file_path = 'results/random/'
 
     else:
         course_name = os.path.basename(file_path).split('.')[0]
-        course = race_course.RealRaceCourse(course_name, file_path)
+        course = race_course.RealRaceCourse(course_name, file_path, elevation_tolerance=args.elevation_tolerance,
+                                            track_tolerance=args.track_tolerance, dem_directory=args.dem)
+        if verbose and course.dem_report is not None:
+            print(course.dem_report)
+        if verbose and course.simplification_report is not None:
+            print(course.simplification_report)
 
     if args.smoothen:
-        course.smoothen_segments(args.smoothen)
+        course.grades = course.smoothen_segments(args.smoothen)
 
     if verbose:
         print(f'\n{str(course)}')
@@ -120,7 +145,13 @@ def main():
     current_m_paces = args.paces
     method = args.method
     pacing_plan_class = PACING_PLAN_METHODS[method]
-    plan: PacingPlan = pacing_plan_class(course, target_time, current_m_paces)
+    # Shared by every plan below, so switching methods does not redo the course precompute
+    context = PlanningContext(course, target_time)
+    plan: PacingPlan = pacing_plan_class(course, target_time, current_m_paces, context)
+    memory_budget = plan.memory_budget if args.memory_budget is None else int(args.memory_budget * 2**20)
+    plan.memory_budget = memory_budget
+    plan.workers = args.workers
+    plan.compression_eps = args.compress
 
     pacing_plan_directory = os.path.join(course_directory, method)
     if not os.path.exists(pacing_plan_directory):
@@ -138,14 +169,17 @@ def main():
             current_m_paces = new_m_paces
             if old_method != method:
                 # Re-initialize the plan if the method has changed
-                plan = pacing_plan_class(course, target_time, current_m_paces)
+                plan = pacing_plan_class(course, target_time, current_m_paces, context)
+                plan.memory_budget = memory_budget
+                plan.workers = args.workers
+                plan.compression_eps = args.compress
 
         plan_identifier = f'{target_time:.0f}min_{current_m_paces}p'
         
         if verbose:
             print(f'\nRunning Algorithm: {method}\n')
         
-        plan.calculate_recommendations(verbose)
+        plan.calculate_recommendations(verbose, deadline_ms=args.deadline)
 
         file_path = {
             'geojson': os.path.join(pacing_plan_directory, f'{plan_identifier}.json'),
@@ -1,23 +1,34 @@
 import numpy as np
-import utils
+import pacing_dp
+from planning_context import PlanningContext
+
+DICT_ENTRY_BYTES = 100  # Bytes per weighted_paces entry: slot, int key and float value
 
 class OptimalPacingCalculator:
-    def __init__(self, race_course, target_time):
+    def __init__(self, race_course, target_time, memory_budget=pacing_dp.DEFAULT_MEMORY_BUDGET, context=None):
         """
         race_course: An object containing course information, such as grades and segment lengths.
         target_time: The total time goal for completing the course.
+        memory_budget: Bytes weighted_paces may take (None: no limit).
+        context: PlanningContext of race_course and target_time shared with the plans (default: a new one).
         """
         self.race_course = race_course
         self.target_time = target_time
+        self.memory_budget = memory_budget
+        if context is None:
+            context = PlanningContext(race_course, target_time)
+        else:
+            context.check(race_course, target_time)
+        self.context = context
         self.segment_lengths = self.race_course.segment_lengths
         self.grades = self.race_course.grades
         
-        self.adjustments = utils.get_pace_adjustments(self.grades)
-        self.base_pace = self.calculate_base_pace()
-        self.optimal_paces = self.base_pace + self.adjustments
+        self.adjustments = context.adjustments
+        self.base_pace = context.base_pace
+        self.optimal_paces = context.optimal_paces
 
         # Calculate optimal segment times
-        self.optimal_seg_times = np.multiply(self.segment_lengths, self.optimal_paces)
+        self.optimal_seg_times = context.optimal_seg_times
 
         # Create the weighted paces array
         self.weighted_paces = self.calculate_weighted_paces()
@@ -30,24 +41,35 @@ class OptimalPacingCalculator:
         total_distance = np.sum(self.segment_lengths)
         return (self.target_time - total_adjusted_time) / total_distance
 
+    def estimate_memory(self):
+        """
+        Estimated bytes of the weighted_paces dictionary, one entry per interval of segments.
+        """
+        n = len(self.segment_lengths)
+        return DICT_ENTRY_BYTES * n * (n + 1) // 2
+
     def calculate_weighted_paces(self):
         """
         Creates a nested dictionary where:
         weighted_paces[i][j] = the weighted optimal pace for the segment from i to j.
+        Each row is computed at once from prefix sums. Raises MemoryError up front if the
+        dictionary would not fit in the memory budget.
         """
         n = len(self.segment_lengths)
+        if self.memory_budget is not None and self.estimate_memory() > self.memory_budget:
+            raise MemoryError(f"The weighted paces of {n} segments need about {self.estimate_memory() / 2**20:.0f} MB, "
+                              f"over the memory budget of {self.memory_budget / 2**20:.0f} MB. Use a coarser segment view")
+
+        interval_stats = self.context.get_interval_stats()
         weighted_paces = {}
 
         for i in range(n):
-            weighted_paces[i] = {}
-            for j in range(i + 1, n + 1):
-                segment_lengths = self.segment_lengths[i:j]
-                segment_paces = self.optimal_paces[i:j]
-                total_length = np.sum(segment_lengths)
-
-                if total_length > 0:
-                    # Weighted average pace for the segment [i:j]
-                    weighted_paces[i][j] = np.dot(segment_paces, segment_lengths / total_length).round(4)
+            ends = np.arange(i + 1, n + 1)
+            total_lengths = interval_stats.length_sums[ends] - interval_stats.length_sums[i]
+            # Weighted average paces for the segments [i:j] with a positive length
+            ends = ends[total_lengths > 0]
+            paces = interval_stats.get_weighted_paces(i, ends).round(4)
+            weighted_paces[i] = dict(zip(ends.tolist(), paces.tolist()))
 
         return weighted_paces
         
@@ -0,0 +1,1080 @@
+import argparse
+import atexit
+import heapq
+import itertools
+import math
+import multiprocessing
+import time
+import warnings
+import weakref
+from abc import ABC, abstractmethod
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+class IntervalStats(ABC):
+    """
+    Prefix sums over the optimal paces of a course, giving the length weighted pace (the pace a
+    single pace segment is run at) of any interval [start, end) of segments in O(1). Subclasses
+    add the loss of running an interval at that pace, and the peak bytes computing it takes per
+    interval (COST_ENTRY_BYTES, used for memory estimates).
+
+    Paces are centered on their mean before summing, which leaves every loss unchanged but keeps
+    the prefix sums small and their cancellation error low.
+
+    PACE_MINIMIZES_COST tells whether the weighted pace is the best single pace of every
+    interval, so that moving breakpoints with the paces of a plan held fixed bounds the loss of
+    the best plan with the moved breakpoints (see PaceRuns.get_loss_bound).
+    """
+    PACE_MINIMIZES_COST = False
+
+    def __init__(self, paces, segment_lengths):
+        paces = np.asarray(paces, dtype=float)
+        self.n_segments = len(paces)
+        self.pace_offset = paces.mean()
+        self.paces = paces - self.pace_offset
+        self.segment_lengths = np.asarray(segment_lengths, dtype=float)
+        self.length_sums = np.insert(np.cumsum(self.segment_lengths), 0, 0)
+        self.time_sums = np.insert(np.cumsum(self.segment_lengths * self.paces), 0, 0)
+        self.pace_sums = np.insert(np.cumsum(self.paces), 0, 0)
+
+    def _get_centered_paces(self, starts, ends):
+        return (self.time_sums[ends] - self.time_sums[starts]) / (self.length_sums[ends] - self.length_sums[starts])
+
+    def get_weighted_paces(self, starts, ends):
+        """
+        Returns the length weighted pace over each [start, end). Arguments broadcast like numpy arrays.
+        """
+        return self._get_centered_paces(starts, ends) + self.pace_offset
+
+    @abstractmethod
+    def get_costs(self, starts, ends):
+        """
+        Returns the loss of running each [start, end) at its weighted pace.
+        """
+        pass
+
+    @abstractmethod
+    def get_min_costs(self, starts, ends):
+        """
+        Returns the lowest loss of running each [start, end) at any single pace, which is at most
+        the cost of any interval containing it (see get_block_lower_bound).
+        """
+        pass
+
+    @abstractmethod
+    def get_run_loss_bounds(self, starts, ends):
+        """
+        Upper bound on the loss added by moving a breakpoint inside each run [start, end) of
+        segments to the better of the run's ends, with the paces of the plan held fixed.
+        """
+        pass
+
+    def get_pace_ranges(self, starts, ends):
+        """
+        Range of the paces of each non-empty [start, end) of consecutive, non-overlapping intervals.
+        """
+        starts = np.asarray(starts)
+        return np.maximum.reduceat(self.paces, starts) - np.minimum.reduceat(self.paces, starts)
+
+class SquaredErrorStats(IntervalStats):
+    """Sum of squared differences to the weighted pace, from prefix moments in O(1)."""
+    COST_ENTRY_BYTES = 80
+
+    def __init__(self, paces, segment_lengths):
+        super().__init__(paces, segment_lengths)
+        self.square_sums = np.insert(np.cumsum(self.paces**2), 0, 0)
+
+    def get_costs(self, starts, ends):
+        starts, ends = np.broadcast_arrays(starts, ends)
+        pace = self._get_centered_paces(starts, ends)
+        count = ends - starts
+        pace_sum = self.pace_sums[ends] - self.pace_sums[starts]
+        square_sum = self.square_sums[ends] - self.square_sums[starts]
+        return np.maximum(square_sum - 2 * pace * pace_sum + count * pace**2, 0)
+
+    def get_min_costs(self, starts, ends):
+        # At the unweighted mean pace
+        starts, ends = np.broadcast_arrays(starts, ends)
+        count = ends - starts
+        pace_sum = self.pace_sums[ends] - self.pace_sums[starts]
+        square_sum = self.square_sums[ends] - self.square_sums[starts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.maximum(np.where(count > 0, square_sum - pace_sum**2 / count, 0), 0)
+
+    def get_run_loss_bounds(self, starts, ends):
+        # Moving a segment from plan pace b to a costs (p - a)^2 - (p - b)^2 = (b - a)(2p - a - b),
+        # which varies by d = 2 |b - a| * range over the run. Moving the breakpoint to one end
+        # moves the n1 segments before it, to the other the n2 after, and the better of the two
+        # costs at most n1 * n2 / (n1 + n2) * d <= count * d / 4
+        counts = np.asarray(ends) - np.asarray(starts)
+        return self.get_pace_ranges(starts, ends) * np.ptp(self.paces) * counts / 2
+
+class WeightedSquaredErrorStats(IntervalStats):
+    """
+    Length weighted sum of squared differences to the weighted pace, from prefix moments in O(1).
+    The weighted pace minimizes it, so splitting an interval never increases its cost (as
+    PELT pruning requires).
+    """
+    COST_ENTRY_BYTES = 80
+    PACE_MINIMIZES_COST = True
+
+    def __init__(self, paces, segment_lengths):
+        super().__init__(paces, segment_lengths)
+        self.weighted_square_sums = np.insert(np.cumsum(self.segment_lengths * self.paces**2), 0, 0)
+
+    def get_costs(self, starts, ends):
+        starts, ends = np.broadcast_arrays(starts, ends)
+        length = self.length_sums[ends] - self.length_sums[starts]
+        time_sum = self.time_sums[ends] - self.time_sums[starts]
+        square_sum = self.weighted_square_sums[ends] - self.weighted_square_sums[starts]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.maximum(np.where(length > 0, square_sum - time_sum**2 / length, 0), 0)
+
+    def get_min_costs(self, starts, ends):
+        # The weighted pace already is the best single pace
+        return self.get_costs(starts, ends)
+
+    def get_run_loss_bounds(self, starts, ends):
+        # As SquaredErrorStats, per unit of length
+        lengths = self.length_sums[ends] - self.length_sums[starts]
+        return self.get_pace_ranges(starts, ends) * np.ptp(self.paces) * lengths / 2
+
+class AbsoluteErrorStats(IntervalStats):
+    """
+    Sum of absolute differences to the weighted pace. The paces above the weighted pace of an
+    interval are counted and summed with a merge sort tree over pace ranks, in O(log^2 n) per
+    interval, vectorized over intervals.
+    """
+    COST_ENTRY_BYTES = 128
+
+    def __init__(self, paces, segment_lengths):
+        super().__init__(paces, segment_lengths)
+        n = self.n_segments
+        order = np.argsort(self.paces, kind='stable')
+        self.sorted_paces = self.paces[order]
+        ranks = np.empty(n, dtype=np.int64)
+        ranks[order] = np.arange(n)
+
+        # Level k holds the ranks of each aligned block of 2**k segments in sorted order, keyed by
+        # block so a single searchsorted finds the threshold within any block
+        self.n_levels = max(n - 1, 1).bit_length() + 1
+        self.level_keys = []
+        self.level_pace_sums = []
+        positions = np.arange(n)
+        for k in range(self.n_levels):
+            keys = (positions >> k) * n + ranks
+            level_order = np.argsort(keys, kind='stable')
+            self.level_keys.append(keys[level_order])
+            self.level_pace_sums.append(np.insert(np.cumsum(self.paces[level_order]), 0, 0))
+
+    def get_costs(self, starts, ends):
+        starts, ends = np.broadcast_arrays(starts, ends)
+        shape = starts.shape
+        starts = starts.ravel().astype(np.int64)
+        ends = ends.ravel().astype(np.int64)
+        n = self.n_segments
+
+        pace = self._get_centered_paces(starts, ends)
+        thresholds = np.searchsorted(self.sorted_paces, pace, side='right')
+        count_above = np.zeros(len(starts))
+        sum_above = np.zeros(len(starts))
+
+        def add_blocks(k, idx, blocks):
+            lo = np.searchsorted(self.level_keys[k], blocks * n + thresholds[idx])
+            hi = np.minimum((blocks + 1) << k, n)
+            count_above[idx] += hi - lo
+            sum_above[idx] += self.level_pace_sums[k][hi] - self.level_pace_sums[k][lo]
+
+        # Decompose each [start, end) into aligned blocks, bottom up
+        left, right = starts.copy(), ends.copy()
+        for k in range(self.n_levels):
+            idx = np.flatnonzero((left < right) & (left & 1 == 1))
+            add_blocks(k, idx, left[idx])
+            left[idx] += 1
+            idx = np.flatnonzero((left < right) & (right & 1 == 1))
+            right[idx] -= 1
+            add_blocks(k, idx, right[idx])
+            left >>= 1
+            right >>= 1
+
+        count = ends - starts
+        pace_sum = self.pace_sums[ends] - self.pace_sums[starts]
+        costs = 2 * (sum_above - count_above * pace) - (pace_sum - count * pace)
+        return np.maximum(costs, 0).reshape(shape)
+
+    def get_min_costs(self, starts, ends):
+        # At the median pace, with the intervals padded to a matrix (meant for a few short ones)
+        starts, ends = np.broadcast_arrays(np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64))
+        counts = ends - starts
+        offsets = np.arange(max(int(counts.max(initial=0)), 1))
+        indices = starts[..., None] + offsets
+        paces = np.where(offsets < counts[..., None], self.paces[np.minimum(indices, self.n_segments - 1)], np.nan)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians = np.nanmedian(paces, axis=-1)
+        return np.nansum(np.abs(paces - medians[..., None]), axis=-1)
+
+    def get_run_loss_bounds(self, starts, ends):
+        # |p - a| - |p - b| varies by at most 2 * range over a run, so as for SquaredErrorStats
+        # the better end costs at most count * 2 * range / 4
+        counts = np.asarray(ends) - np.asarray(starts)
+        return self.get_pace_ranges(starts, ends) * counts / 2
+
+def get_interval_stats(loss_method, paces, segment_lengths):
+    """
+    Returns the IntervalStats for a pacing plan's loss_method (np.square or np.abs).
+    """
+    if loss_method is np.square:
+        return SquaredErrorStats(paces, segment_lengths)
+    if loss_method is np.abs:
+        return AbsoluteErrorStats(paces, segment_lengths)
+    raise ValueError(f"Unsupported loss method: {loss_method}")
+
+DEFAULT_MEMORY_BUDGET = 2 * 1024**3    # Bytes a SuffixDP may use, see SuffixDP.reserve
+LAYER_ENTRY_BYTES = 32                  # Bytes per position and layer: loss and opt, copied while a layer is stacked on
+DEADLINE_CHUNK_ENTRIES = 2**16          # Costs computed between deadline checks
+
+class PaceRuns:
+    """
+    Compression of a course into super-segments: maximal runs of consecutive segments whose
+    paces are all within [eps] of each other, with their bounds (positions in the original
+    segments), total lengths and length weighted paces. A SuffixDP restricted to get_positions
+    solves the compressed problem with exact costs and breakpoints at original positions; only
+    breakpoints inside a run are lost (see get_loss_bound).
+    """
+    def __init__(self, paces, segment_lengths, eps):
+        paces = np.asarray(paces, dtype=float)
+        segment_lengths = np.asarray(segment_lengths, dtype=float)
+        self.eps = eps
+        self.n_segments = len(paces)
+
+        bounds = [0]
+        while bounds[-1] < self.n_segments:
+            start = bounds[-1]
+            # Grow the run a window at a time until its range of paces exceeds eps
+            window = 64
+            while True:
+                window_paces = paces[start:start + window]
+                ranges = np.maximum.accumulate(window_paces) - np.minimum.accumulate(window_paces)
+                too_wide = np.flatnonzero(ranges > eps)
+                if len(too_wide) > 0 or start + window >= self.n_segments:
+                    break
+                window *= 2
+            bounds.append(start + (int(too_wide[0]) if len(too_wide) > 0 else len(window_paces)))
+        self.bounds = np.array(bounds)
+
+        length_sums = np.insert(np.cumsum(segment_lengths), 0, 0)
+        time_sums = np.insert(np.cumsum(segment_lengths * paces), 0, 0)
+        self.lengths = np.diff(length_sums[self.bounds])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.paces = np.diff(time_sums[self.bounds]) / self.lengths
+        self.counts = np.diff(self.bounds)
+
+    @property
+    def n_runs(self):
+        return len(self.counts)
+
+    def get_positions(self):
+        """
+        Breakpoint positions of the compressed problem: the run bounds. The SuffixDP still checks
+        the minimum length of a pace segment on its count of original segments, so a pace
+        segment may span several runs shorter than the minimum.
+        """
+        return self.bounds
+
+    def get_loss_bound(self, stats: IntervalStats, total_paces):
+        """
+        Bound on the extra loss of the best plan with breakpoints at run bounds over the best
+        plan without restrictions: each of its total_paces - 1 breakpoints is moved out of at most
+        one run (see IntervalStats.get_run_loss_bounds). It only bounds the best plan for stats
+        with PACE_MINIMIZES_COST, as long as the moved pace segments keep the minimum length; for
+        the others it is an estimate, with the paces held fixed.
+        """
+        bounds = stats.get_run_loss_bounds(self.bounds[:-1], self.bounds[1:])
+        return float(np.sum(np.sort(bounds)[::-1][:max(total_paces - 1, 0)]))
+
+class SuffixDP:
+    """
+    Optimal pace changes restricted to a set of candidate breakpoint [positions] (all segments by
+    default). loss[a, p] is the lowest loss of running [positions[p], n) with [a] pace changes,
+    every pace segment spanning at least [min_segment_length] segments, and opt[a, p] is the
+    position of the first pace change in that solution (-1 if there is none).
+
+    Only suffixes of the course are ever needed, so each layer is a single vectorized min over
+    the (positions x positions) cost matrix: O(P * K^2) for K positions instead of O(P * n^3).
+    Layers do not depend on the total number of paces, so they are computed once and reused by
+    any smaller or larger number of paces.
+
+    The cost matrix is cached when it fits in [memory_budget] bytes (None: no limit). Otherwise it
+    is recomputed for every layer in chunks of rows that fit, with identical results. With
+    [workers] > 1 the rows of every layer are split across the processes of a DPWorkerPool, also
+    with identical results.
+    """
+    def __init__(self, stats: IntervalStats, min_segment_length, positions=None, memory_budget=DEFAULT_MEMORY_BUDGET, workers=1):
+        n = stats.n_segments
+        self.stats = stats
+        self.n_segments = n
+        self.min_segment_length = min_segment_length
+        self.memory_budget = memory_budget
+        if positions is None:
+            positions = np.arange(n + 1)
+        self.positions = np.union1d(np.asarray(positions, dtype=np.int64), [0, n])
+        self.positions = self.positions[(self.positions >= 0) & (self.positions <= n)]
+        self.position_index = {p: i for i, p in enumerate(self.positions.tolist())}
+
+        starts = self.positions[:-1]
+        self.loss = np.full((1, len(self.positions)), np.inf)
+        self.loss[0, :-1] = stats.get_costs(starts, n)
+        self.opt = np.full((1, len(self.positions)), -1, dtype=np.int64)
+        self._costs = None
+        self._costs_rows = 0
+        self._block_costs = None
+        self.chunk_rows = None
+        self.workers = workers
+        self._shared_layers = None
+
+    def estimate_memory(self, total_paces, chunk_rows=None):
+        """
+        Estimated peak bytes of solving up to [total_paces] paces with the costs computed
+        [chunk_rows] rows at a time (None: the whole matrix at once, cached for later layers).
+        """
+        n_positions = len(self.positions)
+        layer_bytes = LAYER_ENTRY_BYTES * n_positions * max(total_paces, len(self.loss))
+        rows = n_positions if chunk_rows is None else chunk_rows
+        return layer_bytes + self.stats.COST_ENTRY_BYTES * rows * n_positions
+
+    def reserve(self, total_paces):
+        """
+        Chooses how the costs are computed before any layer up to [total_paces] paces is: the
+        cached matrix if it fits in the memory budget, else the largest chunks of rows that fit.
+        Raises MemoryError, before allocating anything, if not even a single row fits.
+        """
+        if self.memory_budget is None or self.estimate_memory(total_paces) <= self.memory_budget:
+            self.chunk_rows = None
+            return
+        self._costs = None
+        self._shared_layers = None
+        n_positions = len(self.positions)
+        self.chunk_rows = int((self.memory_budget - self.estimate_memory(total_paces, 0)) // (self.stats.COST_ENTRY_BYTES * n_positions))
+        if self.chunk_rows < 1:
+            raise MemoryError(f"Solving {total_paces} paces over {n_positions} positions needs at least "
+                              f"{self.estimate_memory(total_paces, 1) / 2**20:.1f} MB, over the memory budget of "
+                              f"{self.memory_budget / 2**20:.1f} MB. Use fewer segments or paces, or a multiresolution plan (MRS/MRA)")
+
+    def compute_costs(self, starts, ends):
+        """
+        Cost of a pace segment from each of [starts] to each of [ends], inf where it is not allowed.
+        """
+        starts = starts[:, None]
+        ends = ends[None, :]
+        allowed = (ends - starts >= self.min_segment_length) & (ends <= self.n_segments - self.min_segment_length)
+        costs = np.full(allowed.shape, np.inf)
+        costs[allowed] = self.stats.get_costs(np.broadcast_to(starts, allowed.shape)[allowed], np.broadcast_to(ends, allowed.shape)[allowed])
+        return costs
+
+    def get_costs(self, deadline=None):
+        """
+        Cost of a pace segment between every pair of positions, inf where it is not allowed. With
+        a [deadline], the matrix is built a few rows at a time and None is returned if it passes
+        first; the rows built so far are kept for the next call.
+        """
+        n_positions = len(self.positions)
+        if self._costs is None:
+            self._costs = np.empty((n_positions, n_positions))
+            self._costs_rows = 0
+        chunk_rows = n_positions if deadline is None else max(DEADLINE_CHUNK_ENTRIES // n_positions, 1)
+        while self._costs_rows < n_positions:
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            rows = slice(self._costs_rows, min(self._costs_rows + chunk_rows, n_positions))
+            self._costs[rows] = self.compute_costs(self.positions[rows], self.positions)
+            self._costs_rows = rows.stop
+        return self._costs
+
+    def extend(self, total_paces, deadline=None):
+        """
+        Computes the layers up to [total_paces] - 1 pace changes. Returns False if [deadline] (a
+        time.perf_counter() value) passed before all layers were computed.
+        """
+        if len(self.loss) < total_paces:
+            self.reserve(total_paces)
+        while len(self.loss) < total_paces:
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            if not self.add_layer(deadline):
+                return False
+        return True
+
+    def add_layer(self, deadline=None):
+        """
+        Computes the next layer. Returns False, without adding it, if [deadline] passed first
+        (checked between chunks of costs; not with workers).
+        """
+        if self.workers > 1:
+            if self._shared_layers is None:
+                self._shared_layers = SharedLayers(self, get_worker_pool(self.workers))
+            best, loss = self._shared_layers.get_minimums(self.loss[-1])
+        elif self.chunk_rows is None:
+            costs = self.get_costs(deadline)
+            if costs is None:
+                return False
+            totals = costs + self.loss[-1][None, :]
+            best = np.argmin(totals, axis=1)
+            loss = totals[np.arange(len(best)), best]
+        else:
+            minimums = self.get_block_minimums(self.loss[-1], deadline=deadline)
+            if minimums is None:
+                return False
+            best, loss = minimums
+        opt = np.where(np.isfinite(loss), self.positions[best], -1)
+        self.loss = np.vstack((self.loss, loss))
+        self.opt = np.vstack((self.opt, opt))
+        return True
+
+    def get_block_minimums(self, previous, first=0, last=None, deadline=None):
+        """
+        add_layer's row minimums over the rows [first, last) given the [previous] layer, with the
+        costs computed [chunk_rows] rows at a time, or all at once and kept for the next layers.
+        Returns None if [deadline] passes before a chunk.
+        """
+        n_positions = len(self.positions)
+        last = n_positions if last is None else last
+        best = np.zeros(last - first, dtype=np.int64)
+        loss = np.full(last - first, np.inf)
+        chunk_rows = self.chunk_rows or max(last - first, 1)
+        if deadline is not None and self.chunk_rows is not None:
+            chunk_rows = min(chunk_rows, max(DEADLINE_CHUNK_ENTRIES // n_positions, 1))
+        for chunk_first in range(first, last, chunk_rows):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            starts = self.positions[chunk_first:min(chunk_first + chunk_rows, last)]
+            # Earlier ends are less than min_segment_length after every start of the chunk
+            first_end = int(np.searchsorted(self.positions, starts[0] + self.min_segment_length))
+            if first_end == n_positions:
+                break
+            if self.chunk_rows is not None:
+                costs = self.compute_costs(starts, self.positions[first_end:])
+            else:
+                if self._block_costs is None:
+                    self._block_costs = self.compute_costs(starts, self.positions[first_end:])
+                costs = self._block_costs
+            totals = costs + previous[None, first_end:]
+            chunk_best = np.argmin(totals, axis=1)
+            rows = slice(chunk_first - first, chunk_first - first + len(starts))
+            best[rows] = chunk_best + first_end
+            loss[rows] = totals[np.arange(len(starts)), chunk_best]
+        return best, loss
+
+    def get_row_bounds(self, n_blocks):
+        """
+        Splits the rows into [n_blocks] contiguous blocks with about the same number of allowed
+        costs each (later positions have fewer allowed ends).
+        """
+        n_positions = len(self.positions)
+        widths = n_positions - np.searchsorted(self.positions, self.positions + self.min_segment_length)
+        work = np.cumsum(widths + 1)
+        bounds = np.searchsorted(work, work[-1] * np.arange(1, n_blocks) / n_blocks)
+        return np.concatenate(([0], bounds, [n_positions])).tolist()
+
+    def get_position(self, start):
+        if start not in self.position_index:
+            raise ValueError(f"Segment {start} is not a candidate breakpoint position of the DP")
+        return self.position_index[start]
+
+    def get_loss(self, total_paces, start=0):
+        """
+        Returns the loss of the best plan with [total_paces] paces for the segments [start, n).
+        """
+        self.extend(total_paces)
+        return self.loss[total_paces - 1, self.get_position(start)]
+
+    def get_breakpoints(self, total_paces, start=0):
+        """
+        Returns the first segment of each pace segment of the best plan with [total_paces] paces
+        for the segments [start, n), start being a position.
+        """
+        self.extend(total_paces)
+        if not np.isfinite(self.loss[total_paces - 1, self.get_position(start)]):
+            raise ValueError(f"The {self.n_segments - start} segments from segment {start} cannot be split into {total_paces} paces "
+                             f"of at least {self.min_segment_length} segments")
+        breakpoints = [start]
+        for a in range(total_paces - 1, 0, -1):
+            breakpoints.append(int(self.opt[a, self.position_index[breakpoints[-1]]]))
+        return np.array(breakpoints)
+
+def run_dp_worker(connection):
+    """
+    Worker process loop of a DPWorkerPool. Each DP it is set up with is kept under its key
+    together with the rows the worker computes, so every layer only needs the previous layer.
+    """
+    dps = {}
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        command, key, *args = message
+        try:
+            if command == 'setup':
+                stats, min_segment_length, positions, chunk_rows, first, last, block_names = args
+                dp = SuffixDP(stats, min_segment_length, positions, memory_budget=None)
+                dp.chunk_rows = chunk_rows
+                dps[key] = (dp, first, last, [shared_memory.SharedMemory(name=name) for name in block_names])
+            elif command == 'layer':
+                dp, first, last, blocks = dps[key]
+                previous, best, loss = SharedLayers.get_arrays(blocks, len(dp.positions))
+                best[first:last], loss[first:last] = dp.get_block_minimums(previous, first, last)
+                del previous, best, loss
+            elif command == 'release':
+                for block in dps.pop(key)[3]:
+                    block.close()
+            connection.send(None)
+        except Exception as e:
+            connection.send(e)
+
+class DPWorkerPool:
+    """
+    Persistent worker processes computing the rows of SuffixDP layers in parallel. Worker i always
+    computes block i of the rows, so a worker that can keep its block of costs does so across layers.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.connections = []
+        self.processes = []
+        # Workers must share this process's resource tracker, or theirs would unlink the shared
+        # memory they attach to when they exit
+        resource_tracker.ensure_running()
+        for _ in range(workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_dp_worker, args=(worker_connection,), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def run(self, messages):
+        """
+        Sends messages[i] to worker i and waits for all of them to finish.
+        """
+        for connection, message in zip(self.connections, messages):
+            connection.send(message)
+        errors = [connection.recv() for connection in self.connections[:len(messages)]]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def is_alive(self):
+        return all(process.is_alive() for process in self.processes)
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+_worker_pool = None
+
+def get_worker_pool(workers):
+    """
+    Returns the persistent DPWorkerPool of [workers] processes, (re)starting it when needed.
+    """
+    global _worker_pool
+    if _worker_pool is None or _worker_pool.workers != workers or not _worker_pool.is_alive():
+        if _worker_pool is not None:
+            _worker_pool.close()
+        _worker_pool = DPWorkerPool(workers)
+    return _worker_pool
+
+@atexit.register
+def close_worker_pool():
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.close()
+        _worker_pool = None
+
+class SharedLayers:
+    """
+    The previous layer of a SuffixDP and the best next positions and losses of the next one, in
+    shared memory for the workers of a DPWorkerPool, each computing its block of rows.
+    """
+    _keys = itertools.count()
+
+    def __init__(self, dp: SuffixDP, pool: DPWorkerPool):
+        n_positions = len(dp.positions)
+        self.pool = pool
+        self.key = next(SharedLayers._keys)
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(8 * n_positions, 1)) for _ in range(3)]
+        self.previous, self.best, self.loss = SharedLayers.get_arrays(self.blocks, n_positions)
+        weakref.finalize(self, SharedLayers.release, pool, self.key, self.blocks)
+
+        bounds = dp.get_row_bounds(pool.workers)
+        chunk_rows = None if dp.chunk_rows is None else max(dp.chunk_rows // pool.workers, 1)
+        block_names = [block.name for block in self.blocks]
+        pool.run([('setup', self.key, dp.stats, dp.min_segment_length, dp.positions, chunk_rows, bounds[i], bounds[i+1], block_names)
+                  for i in range(pool.workers)])
+
+    @staticmethod
+    def get_arrays(blocks, n_positions):
+        return (np.ndarray(n_positions, dtype=float, buffer=blocks[0].buf),
+                np.ndarray(n_positions, dtype=np.int64, buffer=blocks[1].buf),
+                np.ndarray(n_positions, dtype=float, buffer=blocks[2].buf))
+
+    @staticmethod
+    def release(pool, key, blocks):
+        if pool.is_alive():
+            pool.run([('release', key)] * pool.workers)
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # Still viewed by arrays of a live SharedLayers (at interpreter exit)
+                pass
+            block.unlink()
+
+    def get_minimums(self, previous):
+        self.previous[:] = previous
+        self.pool.run([('layer', self.key)] * self.pool.workers)
+        return self.best.copy(), self.loss.copy()
+
+class DPResult:
+    """
+    Breakpoints (first segment of each pace segment) and loss of a pacing DP solution, with the
+    number of candidate positions considered at each level and the time taken. is_optimal is set
+    when the solution is proven optimal, and bound is the best known lower bound on the optimal
+    loss (None: unknown).
+    """
+    def __init__(self, breakpoints, loss, levels, elapsed, method=None, is_optimal=False, bound=None):
+        self.breakpoints = breakpoints
+        self.loss = loss
+        self.levels = levels
+        self.elapsed = elapsed
+        self.method = method
+        self.is_optimal = is_optimal
+        self.bound = bound
+
+    def get_gap(self, optimal_loss):
+        """Relative gap of this solution to [optimal_loss]."""
+        if optimal_loss == 0:
+            return 0.0 if self.loss == 0 else np.inf
+        return (self.loss - optimal_loss) / optimal_loss
+
+def solve_full(stats, total_paces, min_segment_length, memory_budget=DEFAULT_MEMORY_BUDGET, workers=1):
+    start = time.perf_counter()
+    dp = SuffixDP(stats, min_segment_length, memory_budget=memory_budget, workers=workers)
+    breakpoints = dp.get_breakpoints(total_paces)
+    loss = dp.get_loss(total_paces)
+    return DPResult(breakpoints, loss, [len(dp.positions)], time.perf_counter() - start, 'dp', True, loss)
+
+def get_window_positions(breakpoints, radius, step, n):
+    """
+    Positions every [step] segments within [radius] of each breakpoint.
+    """
+    offsets = np.arange(-(radius // step) * step, radius + 1, step)
+    positions = (np.asarray(breakpoints)[:, None] + offsets[None, :]).ravel()
+    return positions[(positions >= 0) & (positions <= n)]
+
+def get_candidate_breakpoints(dp, total_paces, extra_paces):
+    """
+    Breakpoints of the best plans with total_paces +- [extra_paces] paces. Windows around all of
+    them let the next level move a pace change further than one window from where it was.
+    """
+    candidates = [dp.get_breakpoints(total_paces)]
+    for m_paces in range(max(1, total_paces - extra_paces), total_paces + extra_paces + 1):
+        if m_paces != total_paces and np.isfinite(dp.get_loss(m_paces)):
+            candidates.append(dp.get_breakpoints(m_paces))
+    return np.unique(np.concatenate(candidates))
+
+def solve_multiresolution(stats, total_paces, min_segment_length, coarse_segments=100, refine_factor=10, window_radius=5, extra_paces=2, max_polish=5, deadline=None):
+    """
+    Coarse-to-fine pacing DP. The course is first solved with breakpoints restricted to the
+    boundaries of [coarse_segments] equal blocks of segments (losses are still exact, as they are
+    computed from the fine segments). Each level then divides the block size by [refine_factor] and
+    re-solves with breakpoints restricted to windows of [window_radius] previous blocks around the
+    previous level's candidate breakpoints (see get_candidate_breakpoints), down to single
+    segments. Finally the windows are re-centered on the solution until it stops changing (at
+    most [max_polish] times). If [deadline] (a time.perf_counter() value) passes, the last
+    finished level is returned, or None if not even the coarse level finished.
+
+    The result is near-optimal but not guaranteed optimal; see DPResult.get_gap.
+    """
+    start = time.perf_counter()
+    n = stats.n_segments
+    step = max(1, math.ceil(n / coarse_segments))
+
+    dp = SuffixDP(stats, min_segment_length, np.arange(0, n, step))
+    if not dp.extend(total_paces, deadline):
+        return None
+    breakpoints = dp.get_breakpoints(total_paces)
+    levels = [len(dp.positions)]
+    if step == 1:
+        # The coarse level already is the full DP
+        return DPResult(breakpoints, dp.get_loss(total_paces), levels, time.perf_counter() - start, 'dp', True, dp.get_loss(total_paces))
+
+    n_polish = 0
+    while deadline is None or time.perf_counter() < deadline:
+        if step > 1:
+            radius, step = window_radius * step, max(1, step // refine_factor)
+        else:
+            radius = refine_factor
+            n_polish += 1
+            if n_polish > max_polish:
+                break
+        candidates = get_candidate_breakpoints(dp, total_paces, extra_paces)
+        level_dp = SuffixDP(stats, min_segment_length, get_window_positions(candidates, radius, step, n))
+        if not level_dp.extend(total_paces, deadline):
+            break
+        dp = level_dp
+        new_breakpoints = dp.get_breakpoints(total_paces)
+        levels.append(len(dp.positions))
+        if n_polish > 0 and np.array_equal(new_breakpoints, breakpoints):
+            break
+        breakpoints = new_breakpoints
+
+    return DPResult(breakpoints, dp.get_loss(total_paces), levels, time.perf_counter() - start)
+
+def get_best_split(stats, start, end, min_segment_length):
+    """
+    Best split position of the pace segment [start, end) into two of at least
+    [min_segment_length] segments, and the loss of the two halves (None, inf if it cannot be split).
+    """
+    splits = np.arange(start + min_segment_length, end - min_segment_length + 1)
+    if len(splits) == 0:
+        return None, np.inf
+    losses = stats.get_costs(start, splits) + stats.get_costs(splits, end)
+    best = int(np.argmin(losses))
+    return int(splits[best]), losses[best]
+
+def move_breakpoints(stats, bounds, min_segment_length):
+    """
+    Moves each breakpoint of [bounds] (breakpoints followed by n) in place to its best position
+    between its neighbours, in O(n). Returns whether any breakpoint moved.
+    """
+    moved = False
+    for j in range(1, len(bounds) - 1):
+        splits = np.arange(bounds[j-1] + min_segment_length, bounds[j+1] - min_segment_length + 1)
+        losses = stats.get_costs(bounds[j-1], splits) + stats.get_costs(splits, bounds[j+1])
+        best = int(np.argmin(losses))
+        if losses[best] < losses[bounds[j] - splits[0]]:
+            bounds[j] = int(splits[best])
+            moved = True
+    return moved
+
+def exchange_breakpoint(stats, bounds, min_segment_length):
+    """
+    Removes the breakpoint of [bounds] whose removal increases the loss the least and adds the
+    split that decreases it the most, in place, if that lowers the loss. O(n). Returns whether the
+    breakpoints changed.
+    """
+    if len(bounds) < 3:
+        return False
+    starts, ends = np.array(bounds[:-1]), np.array(bounds[1:])
+    losses = stats.get_costs(starts, ends)
+    merge_costs = stats.get_costs(starts[:-1], ends[1:]) - losses[:-1] - losses[1:]
+    j = int(np.argmin(merge_costs)) + 1
+    merged = bounds[:j] + bounds[j+1:]
+
+    best_gain, best_split = 0, None
+    for segment_start, segment_end in zip(merged[:-1], merged[1:]):
+        split, loss = get_best_split(stats, segment_start, segment_end, min_segment_length)
+        if split is not None:
+            gain = float(stats.get_costs(segment_start, segment_end)) - loss
+            if gain > best_gain:
+                best_gain, best_split = gain, split
+    # Relative tolerance, so rounding cannot make a breakpoint cycle between two positions
+    if best_split is None or best_split == bounds[j] or best_gain <= merge_costs[j-1] * (1 + 1e-12) + 1e-15:
+        return False
+    bounds[:] = sorted(merged + [best_split])
+    return True
+
+def refine_breakpoints(stats, breakpoints, min_segment_length, max_passes=20, deadline=None):
+    """
+    Local search from [breakpoints]: every pass moves each breakpoint to its best position
+    between its neighbours, and then swaps the least useful breakpoint for the best new split if
+    that lowers the loss, until neither changes anything (at most [max_passes] passes of O(n)
+    cost evaluations each, and none started after [deadline]). Returns the breakpoints and the
+    number of passes made.
+    """
+    bounds = list(breakpoints) + [stats.n_segments]
+    n_passes = 0
+    while n_passes < max_passes and (deadline is None or time.perf_counter() < deadline):
+        n_passes += 1
+        moved = move_breakpoints(stats, bounds, min_segment_length)
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        exchanged = exchange_breakpoint(stats, bounds, min_segment_length)
+        if not moved and not exchanged:
+            break
+    return np.array(bounds[:-1]), n_passes
+
+def get_middle_split(stats, start, end, min_segment_length):
+    """
+    Split of the pace segment [start, end) in the middle, as get_best_split but in O(1).
+    """
+    if end - start < 2 * min_segment_length:
+        return None, np.inf
+    split = (start + end) // 2
+    return split, float(stats.get_costs(start, split) + stats.get_costs(split, end))
+
+def solve_greedy(stats, total_paces, min_segment_length, refine=True, max_refine_passes=20, deadline=None):
+    """
+    Top-down greedy pacing plan. Starting from a single pace, the pace segment whose best split
+    reduces the loss the most is split, until there are [total_paces] paces. Candidate splits are
+    kept in a heap, so this is O(n log n + P * n) cost evaluations, where each split only scans its
+    own segment. With [refine], refine_breakpoints then moves each breakpoint locally.
+
+    Once [deadline] (a time.perf_counter() value) passes, segments are split in the middle
+    instead of at their best split, and refinement stops.
+
+    The result is not guaranteed optimal; see DPResult.get_gap. levels holds the number of
+    refinement passes.
+    """
+    start = time.perf_counter()
+    n = stats.n_segments
+    heap = []
+
+    def push(segment_start, segment_end):
+        if deadline is not None and time.perf_counter() >= deadline:
+            split, loss = get_middle_split(stats, segment_start, segment_end, min_segment_length)
+        else:
+            split, loss = get_best_split(stats, segment_start, segment_end, min_segment_length)
+        if split is not None:
+            gain = float(stats.get_costs(segment_start, segment_end)) - loss
+            heapq.heappush(heap, (-gain, segment_start, segment_end, split))
+
+    breakpoints = [0]
+    push(0, n)
+    while len(breakpoints) < total_paces:
+        if not heap:
+            raise ValueError(f"A course of {n} segments cannot be split into {total_paces} paces "
+                             f"of at least {min_segment_length} segments")
+        _, segment_start, segment_end, split = heapq.heappop(heap)
+        breakpoints.append(split)
+        push(segment_start, split)
+        push(split, segment_end)
+
+    breakpoints = np.sort(np.array(breakpoints))
+    levels = [0]
+    if refine and total_paces > 1:
+        breakpoints, n_passes = refine_breakpoints(stats, breakpoints, min_segment_length, max_refine_passes, deadline)
+        levels = [n_passes]
+    loss = float(np.sum(stats.get_costs(breakpoints, np.append(breakpoints[1:], n))))
+    return DPResult(breakpoints, loss, levels, time.perf_counter() - start)
+
+def pelt(stats, penalty, min_segment_length, deadline=None):
+    """
+    Optimal partitioning of the course into pace segments of at least [min_segment_length]
+    segments, minimizing the loss plus [penalty] per pace, with PELT pruning (Killick et al.
+    2012). A candidate last breakpoint s is dropped once F(s) + cost(s, t) > F(t) for some t,
+    as t then beats s for every end at least min_segment_length after t; until then s is kept.
+    Near-linear expected time when paces change every so often, O(n^2) at worst. The stats'
+    costs must never increase when an interval is split (e.g. WeightedSquaredErrorStats).
+
+    Returns the breakpoints and their (unpenalized) loss, or None if [deadline] (a
+    time.perf_counter() value) passes first.
+    """
+    n = stats.n_segments
+    best_totals = np.full(n + 1, np.inf)
+    best_totals[0] = -penalty
+    last_breakpoints = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.array([0], dtype=np.int64)
+    expiries = np.array([np.inf])
+    for t in range(min_segment_length, n + 1):
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        is_active = expiries > t
+        candidates, expiries = candidates[is_active], expiries[is_active]
+        eligible = np.flatnonzero(candidates <= t - min_segment_length)
+        if len(eligible) > 0:
+            starts = candidates[eligible]
+            totals = best_totals[starts] + stats.get_costs(starts, t)
+            best = int(np.argmin(totals))
+            best_totals[t] = totals[best] + penalty
+            last_breakpoints[t] = starts[best]
+            is_pruned = (totals > best_totals[t]) & np.isinf(expiries[eligible])
+            expiries[eligible[is_pruned]] = t + min_segment_length
+        if np.isfinite(best_totals[t]):
+            candidates = np.append(candidates, t)
+            expiries = np.append(expiries, np.inf)
+
+    if not np.isfinite(best_totals[n]):
+        raise ValueError(f"A course of {n} segments cannot be split into paces of at least {min_segment_length} segments")
+    breakpoints = [int(last_breakpoints[n])]
+    while breakpoints[-1] > 0:
+        breakpoints.append(int(last_breakpoints[breakpoints[-1]]))
+    breakpoints = np.array(breakpoints[::-1])
+    loss = float(np.sum(stats.get_costs(breakpoints, np.append(breakpoints[1:], n))))
+    return breakpoints, loss
+
+def solve_pelt(stats, total_paces, min_segment_length, exact=True, max_runs=50, memory_budget=DEFAULT_MEMORY_BUDGET, workers=1,
+               dp=None, deadline=None):
+    """
+    Best plan with [total_paces] paces from pelt, searching the penalty. Starting from the
+    plans with penalty 0 (most paces) and a single pace, each run uses the penalty at which the
+    two bracketing plans cost the same, which finds a plan strictly between them whenever one
+    is optimal for some penalty. A plan with exactly total_paces paces found this way is optimal.
+
+    Some pace counts are never optimal for any penalty. Then, if [exact], the DP is solved
+    instead (method 'dp'): the layers of [dp] if given, else a new SuffixDP with [memory_budget]
+    and [workers], or solve_anytime if there is a [deadline]. Else the best plan with fewer
+    paces is returned. levels holds the number of paces of every pelt run.
+
+    If [deadline] passes during the penalty search, the search stops there and the fallback
+    above is taken, with a plan that is not optimal.
+    """
+    start = time.perf_counter()
+    n = stats.n_segments
+    high = (np.array([0]), float(stats.get_costs(0, n)))
+    levels = []
+    if total_paces <= 1:
+        return DPResult(high[0], high[1], levels, time.perf_counter() - start, 'pelt', True, high[1])
+
+    low = pelt(stats, 0, min_segment_length, deadline)
+    if low is not None:
+        levels.append(len(low[0]))
+    while low is not None and len(levels) < max_runs and len(low[0]) > total_paces > len(high[0]):
+        penalty = (high[1] - low[1]) / (len(low[0]) - len(high[0]))
+        result = pelt(stats, penalty, min_segment_length, deadline)
+        if result is None:
+            break
+        levels.append(len(result[0]))
+        if len(result[0]) in (len(low[0]), len(high[0])):
+            # No plan between the two is optimal for any penalty
+            break
+        if len(result[0]) >= total_paces:
+            low = result
+        else:
+            high = result
+
+    if low is not None and len(low[0]) == total_paces:
+        return DPResult(low[0], low[1], levels, time.perf_counter() - start, 'pelt', True, low[1])
+    if not exact and (low is None or len(low[0]) > total_paces):
+        return DPResult(high[0], high[1], levels, time.perf_counter() - start, 'pelt')
+    if deadline is not None:
+        result = solve_anytime(stats, total_paces, min_segment_length, deadline, dp, memory_budget, workers)
+        result.elapsed = time.perf_counter() - start
+        return result
+    if dp is None:
+        dp = SuffixDP(stats, min_segment_length, memory_budget=memory_budget, workers=workers)
+    loss = dp.get_loss(total_paces)
+    return DPResult(dp.get_breakpoints(total_paces), loss, levels, time.perf_counter() - start, 'dp', True, loss)
+
+def get_block_lower_bound(stats, total_paces, deadline=None):
+    """
+    Lower bound on the loss of any plan with [total_paces] paces. Cut the course into blocks: at
+    most total_paces - 1 of them contain a breakpoint, and the others each lie within one pace
+    segment, so the plan's loss is at least the sum of their min costs (see
+    IntervalStats.get_min_costs). The best bound over a few block counts (those tried before
+    [deadline]) is returned.
+    """
+    n = stats.n_segments
+    bound = 0.0
+    n_blocks = max(total_paces, 1)
+    while n_blocks <= n and (deadline is None or n_blocks == total_paces or time.perf_counter() < deadline):
+        bounds = np.unique(np.linspace(0, n, n_blocks + 1).round().astype(np.int64))
+        costs = np.sort(stats.get_min_costs(bounds[:-1], bounds[1:]))
+        bound = max(bound, float(np.sum(costs[:max(len(costs) - (total_paces - 1), 0)])))
+        n_blocks *= 2
+    return bound
+
+def solve_anytime(stats, total_paces, min_segment_length, deadline, dp=None, memory_budget=DEFAULT_MEMORY_BUDGET, workers=1):
+    """
+    Best plan found before [deadline] (a time.perf_counter() value). A greedy plan is always
+    returned, split in the middle and unrefined as far as the deadline has passed (see
+    solve_greedy); while time remains it is improved by the multiresolution DP, then replaced by
+    the exact DP, which resumes the layers of [dp] if given (else a new SuffixDP with
+    [memory_budget] and [workers]). The result is optimal only if the exact DP finished; its
+    bound is get_block_lower_bound otherwise. levels holds the loss after each stage.
+    """
+    start = time.perf_counter()
+    best = solve_greedy(stats, total_paces, min_segment_length, deadline=deadline)
+    best.method = 'greedy'
+    levels = [best.loss]
+    bound = get_block_lower_bound(stats, total_paces, deadline)
+
+    if time.perf_counter() < deadline:
+        result = solve_multiresolution(stats, total_paces, min_segment_length, deadline=deadline)
+    else:
+        result = None
+    if result is not None:
+        levels.append(result.loss)
+        if result.loss < best.loss:
+            best = result
+            best.method = best.method or 'multiresolution'
+
+    if time.perf_counter() < deadline and not best.is_optimal:
+        if dp is None:
+            dp = SuffixDP(stats, min_segment_length, memory_budget=memory_budget, workers=workers)
+        try:
+            is_finished = dp.extend(total_paces, deadline)
+        except MemoryError:
+            is_finished = False
+        if is_finished:
+            loss = dp.get_loss(total_paces)
+            levels.append(loss)
+            return DPResult(dp.get_breakpoints(total_paces), loss, levels, time.perf_counter() - start, 'dp', True, loss)
+
+    if best.is_optimal:
+        bound = best.loss
+    return DPResult(best.breakpoints, best.loss, levels, time.perf_counter() - start, best.method, bound >= best.loss, bound)
+
+def init_parser() -> argparse.ArgumentParser:
+    '''
+    Initializes the command line flag parser for this file.
+
+    Flags:
+
+    [REQUIRED]
+    -f, --file      ==> file path of the gpx file
+
+    [OPTIONAL]
+    -n, --segments  ==> fine resolution in segments (default: one segment per meter)
+    -p, --paces     ==> total number of paces
+    -l, --loss      ==> square or absolute
+    -c, --coarse    ==> coarse resolution in segments
+    --max-full      ==> largest course (in segments) to also solve with the full DP
+    -h              ==> opens help menu
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", required=True, help="file path of the gpx file")
+    parser.add_argument("-n", "--segments", type=int, default=None, help="fine resolution in segments (default: one per meter)")
+    parser.add_argument("-p", "--paces", type=int, default=8, help="total number of paces")
+    parser.add_argument("-l", "--loss", choices=["square", "absolute"], default="square", help="loss of the pacing plan")
+    parser.add_argument("-c", "--coarse", type=int, default=100, help="coarse resolution in segments")
+    parser.add_argument("--max-full", type=int, default=5000, help="largest course to also solve with the full DP, for the optimality gap")
+    return parser
+
+def main():
+    import os
+    import segment_view
+    from race_course import RealRaceCourse
+    from pacing_plan import calculate_optimal_paces
+
+    args = init_parser().parse_args()
+    course_name = os.path.basename(args.file).split('.')[0]
+    course = RealRaceCourse(course_name, args.file)
+    n_segments = args.segments or max(int(round(course.metric_view.total_distance)), 1)
+    course.change_view(segment_view.SegmentViewImperial(segment_view.SegmentViewInterpUniform(course.metric_view, n_segments)))
+    _, optimal_paces = calculate_optimal_paces(course.grades, course.segment_lengths, course.total_distance * 8)
+    loss_method = np.square if args.loss == "square" else np.abs
+    stats = get_interval_stats(loss_method, optimal_paces, course.segment_lengths)
+    min_segment_length = 3
+
+    result = solve_multiresolution(stats, args.paces, min_segment_length, coarse_segments=args.coarse)
+    print(f"{course_name}: {n_segments} segments, {args.paces} paces, {args.loss} loss")
+    print(f"multiresolution  loss {result.loss:.6f}  {result.elapsed*1000:8.1f} ms  positions per level {result.levels}")
+    greedy = solve_greedy(stats, args.paces, min_segment_length)
+    print(f"greedy           loss {greedy.loss:.6f}  {greedy.elapsed*1000:8.1f} ms  refinement passes {greedy.levels[0]}")
+    if n_segments <= args.max_full:
+        full = solve_full(stats, args.paces, min_segment_length)
+        print(f"full DP          loss {full.loss:.6f}  {full.elapsed*1000:8.1f} ms")
+        print(f"gap to optimum   {result.get_gap(full.loss)*100:.4f}% (multiresolution)  {greedy.get_gap(full.loss)*100:.4f}% (greedy)")
+    else:
+        print(f"full DP skipped (more than {args.max_full} segments)")
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,14 @@ import matplotlib.pyplot as plt
 import race_course
 from abc import ABC, abstractmethod
 import json
+import time
 import utils
-import math
+import hill_detection
+import splits
+import streaming
+import pacing_dp
+import smoothing
+from planning_context import PlanningContext
 from enum import Enum
 
 from numpy.typing import NDArray
@@ -17,22 +23,109 @@ class ExportMode(Enum):
     ABBREV = 2
     PER_MILE = 3
 
+def calculate_optimal_paces(grades, segment_lengths, target_time):
+    """
+    Returns the base pace and the grade adjusted pace of every segment that together finish in
+    [target_time].
+    """
+    adjustments = utils.get_pace_adjustments(grades)
+    base_pace = (target_time - np.dot(adjustments, segment_lengths)) / np.sum(segment_lengths)
+    return base_pace, np.full(grades.shape, base_pace) + adjustments
+
+TV_PACE_TOLERANCE = 1 / 60 # min/mile, paces closer than a second per mile are the same pace on a plan
+
+def get_segment_means(paces, segment_lengths, breakpoints):
+    return np.add.reduceat(paces * segment_lengths, breakpoints) / np.add.reduceat(segment_lengths, breakpoints)
+
+def merge_short_segments(paces, segment_lengths, breakpoints, min_segment_length):
+    """
+    Merges each pace segment starting at [breakpoints] with fewer than [min_segment_length]
+    segments, shortest first, into the neighbour with the closest mean pace. Returns the
+    remaining breakpoints.
+    """
+    breakpoints = np.asarray(breakpoints)
+    while len(breakpoints) > 1:
+        counts = np.diff(np.append(breakpoints, len(paces)))
+        shortest = int(np.argmin(counts))
+        if counts[shortest] >= min_segment_length:
+            break
+        means = get_segment_means(paces, segment_lengths, breakpoints)
+        if shortest == 0:
+            merge_next = True
+        elif shortest == len(breakpoints) - 1:
+            merge_next = False
+        else:
+            merge_next = abs(means[shortest + 1] - means[shortest]) < abs(means[shortest - 1] - means[shortest])
+        breakpoints = np.delete(breakpoints, shortest + 1 if merge_next else shortest)
+    return breakpoints
+
+def fit_segment_means(paces, segment_lengths, breakpoints, tolerance=TV_PACE_TOLERANCE):
+    """
+    Runs each pace segment starting at [breakpoints] at the length weighted mean of its [paces],
+    merging the closest neighbouring pace segments until all differ by more than [tolerance].
+    """
+    breakpoints = np.asarray(breakpoints)
+    while True:
+        means = get_segment_means(paces, segment_lengths, breakpoints)
+        gaps = np.abs(np.diff(means))
+        if not np.any(gaps <= tolerance):
+            break
+        breakpoints = np.delete(breakpoints, np.argmin(gaps) + 1)
+    return np.repeat(means, np.diff(np.append(breakpoints, len(paces))))
+
+def fit_total_variation(paces, segment_lengths, total_paces, tolerance=TV_PACE_TOLERANCE, min_segment_length=1, max_iterations=100):
+    """
+    Bisects (on a log scale) the lam of smoothing.total_variation over the length weighted
+    [paces] for a plan of [total_paces] paces, counting paces within [tolerance] of their
+    neighbour as one, after merging pace segments shorter than [min_segment_length] (see
+    merge_short_segments). The number of paces is not always monotonic in lam, so the plan with
+    the most paces not above [total_paces] is kept. The lasso shrinks every pace change, so only
+    its breakpoints are kept and each pace segment is refit to its mean pace (see
+    fit_segment_means). Returns the paces and lam.
+    """
+    max_lam = smoothing.get_total_variation_max_lambda(paces, segment_lengths)
+    best_breakpoints = np.array([0])
+    best_lam, best_count = max_lam, 1
+    if total_paces > 1 and max_lam > 0:
+        low, high = np.log(max_lam) - 40, np.log(max_lam)
+        for _ in range(max_iterations):
+            lam = np.exp((low + high) / 2)
+            tv_paces = smoothing.total_variation(paces, segment_lengths, lam)
+            breakpoints = utils.gen_critical_segments(tv_paces, tolerance)
+            breakpoints = merge_short_segments(paces, segment_lengths, breakpoints, min_segment_length)
+            count = len(breakpoints)
+            if best_count < count <= total_paces:
+                best_breakpoints, best_lam, best_count = breakpoints, lam, count
+            if count == total_paces:
+                break
+            if count > total_paces:
+                low = np.log(lam)
+            else:
+                high = np.log(lam)
+    return fit_segment_means(paces, segment_lengths, best_breakpoints, tolerance), best_lam
+
 class PacingPlan(ABC):
-    def __init__(self, race_course, target_time, total_paces):
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        """
+        context: PlanningContext of race_course and target_time shared with other plans (default:
+        a new one, used by this plan only).
+        """
         self.target_time = target_time
         self.race_course = race_course
         self.total_paces = total_paces
-        grades = self.race_course.grades
-        adjustments = utils.get_pace_adjustments(grades)
-        self.base_pace = (self.target_time - np.dot(adjustments, self.get_segment_lengths())) / np.sum(self.get_segment_lengths())
-        self.optimal_paces = np.full(grades.shape, self.base_pace) + adjustments
-        self.optimal_seg_times = np.multiply(self.get_segment_lengths(), self.optimal_paces)
-
-        n = self.get_n_segments()
-        self.weighted_paces = np.zeros((n,n+1))
-        for i in range(n):
-                for j in range(i+1, n+1):
-                    self.weighted_paces[i,j] = np.dot(self.optimal_paces[i:j], self.get_segment_lengths()[i:j] / sum(self.get_segment_lengths()[i:j]))
+        if context is None:
+            context = PlanningContext(race_course, target_time)
+        else:
+            context.check(race_course, target_time)
+        self.context = context
+        self.base_pace, self.optimal_paces = context.base_pace, context.optimal_paces
+        self.optimal_seg_times = context.optimal_seg_times
+
+        # interval_stats.get_weighted_paces(i, j) is the length weighted optimal pace over segments
+        # [i, j), from prefix sums so no (n x n) table is ever allocated
+        self.interval_stats = context.get_interval_stats()
+        # Bytes the plan's DP may use before it switches to slower chunked computation (None: no limit)
+        self.memory_budget = pacing_dp.DEFAULT_MEMORY_BUDGET
     
     def update_paces_from_critical_segments(self, critical_segments=None):
         """
@@ -45,7 +138,7 @@ class PacingPlan(ABC):
         for j in range(self.total_paces):
             low = self.critical_segments[j]
             high = self.get_n_segments() if (j == self.total_paces - 1) else self.critical_segments[j+1]
-            pace = self.weighted_paces[low, high]
+            pace = self.interval_stats.get_weighted_paces(low, high)
             self.true_paces_full[low:high] = pace
             self.true_paces_abbrev[j] = pace
 
@@ -56,59 +149,43 @@ class PacingPlan(ABC):
             self.elapsed_dists[j] = elapsed_dist
             self.true_seg_times[j] = pace * elapsed_dist
         
+    def get_splits(self, split_distances, paces=None):
+        """
+        Returns the splits of [paces] (default: the recommended paces) ending at each of the
+        given distances and at the finish.
+        """
+        if paces is None:
+            paces = self.true_paces_full
+        return splits.SplitEngine(self.get_segment_lengths(), paces).get_splits(split_distances)
+
     def get_pace_per_mile(self, paces):
         """Takes in a full list of pace segments and returns an array of paces per mile.
         """
         assert len(paces) == self.get_n_segments(), 'Pacing plan must have a pace for each segment'
         assert isinstance(paces, np.ndarray), 'Pacing plan must be a numpy array'
 
-        pace_per_mile = np.ones(int(np.ceil(self.race_course.total_distance))) * -1
-        n_mile_markers = math.ceil(self.race_course.total_distance)
-        mile_markers = np.argwhere(self.race_course.end_distances - np.floor(self.race_course.end_distances) - self.race_course.segment_lengths <= 0)
-        mile_markers = mile_markers.reshape(n_mile_markers,)
-        overflow = 0
-        total_time = 0
-
-        for m in range(n_mile_markers):
-            if m == 0:
-                i = 0
-            else: 
-                i = mile_markers[m] + 1
-            if m == n_mile_markers -1:
-                j = self.race_course.n_segments-1
-            else:
-                j = mile_markers[m+1]
-
-            time = overflow + np.dot(self.race_course.segment_lengths[i:j], paces[i:j])
-
-            if m != n_mile_markers - 1:
-                overflow_distance = self.race_course.end_distances[j] - (m+1) # distance from last segment that we exclude
-                incl_distance = self.race_course.segment_lengths[j] - overflow_distance
-                incl_time = incl_distance*paces[j]
-                overflow = overflow_distance * paces[j]
-                time += incl_time
-                pace_per_mile[m] = time
-            else:
-                pace_per_mile[m] = time / (overflow_distance + np.sum(self.race_course.segment_lengths[i:j]))
-            total_time += time
-
-        return pace_per_mile
+        return self.get_splits(splits.get_mile_markers(self.race_course.total_distance), paces).paces
     
-    def get_text_plan_full(self):
+    def iter_text_plan_full(self, coordinate_precision=None, elevation_precision=None):
         """
-        Generates a .txt pacing plan that explicitly statements the pace run at every segment.
+        Yields the rows of the full .txt pacing plan, one segment at a time. Precisions are the
+        number of decimals kept for lat/lon and elevation (default: full precision).
         """
-        display_txt = ""
-        for i in range(self.get_n_segments()):
-            lat = self.race_course.lats[i]
-            lon = self.race_course.lons[i]
+        n = self.get_n_segments()
+        columns = (self.race_course.lats[:n], self.race_course.lons[:n], self.race_course.start_elevations) # elevation in feet
+        decimals = (coordinate_precision, coordinate_precision, elevation_precision)
+        rows = streaming.iter_rows(columns, decimals)
+        for i, (lat, lon, elevation) in enumerate(rows):
             pace = self.true_paces_full[i]
             dist = self.race_course.segment_lengths[i]
             time = pace * dist
-            elevation = self.race_course.start_elevations[i] # feet
-        
-            display_txt += f"{i}, {pace}, {lat}, {lon}, {elevation}, {dist}, {time} \n"
-        return display_txt
+            yield f"{i}, {pace}, {lat}, {lon}, {elevation}, {dist}, {time} \n"
+
+    def get_text_plan_full(self):
+        """
+        Generates a .txt pacing plan that explicitly statements the pace run at every segment.
+        """
+        return "".join(self.iter_text_plan_full())
     
     def get_text_plan_abbrev(self):
         """
@@ -138,11 +215,10 @@ class PacingPlan(ABC):
         Returns a .csv pace plan in the following schema:
         [mile_idx], [pace], [time_per_mile], [elapsed_time], [distance (miles)]
         """
-        n_mile_markers = math.ceil(self.race_course.total_distance)
-        distance = np.ones(n_mile_markers)
-        distance[-1] = self.race_course.total_distance - n_mile_markers + 1
-        time_per_mile = np.multiply(distance, self.pace_per_mile)
-        elapsed_time = np.cumsum(time_per_mile)
+        mile_splits = self.get_splits(splits.get_mile_markers(self.race_course.total_distance))
+        distance = mile_splits.distances
+        time_per_mile = mile_splits.times
+        elapsed_time = mile_splits.elapsed_times
         
         display_txt = ""
 
@@ -152,8 +228,8 @@ class PacingPlan(ABC):
         column_titles = '[mile_idx], [pace], [time_per_mile], [elapsed_time], [distance (miles)]'
         display_txt += column_titles +'\n'
 
-        for i in range(n_mile_markers):
-            pace = self.pace_per_mile[i]
+        for i in range(len(mile_splits)):
+            pace = mile_splits.paces[i]
             txt = f"{i} mi \t{utils.get_pace_display_text(pace)}/mile \t {time_per_mile[i]} min \t {elapsed_time[i]} min \t {distance[i]} mi"
             display_txt += txt + '\n'
         
@@ -161,67 +237,68 @@ class PacingPlan(ABC):
         
         return display_txt
     
-    def gen_text_plan(self, file_path : str, export_mode : ExportMode):
-        if export_mode == ExportMode.ABBREV:
-            txt = self.get_text_plan_abbrev()
-        elif export_mode == ExportMode.FULL:
-            txt = self.get_text_plan_full()
-        elif export_mode == ExportMode.PER_MILE:
-            txt = self.gen_text_plan_per_mile()
-
-        with open(file_path, 'w') as file:
-            file.write(txt)
-
-    def gen_geojson_full(self, file_path, loop):
-        # Initialize the base structure of the GeoJSON
-        geojson_data = {
-            "type": "FeatureCollection",
-            "features": []
-        }
-        
-        # Loop through each segment and create a new feature for each one
+    def gen_text_plan(self, file_path, export_mode : ExportMode):
+        """
+        Writes the text plan to [file_path], which may be a path or an open file-like object.
+        The full plan is streamed row by row.
+        """
+        with streaming.open_output(file_path) as file:
+            if export_mode == ExportMode.ABBREV:
+                file.write(self.get_text_plan_abbrev())
+            elif export_mode == ExportMode.FULL:
+                file.writelines(self.iter_text_plan_full())
+            elif export_mode == ExportMode.PER_MILE:
+                file.write(self.gen_text_plan_per_mile())
+
+    def iter_geojson_features(self, loop, coordinate_precision=6, elevation_precision=1):
+        """
+        Yields one GeoJSON LineString feature per pace segment. The coordinates of each feature are
+        themselves a generator, rounded to the given number of decimals (None keeps full precision).
+        """
         all_changes = self.critical_segments
         if (all_changes[-1] != self.get_n_segments()):
             all_changes = np.append(all_changes, self.get_n_segments())
 
         for start, end in zip(all_changes, all_changes[1:]):
             pace = self.true_paces_full[start]
-            lats = self.race_course.lats[start:end+1]
-            lons = self.race_course.lons[start:end+1]
-            elevations = self.race_course.elevations[start:end+1]
-
-            coords = np.stack((lons,lats, elevations))
-            coords = coords.T.tolist()
-
-            if(end == self.get_n_segments() and loop):
-                coords.append([self.race_course.lons[0],self.race_course.lats[0],self.race_course.elevations[0]])
-
-            # Create a feature for each segment
-            feature = {
+            close_loop = end == self.get_n_segments() and loop
+            yield {
                 "type": "Feature",
                 "geometry": {
                     "type": "LineString",
-                    "coordinates": coords
+                    "coordinates": self.iter_coordinates(start, end, close_loop, coordinate_precision, elevation_precision)
                 },
                 "properties": {
-                    "pace": pace  # Add pace property
+                    "pace": float(pace)
                 }
             }
-            
-            # Append the feature to the features array in GeoJSON
-            geojson_data["features"].append(feature)
 
-        with open(file_path, 'w') as geojson_file:
-            json.dump(geojson_data, geojson_file, indent=4)
+    def iter_coordinates(self, start, end, close_loop, coordinate_precision, elevation_precision):
+        """
+        Yields the [lon, lat, elevation] of points start..end (inclusive), followed by the first
+        point of the course if [close_loop].
+        """
+        columns = (self.race_course.lons, self.race_course.lats, self.race_course.elevations)
+        decimals = (coordinate_precision, coordinate_precision, elevation_precision)
+        yield from streaming.iter_rows([column[start:end+1] for column in columns], decimals)
+        if close_loop:
+            yield from streaming.iter_rows([column[:1] for column in columns], decimals)
 
-        return geojson_data
+    def gen_geojson_full(self, file_path, loop, coordinate_precision=6, elevation_precision=1, indent=None):
+        """
+        Streams the plan as a GeoJSON FeatureCollection to [file_path], which may be a path or an
+        open file-like object (e.g. a socket's makefile()).
+        """
+        geojson_data = {
+            "type": "FeatureCollection",
+            "features": self.iter_geojson_features(loop, coordinate_precision, elevation_precision)
+        }
+        streaming.write_json(file_path, geojson_data, indent)
     
-    def gen_geojson_abbrev(self, file_path):
+    def iter_abbrev_segments(self):
         """
-        Generates a simplified .json pacing plan that includes just the different pace segments.
+        Yields the json record of each pace segment in the abbreviated plan.
         """
-        segments = []
-
         for i, pace in enumerate(self.true_paces_abbrev):
             segment = {
                 "segment_num": i,
@@ -237,35 +314,35 @@ class PacingPlan(ABC):
                     "longitude": self.race_course.lons[i]
                 }
 
-            segments.append(segment)
+            yield segment
 
+    def gen_geojson_abbrev(self, file_path, indent=None):
+        """
+        Generates a simplified .json pacing plan that includes just the different pace segments.
+        """
         result = {
             "course_name": self.race_course.course_name,
             "target_time": self.target_time,
-            "segments": segments,
+            "segments": self.iter_abbrev_segments(),
             "total_time": self.target_time
         }
-
-        with open(file_path, 'w') as geojson_file:
-            json.dump(result, geojson_file, indent=4)
-        return result
+        streaming.write_json(file_path, result, indent)
     
     def gen_geojson_per_mile(self, file_path):
         """
         Returns a .json pace plan in the following schema:
         [mile_idx], [pace], [time_per_mile], [elapsed_time], [distance (miles)]
         """
-        n_mile_markers = math.ceil(self.race_course.total_distance)
-        distance = np.ones(n_mile_markers)
-        distance[-1] = self.race_course.total_distance - n_mile_markers + 1
-        time_per_mile = np.multiply(distance, self.pace_per_mile)
-        elapsed_time = np.cumsum(time_per_mile)
+        mile_splits = self.get_splits(splits.get_mile_markers(self.race_course.total_distance))
+        distance = mile_splits.distances
+        time_per_mile = mile_splits.times
+        elapsed_time = mile_splits.elapsed_times
         
         segments = []
-        for i in range(n_mile_markers):
+        for i in range(len(mile_splits)):
             segment = {
                 "mile_index": i,
-                "pace_per_mile": utils.get_pace_display_text(self.pace_per_mile[i]),
+                "pace_per_mile": utils.get_pace_display_text(mile_splits.paces[i]),
                 "time_per_mile": time_per_mile[i],
                 "elapsed_time": elapsed_time[i],
                 "distance": distance[i]
@@ -340,8 +417,8 @@ class PacingPlan(ABC):
 
 class PacingPlanStatic(PacingPlan):
     """Pre-computed pacing plan based off fixed target_time and total_paces"""
-    def __init__(self, race_course : race_course.RaceCourse, target_time : float, total_paces : int):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course : race_course.RaceCourse, target_time : float, total_paces : int, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
 
         # Populated after pace recommendations are calculated
         self.critical_segments = np.ones(self.total_paces).astype(int)*-1
@@ -351,6 +428,12 @@ class PacingPlanStatic(PacingPlan):
         self.elapsed_dists = np.ones(self.total_paces).astype(float) * -1
         self.pace_per_mile = np.ones(int(np.ceil(self.race_course.total_distance))) * -1
         self.true_total_time = 0
+
+        # time.perf_counter() value plans that support it must finish by (None: no deadline)
+        self.deadline = None
+        # Whether the plan is proven optimal for its loss, and the best known lower bound on that loss
+        self.is_optimal = False
+        self.loss_bound = None
         
     def get_segment_lengths(self):
         return self.race_course.segment_lengths
@@ -368,10 +451,13 @@ class PacingPlanStatic(PacingPlan):
         """
         pass
 
-    def calculate_recommendations(self, verbose=False, eps=1e-2):
+    def calculate_recommendations(self, verbose=False, eps=1e-2, deadline_ms=None):
         """
-        Calculates the pacing plan and populates the necessary attributes
+        Calculates the pacing plan and populates the necessary attributes. With [deadline_ms],
+        plans that support it return the best plan found in that many milliseconds instead of
+        the optimal one (see is_optimal and loss_bound).
         """
+        self.deadline = None if deadline_ms is None else time.perf_counter() + deadline_ms / 1000
         paces = self._calculate_recommendations(verbose)
         assert isinstance(paces, np.ndarray), 'Pacing plan must be a numpy array'
         assert len(paces) == self.get_n_segments(), 'Pacing plan must have a pace for each segment'
@@ -397,74 +483,104 @@ class PacingPlanStatic(PacingPlan):
             return self.get_text_plan_abbrev()
 
 class PacingPlanBF(PacingPlanStatic):
-    def __init__(self,race_course : race_course.RaceCourse, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
-        n = self.get_n_segments()
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.MIN_SEGMENT_LENGTH = 3 # TODO: test different values of this parameter; dynamically change its initialization based off the race course
-        self.LOSS = np.ones((n, n+1, total_paces)) * np.inf
-        self.OPT = np.ones((n, n+1, total_paces)).astype(int)*-1
-        self.cached_m_paces = 0
+        self.workers = 1 # processes computing the DP layers, see pacing_dp.DPWorkerPool
+        self.compression_eps = None # min/mile, solve on runs of paces within it, see pacing_dp.PaceRuns
+        self.pace_runs = None
+        self.dp = None
+        self.result = None # pacing_dp.DPResult of methods other than the exact DP
 
-    def get_idxs(self,i,k,a, verbose=False):
+    def get_dp(self):
         """
-        Returns the set of indices that represent the segments we change pace on for a pacing plan 
-        for interval [i,k) with [a] pace changes remaining.
+        Suffix DP over all segments, or only at the bounds of runs of equal paces if
+        compression_eps is set. Its layers are kept, so changing the number of paces only
+        computes the layers that are missing.
         """
-        if verbose:
-            print(f"range [{i},{k}) with {a} pace changes")
-        if a == 0:
-            return {i}
-        j = self.OPT[i,k,a]
-        if verbose:
-            print(f"split on index {j}\n")
-        right = self.get_idxs(j,k,a-1, verbose)
-        right.add(i)
-        return right
-    
-    def backtrack_solution(self):
-        n = self.get_n_segments()
-        m_paces = self.total_paces
+        if self.dp is None:
+            stats = self.get_stats()
+            positions = None
+            if self.compression_eps is not None:
+                self.pace_runs = pacing_dp.PaceRuns(self.optimal_paces, self.get_segment_lengths(), self.compression_eps)
+                positions = self.pace_runs.get_positions()
+            self.dp = pacing_dp.SuffixDP(stats, self.MIN_SEGMENT_LENGTH, positions, memory_budget=self.memory_budget, workers=self.workers)
+        return self.dp
+
+    def get_stats(self):
+        """
+        pacing_dp stats of the loss the plan minimizes.
+        """
+        return self.context.get_interval_stats(self.loss_method)
 
-        # list of segment indices where we change the paces
-        self.critical_segments = np.array(sorted(self.get_idxs(0,n, self.total_paces-1))).astype(int)
-        
-        self.update_paces_from_critical_segments()
+    def get_compression_bound(self):
+        """
+        Bound on the loss the compression may add over the uncompressed plan, 0 without it.
+        """
+        if self.pace_runs is None:
+            return 0.0
+        return self.pace_runs.get_loss_bound(self.get_dp().stats, self.total_paces)
+
+    def estimate_memory(self):
+        """
+        Estimated peak bytes of the DP for the current number of paces, within the memory budget.
+        Raises MemoryError if no way of computing it fits.
+        """
+        dp = self.get_dp()
+        dp.reserve(self.total_paces)
+        return dp.estimate_memory(self.total_paces, dp.chunk_rows)
+
+    def solve(self, verbose=False):
+        """
+        Returns the breakpoints of the plan (the segment indices where the pace changes) and sets
+        result unless they come from the exact DP. Subclasses override it with their own method.
+        """
+        self.calculate_brute_force(verbose)
+        return self.backtrack_solution()
+
+    def backtrack_solution(self):
+        if self.deadline is not None:
+            dp = self.get_dp()
+            self.result = pacing_dp.solve_anytime(dp.stats, self.total_paces, self.MIN_SEGMENT_LENGTH, self.deadline, dp)
+            return self.result.breakpoints
+        self.result = None
+        return self.get_dp().get_breakpoints(self.total_paces)
         
     def calculate_brute_force(self, verbose=True):
-        n = self.get_n_segments()
-        
-        if self.cached_m_paces == 0:
-            # TODO: rewrite using numpy vectorized functions
-            for i in range(n):
-                for j in range(i+1, n+1):
-                    loss = np.sum(self.loss_method(self.optimal_paces[i:j]-self.weighted_paces[i,j]))
-                    self.LOSS[i,j,0] = loss
-
-        for a in range(max(1, self.cached_m_paces), self.total_paces):
+        if self.deadline is not None:
+            # solve_anytime computes the layers it has time for
+            return
+        dp = self.get_dp()
+        dp.reserve(self.total_paces)
+        for a in range(len(dp.loss), self.total_paces):
             if verbose:
                 print(f'PROGRESSED TO A = {a}')
-            for i in range(n):
-                # k >= i + number of pace changes + 1 
-                for k in range(i+(a+1)*self.MIN_SEGMENT_LENGTH, n+1):
-                    best_j = -1 
-                    lowest_loss = np.inf
-                    
-                    for j in range(i+self.MIN_SEGMENT_LENGTH,k - self.MIN_SEGMENT_LENGTH + 1):
-                        loss = self.LOSS[i,j,0] + self.LOSS[j,k,a-1]
-                        if loss < lowest_loss:
-                            lowest_loss = loss
-                            best_j = j 
-                    
-                    self.LOSS[i,k,a] = lowest_loss
-                    self.OPT[i,k,a] = int(best_j)
-        
-        self.cached_m_paces = self.total_paces
+            dp.add_layer()
+
+    def get_loss(self):
+        if self.result is not None:
+            return self.result.loss
+        return self.get_dp().get_loss(self.total_paces)
+
+    def update_optimality(self):
+        """
+        Sets is_optimal and loss_bound from the exact DP or the method's result. Compression
+        only proves a plan optimal if it cannot have added any loss, and leaves no bound for
+        losses whose compression bound is only an estimate (see PaceRuns.get_loss_bound).
+        """
+        if self.result is None:
+            self.is_optimal, self.loss_bound = True, self.get_loss()
+        else:
+            self.is_optimal, self.loss_bound = self.result.is_optimal, self.result.bound
+        if self.pace_runs is not None and not self.get_dp().stats.PACE_MINIMIZES_COST:
+            self.is_optimal, self.loss_bound = False, None
+        elif self.pace_runs is not None:
+            compression_bound = self.get_compression_bound()
+            self.is_optimal = self.is_optimal and compression_bound == 0
+            if self.loss_bound is not None:
+                self.loss_bound = max(self.loss_bound - compression_bound, 0.0)
 
     def change_total_paces(self, new_m_paces):
-        if new_m_paces > self.total_paces:
-            self.LOSS = np.pad(self.LOSS, ((0,0), (0,0), (0,new_m_paces-self.total_paces)), 'constant', constant_values=np.inf)
-            self.OPT = np.pad(self.OPT, ((0,0), (0,0), (0,new_m_paces-self.total_paces)), 'constant', constant_values=-1)
-        
         self.critical_segments = np.ones(new_m_paces).astype(int)*-1
         self.true_paces_abbrev = np.ones(new_m_paces).astype(float) * -1 
         self.elapsed_dists = np.ones(new_m_paces).astype(float) * -1
@@ -473,36 +589,146 @@ class PacingPlanBF(PacingPlanStatic):
         self.total_paces = new_m_paces
 
     def _calculate_recommendations(self, verbose=False):
-        if self.total_paces > self.cached_m_paces:
-            self.calculate_brute_force(verbose)
-        self.backtrack_solution()
+        self.critical_segments = self.solve(verbose).astype(int)
+        self.update_paces_from_critical_segments()
+        self.update_optimality()
+        if verbose and self.deadline is not None and self.loss_bound is not None:
+            print(f'Anytime plan from {self.result.method}, loss {self.get_loss():.6g}, '
+                  f'lower bound {self.loss_bound:.6g}, optimal: {self.is_optimal}')
+        if verbose and self.pace_runs is not None:
+            extra = 'at most' if self.get_dp().stats.PACE_MINIMIZES_COST else 'estimated at'
+            print(f'Compressed {self.pace_runs.n_segments} segments into {self.pace_runs.n_runs} runs, '
+                  f'extra loss {extra} {self.get_compression_bound():.6g}')
         self.pace_per_mile = self.get_pace_per_mile(self.true_paces_full)
         return self.true_paces_full
 
 class PacingPlanBFSquare(PacingPlanBF):
-    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.loss_method = np.square
 
 class PacingPlanBFAbsolute(PacingPlanBF):
-    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.loss_method = np.abs
+
+class PacingPlanMultires(PacingPlanBF):
+    """
+    Near-optimal version of PacingPlanBF that solves the DP coarse to fine (see
+    pacing_dp.solve_multiresolution), for courses with thousands of segments. With a deadline
+    it keeps the last finished level, or the greedy plan if the coarse level did not finish.
+    """
+    COARSE_SEGMENTS = 100
+
+    def solve(self, verbose=False):
+        stats = self.get_stats()
+        self.result = pacing_dp.solve_multiresolution(stats, self.total_paces, self.MIN_SEGMENT_LENGTH, self.COARSE_SEGMENTS,
+                                                      deadline=self.deadline)
+        if self.result is None:
+            self.result = pacing_dp.solve_greedy(stats, self.total_paces, self.MIN_SEGMENT_LENGTH, deadline=self.deadline)
+        return self.result.breakpoints
+
+class PacingPlanMultiresSquare(PacingPlanMultires):
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.loss_method = np.square
+
+class PacingPlanMultiresAbsolute(PacingPlanMultires):
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.loss_method = np.abs
+
+class PacingPlanGreedy(PacingPlanBF):
+    """
+    Fast, non-optimal version of PacingPlanBF that repeatedly splits the pace segment whose best
+    split lowers the loss the most, then refines the breakpoints locally (see
+    pacing_dp.solve_greedy). With a deadline, refinement stops at it.
+    """
+    REFINE = True
+
+    def solve(self, verbose=False):
+        stats = self.get_stats()
+        self.result = pacing_dp.solve_greedy(stats, self.total_paces, self.MIN_SEGMENT_LENGTH, self.REFINE, deadline=self.deadline)
+        return self.result.breakpoints
+
+class PacingPlanGreedySquare(PacingPlanGreedy):
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.loss_method = np.square
+
+class PacingPlanGreedyAbsolute(PacingPlanGreedy):
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.loss_method = np.abs
 
+class PacingPlanPELT(PacingPlanBF):
+    """
+    Length weighted square loss plan from penalized changepoint detection (see
+    pacing_dp.solve_pelt), near-linear when the requested number of paces is optimal for some
+    penalty. Otherwise it falls back to the plan's DP (compressed with compression_eps), or with
+    EXACT unset returns the best plan with fewer paces. With a deadline the penalty search stops
+    at it, and the DP fallback is the anytime one of PacingPlanBF.
+    """
+    EXACT = True
+
+    def __init__(self, race_course : race_course.RaceCourse, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.loss_method = np.square
+
+    def get_stats(self):
+        return self.context.get_weighted_square_stats()
+
+    def solve(self, verbose=False):
+        # The DP layers are only computed when pelt falls back to them
+        self.result = pacing_dp.solve_pelt(self.get_stats(), self.total_paces, self.MIN_SEGMENT_LENGTH, self.EXACT,
+                                           dp=self.get_dp(), deadline=self.deadline)
+        return self.result.breakpoints
+
+    def update_optimality(self):
+        if self.result.method == 'pelt':
+            # pelt solves the uncompressed problem
+            self.is_optimal, self.loss_bound = self.result.is_optimal, self.result.bound
+        else:
+            super().update_optimality()
+
+class PacingPlanTotalVariation(PacingPlanStatic):
+    """
+    Fused lasso pacing plan: the breakpoints of the optimal paces denoised with a total variation
+    penalty (weighted by segment length) that is just strong enough to leave total_paces paces,
+    each pace segment run at its mean optimal pace. Solved exactly by smoothing.total_variation,
+    without an LP solver. Pace segments shorter than MIN_SEGMENT_LENGTH are merged into a
+    neighbour.
+
+    The lasso does not place its breakpoints where the square loss is lowest: on the bundled
+    courses at 3 to 12 paces the squared error is 1.0 to 2.7 times that of PacingPlanBFSquare.
+    """
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
+        self.MIN_SEGMENT_LENGTH = 3 # as PacingPlanBF
+        self.tv_lambda = None
+
+    def _calculate_recommendations(self, verbose):
+        segment_lengths = self.get_segment_lengths()
+        paces, self.tv_lambda = fit_total_variation(self.optimal_paces, segment_lengths, self.total_paces,
+                                                    min_segment_length=self.MIN_SEGMENT_LENGTH)
+        self.true_paces_full = paces * self.target_time / np.dot(paces, segment_lengths)
+        if verbose:
+            print(f'Total variation lambda: {self.tv_lambda:.6g}')
+        return self.true_paces_full
+
 class PacingPlanAvgPacePerMile(PacingPlanStatic):
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
 
     def _calculate_recommendations(self, verbose):
         self.pace_per_mile = self.get_pace_per_mile(self.optimal_paces)
-        for i in range(self.get_n_segments()):
-            mile = int(self.race_course.start_distances[i])
-            self.true_paces_full[i] = self.pace_per_mile[mile]
+        miles = self.race_course.start_distances.astype(int)
+        self.true_paces_full = self.pace_per_mile[miles]
         return self.true_paces_full
 
 class PacingPlanAvgPace(PacingPlanStatic):
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
 
     def _calculate_recommendations(self, verbose):
         avg_pace = self.target_time / self.race_course.total_distance
@@ -510,145 +736,16 @@ class PacingPlanAvgPace(PacingPlanStatic):
         return self.true_paces_full
 
 class PacingPlanSegmenting(PacingPlanStatic):
-    MIN_HILL_DISTANCE = 350*utils.Conversions.METERS_TO_MILES.value # 350 Meters in Miles
-    MIN_HILL_HEIGHT = 30    # Feet
-    MIN_UPHILL_GRADE = 2    # Grade (smoothed)
-    MIN_DOWNHILL_GRADE = 3  # Grade (smoothed)
-    MIN_SEGMENT_LENGTH = .25    # Miles
+    HILL_THRESHOLDS = hill_detection.HillThresholds()
     
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         
     def _calculate_recommendations(self, verbose):
-        self.race_course.smoothen_segments(smoothen="gaussian") # Window should be 3
-        grades = self.race_course.grades
-        start_distances = self.race_course.start_distances
-        end_distances = self.race_course.end_distances
-        elevations = self.race_course.elevations
+        hills = self.context.get_hills(self.HILL_THRESHOLDS)
         distances = self.race_course.segment_lengths
-        
-        uphills, downhills = PacingPlanSegmenting.detect_hills(grades, start_distances, end_distances, elevations, 
-            PacingPlanSegmenting.MIN_UPHILL_GRADE, PacingPlanSegmenting.MIN_DOWNHILL_GRADE, PacingPlanSegmenting.MIN_HILL_DISTANCE, PacingPlanSegmenting.MIN_HILL_HEIGHT)
-
-        segments = PacingPlanSegmenting.get_spanning_segments(distances, elevations*utils.Conversions.FEET_TO_MILES.value, uphills, downhills, PacingPlanSegmenting.MIN_SEGMENT_LENGTH)
-        self.segments = segments
-        for segment in segments:
+        self.segments = list(hills.segments)
+        for segment in self.segments:
             start, end = segment
             self.true_paces_full[start:end+1] = utils.calculate_segment_pace(start, end, distances, self.optimal_paces)
         return self.true_paces_full
-
-    @staticmethod
-    def detect_hills(grades, start_distances, end_distances, elevations, uphill_cutoff, downhill_cutoff, min_length, min_height):    
-        significant_uphills = (grades >= uphill_cutoff)
-        significant_downhills = (grades <= -downhill_cutoff)
-
-        uphill_segments = PacingPlanSegmenting.find_continuous_segments(significant_uphills, grades)
-        downhill_segments = PacingPlanSegmenting.find_continuous_segments(significant_downhills, -grades)
-        
-        filtered_uphill_segments = PacingPlanSegmenting.filter_short_segments(uphill_segments, min_length, start_distances, end_distances)
-        filtered_downhill_segments = PacingPlanSegmenting.filter_short_segments(downhill_segments, min_length, start_distances, end_distances)
-        
-        filtered_uphill_segments = PacingPlanSegmenting.filter_short_hills(filtered_uphill_segments, min_height, elevations)
-        filtered_downhill_segments = PacingPlanSegmenting.filter_short_hills(filtered_downhill_segments, min_height, elevations)
-
-        return filtered_uphill_segments, filtered_downhill_segments
-    
-    @staticmethod
-    def filter_short_segments(segments, min_length, start_distances, end_distances):
-        return [(start, end) for start, end in segments if end_distances[end] - start_distances[start] >= min_length]
-
-    @staticmethod
-    def filter_short_hills(segments, min_height, elevations):
-        result = [(start, end) for start, end in segments if max(elevations[start:end+1]) - min(elevations[start:end+1]) >= min_height]
-        return result
-    
-    @staticmethod
-    def find_continuous_segments(hills, grades):
-        segments = []
-        start = None
-        n = len(hills)
-        i = 0
-        
-        while i < n:
-            is_significant = hills[i]
-            if is_significant:
-                if start is None:
-                    start = i
-                i += 1
-            else:
-                i += 1
-                if start is not None:
-                    adjusted_start = PacingPlanSegmenting.adjust_point(start, grades, -1)
-                    adjusted_end = PacingPlanSegmenting.adjust_point(i - 2, grades, 1)
-                    segments.append((adjusted_start, adjusted_end))
-                    start = None
-                    i = adjusted_end + 1
-                    
-        if start is not None:
-            adjusted_start = PacingPlanSegmenting.adjust_point(start, grades, -1)
-            adjusted_end = n - 1
-            segments.append((adjusted_start, adjusted_end))
-
-        return segments
-
-    @staticmethod
-    def adjust_point(index, grades, coeff=1):
-        n = len(grades)
-        while index > 0 and index < n-1 and grades[index + coeff] >= 0:
-            index += coeff
-        return index
-
-    @staticmethod
-    def get_spanning_segments(distances, elevations, uphill_segments, downhill_segments, min_segment_length):
-        all_segments = sorted(uphill_segments + downhill_segments, key=lambda x: x[0])
-        full_course_segments = []
-        filler_segments = []
-        total_segments = len(distances)
-        
-        current_start = 0
-        for (start, end) in all_segments:
-            if current_start < start:
-                full_course_segments.append((current_start, start - 1))
-                filler_segments.append((current_start, start - 1))
-            full_course_segments.append((start, end))        
-            current_start = end + 1
-        if current_start < total_segments:
-            full_course_segments.append((current_start, total_segments - 1))
-            filler_segments.append((current_start, total_segments - 1))
-
-        return PacingPlanSegmenting.merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length)
-
-    @staticmethod
-    def merge_filler_segments(distances, elevations, filler_segments, full_course_segments, min_segment_length):
-        merged_segments = []
-        remove_next_segment = False
-        for i, (start, end) in enumerate(full_course_segments):
-            if (start, end) in filler_segments:
-                segment_distance = sum(distances[start:end+1])
-                if segment_distance < min_segment_length:
-                    prev_segment = full_course_segments[i-1] if i > 0 else None
-                    next_segment = full_course_segments[i+1] if i < len(full_course_segments) - 1 else None
-
-                    segment_grade = utils.calculate_segment_grade(start, end, elevations, distances)
-                    prev_grade = utils.calculate_segment_grade(prev_segment[0], prev_segment[1], elevations, distances) if prev_segment else None
-                    next_grade = utils.calculate_segment_grade(next_segment[0], next_segment[1], elevations, distances) if next_segment else None
-
-                    prev_grade_distance = abs(prev_grade - segment_grade) if prev_segment else None
-                    next_grade_distance = abs(next_grade - segment_grade) if next_segment else None
-                    
-                    # Merge with the more similar adjacent segment
-                    if prev_segment and (prev_grade_distance <= next_grade_distance or not next_segment):
-                        merged_segments[-1] = (prev_segment[0], end)
-                    elif next_segment:
-                        merged_segments.append((start, next_segment[1])) # Assume next segment is not in filler
-                        remove_next_segment = True
-                    else:
-                        merged_segments.append((start, end))
-                else:
-                    merged_segments.append((start, end))
-            else:
-                if remove_next_segment:
-                    remove_next_segment = False
-                else:
-                    merged_segments.append((start, end))
-        return merged_segments
\ No newline at end of file
@@ -1,11 +1,13 @@
+import time
 import numpy as np
 import cvxpy as cp
 from abc import ABC, abstractmethod
 from pacing_plan import PacingPlanStatic
+import pacing_dp
 
 class PacingPlanLP(PacingPlanStatic, ABC):
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.paces = None
 
     @abstractmethod
@@ -42,22 +44,63 @@ class PacingPlanLP(PacingPlanStatic, ABC):
         return cp.Problem(objective, constraints)
 
     def solve_lp_problem(self):
+        """
+        Solves the MILP. With a deadline, the solver stops at it and its best incumbent is kept,
+        with the solver's bound on the objective; without an incumbent the greedy plan is kept.
+        The problem is canonicalized first, so the solver only gets the time that is left.
+        """
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return
         problem = self.formulate_lp_problem()
-        problem.solve(solver=cp.GUROBI)
-        
+        if self.deadline is None:
+            problem.solve(solver=cp.GUROBI)
+        else:
+            try:
+                data, chain, inverse_data = problem.get_problem_data(cp.GUROBI)
+                time_limit = self.deadline - time.perf_counter()
+                if time_limit <= 0:
+                    return
+                solution = chain.solve_via_data(problem, data, solver_opts={'TimeLimit': time_limit})
+                problem.unpack_results(solution, chain, inverse_data)
+            except cp.SolverError:
+                return
+
         if problem.status == cp.OPTIMAL:
             self.true_paces_full = self.paces.value
-        else:
+            self.is_optimal, self.loss_bound = True, problem.value
+        elif self.deadline is not None and problem.status == cp.USER_LIMIT and self.paces.value is not None:
+            model = problem.solver_stats.extra_stats
+            self.true_paces_full = self.paces.value
+            # The solver's objective may leave out constant terms of problem.value
+            self.loss_bound = max(model.ObjBound + problem.value - model.ObjVal, 0.0)
+        elif self.deadline is None:
             raise ValueError("LP problem is infeasible")
 
+    def get_heuristic_paces(self):
+        """
+        Paces of the greedy plan with the same loss (see pacing_dp.solve_greedy), the plan kept
+        if the solver finds nothing before the deadline.
+        """
+        stats = self.context.get_interval_stats(self.loss_method)
+        breakpoints = pacing_dp.solve_greedy(stats, self.total_paces, 1, deadline=self.deadline).breakpoints
+        ends = np.append(breakpoints[1:], self.get_n_segments())
+        paces = self.interval_stats.get_weighted_paces(breakpoints, ends)
+        return np.repeat(paces, ends - breakpoints)
+
     def _calculate_recommendations(self, verbose):
+        self.is_optimal, self.loss_bound = False, None
+        if self.deadline is not None:
+            self.true_paces_full = self.get_heuristic_paces()
         self.solve_lp_problem()
+        if verbose and self.deadline is not None:
+            print(f'Anytime LP plan, optimal: {self.is_optimal}, lower bound: {self.loss_bound}')
         return self.true_paces_full
 
 class PacingPlanLPAbsolute(PacingPlanLP):
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.M = 1
+        self.loss_method = np.abs
     
     def define_variables(self):
         n_segments = self.get_n_segments()
@@ -68,7 +111,6 @@ class PacingPlanLPAbsolute(PacingPlanLP):
         return cp.Minimize(cp.sum(self.absolutes))
 
     def formulate_constraints(self):
-        n_segments = self.get_n_segments()
         constraints = [
             self.changes >= 0,
             self.changes <= 1,
@@ -76,14 +118,14 @@ class PacingPlanLPAbsolute(PacingPlanLP):
             self.absolutes >= self.paces - (self.optimal_paces),
             self.absolutes >= (self.optimal_paces) - self.paces
         ]
-        constraints += [self.M*self.changes[i] >= self.paces[i+1] - self.paces[i] for i in range(n_segments-1)]
-        constraints += [self.M*self.changes[i] >= self.paces[i] - self.paces[i+1] for i in range(n_segments-1)]
+        constraints += [self.M*self.changes >= cp.diff(self.paces), self.M*self.changes >= -cp.diff(self.paces)]
         return constraints
 
 class PacingPlanLPSquare(PacingPlanLP):
-    def __init__(self, race_course, target_time, total_paces):
-        super().__init__(race_course, target_time, total_paces)
+    def __init__(self, race_course, target_time, total_paces, context=None):
+        super().__init__(race_course, target_time, total_paces, context)
         self.M = 1
+        self.loss_method = np.square
     
     def define_variables(self):
         n_segments = self.get_n_segments()
@@ -93,12 +135,10 @@ class PacingPlanLPSquare(PacingPlanLP):
         return cp.Minimize(cp.sum_squares(self.paces - self.optimal_paces))
 
     def formulate_constraints(self):
-        n_segments = self.get_n_segments()
         constraints = [
             self.changes >= 0,
             self.changes <= 1,
             cp.sum(self.changes) == self.total_paces - 1,
         ]
-        constraints += [self.M*self.changes[i] >= self.paces[i+1] - self.paces[i] for i in range(n_segments-1)]
-        constraints += [self.M*self.changes[i] >= self.paces[i] - self.paces[i+1] for i in range(n_segments-1)]
+        constraints += [self.M*self.changes >= cp.diff(self.paces), self.M*self.changes >= -cp.diff(self.paces)]
         return constraints
\ No newline at end of file
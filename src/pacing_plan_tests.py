@@ -2,6 +2,7 @@ from pacing_plan import *
 from main import PACING_PLAN_METHODS
 from pacing_plan_lp import PacingPlanLPAbsolute, PacingPlanLPSquare
 from race_course import RealRaceCourse
+from planning_context import PlanningContext
 from utils import Conversions
 import os, shutil
 
@@ -47,12 +48,14 @@ def main():
             print(file_path)
 
     for course in courses:
+        target_time = course.total_distance*6
+        # Shared by every method on the course
+        context = PlanningContext(course, target_time)
         for name, value in methods.items():
             # try:
             total_paces = 1
-            target_time = course.total_distance*6
             pacing_plan_class = value
-            plan : PacingPlanStatic = pacing_plan_class(course, target_time, total_paces)
+            plan : PacingPlanStatic = pacing_plan_class(course, target_time, total_paces, context)
             
             course_directory = os.path.join(base_directory, course.course_name) 
             pacing_plan_directory = os.path.join(course_directory, name)
@@ -0,0 +1,88 @@
+import numpy as np
+import utils
+import pacing_dp
+import hill_detection
+import course_index
+
+class PlanningContext:
+    """
+    Course and goal derived arrays shared by every plan run on the same view of a course and
+    target time: the grade adjustments, the optimal paces and, built on first use, the interval
+    stats of each loss. Pass one to several PacingPlans, SegmentingPlans and the
+    OptimalPacingCalculator so the precompute is done once. target_time may be None for
+    segmenting plans, which need no paces.
+
+    The context keeps the view's arrays, so it must be rebuilt after the course's view or grades
+    change (see matches).
+    """
+    def __init__(self, race_course, target_time=None):
+        self.race_course = race_course
+        self.target_time = target_time
+        self.grades = race_course.grades
+        self.segment_lengths = race_course.segment_lengths
+        self.adjustments = utils.get_pace_adjustments(self.grades)
+
+        self.base_pace = None
+        self.optimal_paces = None
+        self.optimal_seg_times = None
+        if target_time is not None:
+            self.base_pace = (target_time - np.dot(self.adjustments, self.segment_lengths)) / np.sum(self.segment_lengths)
+            self.optimal_paces = np.full(self.grades.shape, self.base_pace) + self.adjustments
+            self.optimal_seg_times = np.multiply(self.segment_lengths, self.optimal_paces)
+            # Shared by every plan of the context, so no plan may modify them
+            self.optimal_paces.flags.writeable = False
+            self.optimal_seg_times.flags.writeable = False
+        self.adjustments.flags.writeable = False
+        self._interval_stats = {}
+
+    def matches(self, race_course, target_time=None):
+        """
+        Whether the context holds the current view of [race_course], for [target_time] if given.
+        """
+        return (race_course is self.race_course and race_course.grades is self.grades
+                and race_course.segment_lengths is self.segment_lengths
+                and (target_time is None or target_time == self.target_time))
+
+    def check(self, race_course, target_time=None):
+        """
+        Raises ValueError unless the context matches [race_course] and [target_time].
+        """
+        if not self.matches(race_course, target_time):
+            raise ValueError(f"The planning context is for another course, view or target time "
+                             f"(context target time: {self.target_time}, plan target time: {target_time})")
+
+    def get_interval_stats(self, loss_method=None):
+        """
+        pacing_dp stats of the optimal paces for [loss_method] (np.square or np.abs, see
+        pacing_dp.get_interval_stats), or if None the weighted square stats, for the weighted
+        paces alone. Built once.
+        """
+        if loss_method is None:
+            return self.get_weighted_square_stats()
+        if self.optimal_paces is None:
+            raise ValueError("The planning context has no target time, so no optimal paces")
+        if loss_method not in self._interval_stats:
+            self._interval_stats[loss_method] = pacing_dp.get_interval_stats(loss_method, self.optimal_paces, self.segment_lengths)
+        return self._interval_stats[loss_method]
+
+    def get_weighted_square_stats(self):
+        """
+        pacing_dp.WeightedSquaredErrorStats of the optimal paces (as used by PELT). Built once.
+        """
+        if self.optimal_paces is None:
+            raise ValueError("The planning context has no target time, so no optimal paces")
+        if 'weighted_square' not in self._interval_stats:
+            self._interval_stats['weighted_square'] = pacing_dp.WeightedSquaredErrorStats(self.optimal_paces, self.segment_lengths)
+        return self._interval_stats['weighted_square']
+
+    def get_hills(self, thresholds=None):
+        """
+        Hills of the course (see hill_detection.get_course_hills, which caches them per view).
+        """
+        return hill_detection.get_course_hills(self.race_course, thresholds)
+
+    def get_course_index(self):
+        """
+        Spatial index of the course's segments (see course_index.get_course_index, which caches it per view).
+        """
+        return course_index.get_course_index(self.race_course)
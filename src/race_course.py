@@ -2,8 +2,13 @@ import gpx_parser
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import ndimage
-from utils import Conversions, Unit, SegmentType, calculate_grade, calculate_distance
+from utils import Conversions, Unit, SegmentType, calculate_grade_scalar, calculate_distance
 import segment_view
+import instrumentation
+import smoothing
+import simplify
+import gpx_cleaning
+import dem
 
 import os
 
@@ -15,68 +20,36 @@ class RaceCourse:
     def __init__(self, name):
         self.course_name = name
     
-    # TODO find some better arg values for smoothening function...
-    def smoothen_segments(self, smoothen: str = "running_avg", *args):
+    RUNNING_AVG_WINDOW = 3      # Segments
+    GAUSSIAN_SIGMA = 3          # Segments
+    LOESS_BANDWIDTH = 5         # Mean segment lengths
+
+    def smoothen_segments(self, smoothen: str = "running_avg", **kwargs):
         '''
-        Smoothens the segments in this racecourse. NOTE: Only {running_avg} modifies segment data!
-        Others directly modify self.grades and self.elevation_changes
+        Returns a smoothed copy of the grades of this racecourse. The course itself is not modified.
 
-        running_avg:    Box filter
-        loess:          LOESS regression
-        gaussian        1 4 6 4 1 filter
+        running_avg:    Distance weighted box filter (window_size segments)
+        loess:          LOESS regression with a tricube kernel (bandwidth in course distance units)
+        gaussian:       Gaussian filter (sigma segments, optionally distance weighted)
 
-        :param str type: How to smoothen the course.
+        :param str smoothen: How to smoothen the course.
         '''
+        segment_lengths = self.end_distances - self.start_distances
         if smoothen == "running_avg":
-            WINDOW_SIZE = 3
-            elevation = 0
-            grade = 0
-            slope_angle = 0
-            dist = 0
-
-            if len(self.segments) < WINDOW_SIZE:
-                return
-
-            # create an average window
-            for i in range(WINDOW_SIZE):
-                weight = self.segments[i].distance
-                elevation += self.segments[i].elevation_change * weight
-                grade += self.segments[i].grade * weight
-                slope_angle += self.segments[i].slope_angle * weight
-                dist += weight
-            
-            # iterate window through segments, skipping edges of filter
-            for i in range(WINDOW_SIZE // 2, len(self.segments) - WINDOW_SIZE // 2):
-                # update condition for the window, skip first instance since already computed
-                if i != WINDOW_SIZE // 2:
-                    # add new value
-                    weight = self.segments[i + WINDOW_SIZE // 2].distance
-                    elevation += self.segments[i + WINDOW_SIZE // 2].elevation_change * weight
-                    grade += self.segments[i + WINDOW_SIZE // 2].grade * weight
-                    slope_angle += self.segments[i + WINDOW_SIZE // 2].slope_angle * weight
-                    dist += weight
-
-                    # remove old value
-                    weight = self.segments[i - WINDOW_SIZE // 2].distance
-                    elevation -= self.segments[i - WINDOW_SIZE // 2].elevation_change * weight
-                    grade -= self.segments[i - WINDOW_SIZE // 2].grade * weight
-                    slope_angle -= self.segments[i - WINDOW_SIZE // 2].slope_angle * weight
-                    dist -= weight
-
-                self.segments[i].elevation_change = elevation / dist
-                self.segments[i].grade = grade / dist
-                self.segments[i].slope_angle = slope_angle / dist
-
-                self.grades = np.array([self.segments[i].grade for i in range(len(self.segments))])
-                self.elevation_changes = np.array([self.segments[i].elevation_change for i in range(len(self.segments))])
-
+            window_size = kwargs.get("window_size", self.RUNNING_AVG_WINDOW)
+            grades = smoothing.running_average(self.grades, segment_lengths, window_size)
         elif smoothen == "loess":
-            raise RuntimeError(f"Unimplemented smoothening argument: {smoothen}")
+            bandwidth = kwargs.get("bandwidth", self.LOESS_BANDWIDTH * self.total_distance / len(segment_lengths))
+            midpoints = self.start_distances + segment_lengths / 2
+            grades = smoothing.loess(midpoints, self.grades, bandwidth)
         elif smoothen == "gaussian":
-            gaus_sigma = 3    # TODO find a better value?
-            self.grades = np.array(ndimage.gaussian_filter1d(self.grades, gaus_sigma))
+            sigma = kwargs.get("sigma", self.GAUSSIAN_SIGMA)
+            weights = segment_lengths if kwargs.get("distance_weighted", False) else None
+            grades = smoothing.gaussian(self.grades, sigma, weights)
         else:
             raise RuntimeError(f"Unrecognized smmothening argument: {smoothen}!")
+        grades.flags.writeable = False
+        return grades
 
     def gen_course_plot(self, file_path):
         fig,ax = plt.subplots()
@@ -104,35 +77,59 @@ class RaceCourse:
 
 class RealRaceCourse(RaceCourse):
 
-    def __init__(self, name, file_path, N_SEGMENTS=100):
+    def __init__(self, name, file_path, N_SEGMENTS=100, elevation_tolerance=None, track_tolerance=None, dem_directory=None,
+                 spike_window=gpx_cleaning.SPIKE_WINDOW, spike_threshold=gpx_cleaning.SPIKE_THRESHOLD):
+        '''
+        :param elevation_tolerance: if given (in meters), the course uses variable length segments
+            that follow the elevation profile within this tolerance (see SegmentViewAdaptive)
+        :param track_tolerance: if given (in meters), raw GPX points are simplified before any view is
+            built, keeping every dropped point within this distance of the track (see simplify_track)
+        :param dem_directory: if given, a directory of SRTM .hgt tiles whose elevations replace the
+            GPX elevations wherever they cover the track (see dem.correct_elevations)
+        :param spike_window: meters of track the elevation spike filter compares each point with
+        :param spike_threshold: meters an elevation may differ from the median of its window before
+            it is clamped, None to keep every elevation (see gpx_cleaning.clean_track)
+        '''
         super().__init__(name)
         self.units = Unit.METRIC
         self.file_path = file_path
         
-        lats, lons, raw_elevations = gpx_parser.parse_gpx(file_path)
-        lats = np.array(lats)
-        lons = np.array(lons)
-        raw_seg_lengths = calculate_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
-        raw_elevations = np.array(raw_elevations)
-        
-        if np.isnan(raw_elevations).any():
-            raise ValueError("nan values found in elevations")
-        
-        valid_indices = raw_seg_lengths != 0 # TODO: remove after interpolation pipeline is complete
-        valid_indices_appended = np.append(valid_indices, True)
-        segment_lengths = raw_seg_lengths[valid_indices]
-
-        lats = lats[valid_indices_appended]
-        lons = lons[valid_indices_appended]
-        elevations = raw_elevations[valid_indices_appended]
-
-        metric_view = segment_view.SegmentViewMetric(SegmentType.VARIABLE, lats, lons, segment_lengths, elevations)
-        imperial_view = segment_view.SegmentViewImperial(metric_view)
-        interpolated_unif = segment_view.SegmentViewInterpUniform(metric_view, N_SEGMENTS)
-        smoothed_gaussian = segment_view.SegmentViewSmoothedGaussian(interpolated_unif, sigma = 3)
-        final_imperial = segment_view.SegmentViewImperial(smoothed_gaussian)
+        with instrumentation.span('parse'):
+            lats, lons, raw_elevations = gpx_parser.parse_gpx(file_path)
+
+        with instrumentation.span('clean'):
+            lats, lons, elevations, segment_lengths, self.cleaning_report = gpx_cleaning.clean_track(
+                lats, lons, raw_elevations, spike_window=spike_window, spike_threshold=spike_threshold)
+
+        self.dem_report = None
+        if dem_directory is not None:
+            with instrumentation.span('dem'):
+                elevations, self.dem_report = dem.correct_elevations(lats, lons, elevations, dem.get_tile_cache(dem_directory))
+
+        self.simplification_report = None
+        if track_tolerance is not None:
+            with instrumentation.span('simplify'):
+                self.simplification_report = simplify.simplify_track(lats, lons, elevations, track_tolerance)
+                keep = self.simplification_report.keep
+                lats = lats[keep]
+                lons = lons[keep]
+                elevations = elevations[keep]
+                segment_lengths = calculate_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+        with instrumentation.span('views'):
+            metric_view = segment_view.SegmentViewMetric(SegmentType.VARIABLE, lats, lons, segment_lengths, elevations)
+            self.metric_view = metric_view
+            imperial_view = segment_view.SegmentViewImperial(metric_view)
+            interpolated_unif = segment_view.SegmentViewInterpUniform(metric_view, N_SEGMENTS)
+            smoothed_gaussian = segment_view.SegmentViewSmoothedGaussian(interpolated_unif, sigma = 3)
+            final_imperial = segment_view.SegmentViewImperial(smoothed_gaussian)
+            if elevation_tolerance is not None:
+                self.adaptive_view = segment_view.SegmentViewImperial(segment_view.SegmentViewAdaptive(metric_view, elevation_tolerance))
         # self.change_view(final_imperial)
-        self.change_view(imperial_view)
+        if elevation_tolerance is not None:
+            self.change_view(self.adaptive_view)
+        else:
+            self.change_view(imperial_view)
 
     def change_view(self, view: segment_view.SegmentView):
         self.n_segments = view.n_segments
@@ -164,57 +161,172 @@ class RealRaceCourse(RaceCourse):
         
         self.units = Unit.IMPERIAL
 
-class RandomRaceCourse(RaceCourse):
-    # TODO: hard coded smoothing values 
-    # TODO: use more sophisticated smoothing method
-    def smooth_attribute(self, attribute, param=10):
-        smoothing_factor = max(int(self.n_segments/param), 1)
-        smoothing_factor -= smoothing_factor % 2 == 0
-        pad_width = int(smoothing_factor / 2)
-        padded_attribute = np.pad(attribute, pad_width, 'edge')
-        result = np.convolve(padded_attribute, np.ones(smoothing_factor), 'valid') / smoothing_factor
-        return result
-    
-    def apply_smoothing(self):
-        self.elevation_changes = self.smooth_attribute(self.elevation_changes, param=10)
+# Synthetic courses run due north along a meridian, where the haversine distance between points
+# is exactly the difference in latitude, so exported tracks reproduce their segment lengths.
+RANDOM_COURSE_START = (42.0, -76.5) # lat, lon in degrees
+EARTH_RADIUS_METERS = 6371 * 1000
 
-    def __init__(self, name, n_segments, total_dist, use_smoothing=True):
-        super().__init__(name)
-        self.n_segments = n_segments
+class RandomCourseBatch:
+    """
+    Stacked arrays of [n_courses] random courses of [n_segments] each, in miles and feet. Row i of
+    every array belongs to course i; get_course(i) wraps a row as a RandomRaceCourse.
+    """
+    def __init__(self, name, segment_lengths, elevation_changes):
+        self.name = name
+        self.n_courses, self.n_segments = segment_lengths.shape
+        self.segment_lengths = segment_lengths # n_courses x n_segments
+        self.elevation_changes = elevation_changes # n_courses x n_segments
+        self.grades = calculate_grade_scalar(elevation_changes * Conversions.FEET_TO_MILES.value, segment_lengths)
+        self.total_distances = segment_lengths.sum(axis=1)
+
+        # elevations start at 0 at the lowest point of each course
+        elevations = np.zeros((self.n_courses, self.n_segments + 1))
+        np.cumsum(elevation_changes, axis=1, out=elevations[:, 1:])
+        self.elevations = elevations - elevations.min(axis=1, keepdims=True) # n_courses x n_segments + 1
+
+    def __len__(self):
+        return self.n_courses
 
-        avg_segment_dist = total_dist / n_segments
-        margin = avg_segment_dist * 0.5
-        seg_low = avg_segment_dist - margin
-        seg_high = avg_segment_dist + margin
+    def get_distances(self):
+        distances = np.zeros((self.n_courses, self.n_segments + 1))
+        np.cumsum(self.segment_lengths, axis=1, out=distances[:, 1:])
+        return distances # n_courses x n_segments + 1
 
-        self.distances = np.random.uniform(low=seg_low, high=seg_high, size=n_segments) # miles
-                
-        # TODO: improve hardcoded 100 value
-        ELEVATION_SCALE = 100 * avg_segment_dist
+    def get_coordinates(self):
+        """
+        Returns the lats and lons (n_courses x n_segments + 1) of the courses laid out due north.
+        """
+        start_lat, start_lon = RANDOM_COURSE_START
+        meters = self.get_distances() * Conversions.MILES_TO_METERS.value
+        lats = start_lat + np.degrees(meters / EARTH_RADIUS_METERS)
+        lons = np.full_like(lats, start_lon)
+        return lats, lons
 
-        self.elevation_changes = np.random.normal(loc=0, scale=ELEVATION_SCALE, size=n_segments) 
+    def get_course(self, i):
+        return RandomRaceCourse.from_arrays(f'{self.name} {i}', self.segment_lengths[i], self.elevation_changes[i])
 
-        if use_smoothing:
-            self.apply_smoothing()
+    def gen_gpx_files(self, directory, start_index=0):
+        """
+        Writes every course of the batch to [directory] as a gpx file, one course at a time.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        lats, lons = self.get_coordinates()
+        elevations = self.elevations * Conversions.FEET_TO_METERS.value
+        file_paths = []
+        for i in range(self.n_courses):
+            course_name = f'{self.name}-{start_index + i:05d}'
+            file_path = os.path.join(directory, f'{course_name}.gpx')
+            gpx_parser.gen_gpx(file_path, lats[i], lons[i], elevations[i], name=course_name)
+            file_paths.append(file_path)
+        return file_paths
 
-        self.distances = self.distances * total_dist / (sum(self.distances))
-        self.grades = calculate_grade(self.elevation_changes * Conversions.FEET_TO_MILES.value ,self.distances) 
-        self.total_distance = total_dist
+def smooth_rows(values, n_segments, param=10):
+    """
+    Centered box filter along the rows of [values], with edge padding and a window of about
+    n_segments/param (rounded down to an odd number) segments.
+    """
+    smoothing_factor = max(int(n_segments/param), 1)
+    smoothing_factor -= smoothing_factor % 2 == 0
+    return ndimage.uniform_filter1d(values, smoothing_factor, axis=-1, mode='nearest')
+
+def generate_random_courses(n_courses, n_segments, total_dist, hilliness=1.0, seed=None, use_smoothing=True, name='random', first_course=0):
+    """
+    Generates a RandomCourseBatch. Every course draws from its own generator spawned from [seed], so
+    course i is the same no matter how many courses are generated at once. [hilliness] scales the
+    size of the elevation changes.
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # Same children as seed_sequence.spawn(), but without advancing its spawn counter
+    generators = [
+        np.random.default_rng(np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (i,), pool_size=seed_sequence.pool_size))
+        for i in range(first_course, first_course + n_courses)
+    ]
+
+    avg_segment_dist = total_dist / n_segments
+    margin = avg_segment_dist * 0.5
+    seg_low = avg_segment_dist - margin
+    seg_high = avg_segment_dist + margin
+    # TODO: improve hardcoded 100 value
+    elevation_scale = 100 * avg_segment_dist * hilliness
+
+    segment_lengths = np.empty((n_courses, n_segments))
+    elevation_changes = np.empty((n_courses, n_segments))
+    for i, rng in enumerate(generators):
+        segment_lengths[i] = rng.uniform(low=seg_low, high=seg_high, size=n_segments) # miles
+        elevation_changes[i] = rng.normal(loc=0, scale=elevation_scale, size=n_segments) # feet
+
+    if use_smoothing:
+        elevation_changes = smooth_rows(elevation_changes, n_segments, param=10)
+    segment_lengths *= total_dist / segment_lengths.sum(axis=1, keepdims=True)
+    return RandomCourseBatch(name, segment_lengths, elevation_changes)
+
+def stream_random_courses(n_courses, n_segments, total_dist, batch_size=64, hilliness=1.0, seed=None, use_smoothing=True, name='random'):
+    """
+    Yields RandomCourseBatches of at most [batch_size] courses, so thousands of large courses can be
+    generated without holding them all in memory. The courses match generate_random_courses.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    for first_course in range(0, n_courses, batch_size):
+        yield generate_random_courses(min(batch_size, n_courses - first_course), n_segments, total_dist, hilliness,
+                                      seed_sequence, use_smoothing, name, first_course)
+
+def gen_random_gpx_files(directory, n_courses, n_segments, total_dist, batch_size=64, hilliness=1.0, seed=None, use_smoothing=True, name='random'):
+    """
+    Streams random courses to gpx files in [directory] batch by batch. Returns the file paths.
+    """
+    file_paths = []
+    first_course = 0
+    for batch in stream_random_courses(n_courses, n_segments, total_dist, batch_size, hilliness, seed, use_smoothing, name):
+        file_paths += batch.gen_gpx_files(directory, start_index=first_course)
+        first_course += len(batch)
+    return file_paths
+
+class RandomRaceCourse(RaceCourse):
+    # TODO: use more sophisticated smoothing method
+    def __init__(self, name, n_segments, total_dist, use_smoothing=True, rng=None, hilliness=1.0):
+        '''
+        :param rng: seed or np.random.SeedSequence making the course reproducible
+        '''
+        batch = generate_random_courses(1, n_segments, total_dist, hilliness, rng, use_smoothing)
+        self._init_from_arrays(name, batch.segment_lengths[0], batch.elevation_changes[0])
+
+    @classmethod
+    def from_arrays(cls, name, segment_lengths, elevation_changes):
+        course = cls.__new__(cls)
+        course._init_from_arrays(name, segment_lengths, elevation_changes)
+        return course
+
+    def _init_from_arrays(self, name, segment_lengths, elevation_changes):
+        super().__init__(name)
+        self.units = Unit.IMPERIAL
+        self.n_segments = len(segment_lengths)
+        self.distances = segment_lengths # miles
+        self.segment_lengths = segment_lengths
+        self.elevation_changes = elevation_changes # feet
+        self.grades = calculate_grade_scalar(self.elevation_changes * Conversions.FEET_TO_MILES.value, self.distances)
+        self.total_distance = segment_lengths.sum()
         self.end_distances = np.cumsum(self.distances)
         self.start_distances = np.roll(self.end_distances,1)
         self.start_distances[0] = 0
         self.gen_elevations()
 
+        batch = RandomCourseBatch(name, segment_lengths[None, :], elevation_changes[None, :])
+        lats, lons = batch.get_coordinates()
+        self.lats = lats[0]
+        self.lons = lons[0]
+
     def gen_elevations(self):
         
         self.end_elevations = np.cumsum(self.elevation_changes)
         self.start_elevations = np.roll(self.end_elevations,1)
         self.start_elevations[0] = 0
 
-        min_val = min(self.end_elevations)
+        min_val = min(0, min(self.end_elevations))
 
         self.start_elevations -= min_val
         self.end_elevations -= min_val
+        self.elevations = np.append(self.start_elevations, self.end_elevations[-1])
     
 def main():
     courses = ['FH-Fox', 'boston' 'wineglass', 'lakefront', 'staten-half-elev']
@@ -4,9 +4,11 @@ import json
 import numpy as np
 from segmenting_plan import *
 from optimal_pacing_calculator import OptimalPacingCalculator
+from planning_context import PlanningContext
 import race_course
 import logging
 import sys
+import instrumentation
 
 # Define available segmenting methods
 SEGMENTING_METHODS = {
@@ -28,30 +30,44 @@ def init_parser() -> argparse.ArgumentParser:
     [OPTIONAL]
     -o, --output ==> directory for saving the output files (default: results)
     -v, --verbose   ==> verbose mode for debugging
+    --timings       ==> enable instrumentation and save the recorded spans to this json file
+    --trace-memory  ==> with --timings, also record the peak traced memory of each span (slower)
+    --memory-budget ==> megabytes the optimal paces may use, larger courses are refused up front
+    --dem           ==> directory of SRTM .hgt tiles replacing the GPX elevations
+    --elevation-tolerance ==> meters, variable length segments following the elevation profile within it
+    --track-tolerance ==> meters, simplify the raw GPX points within it before building the course
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--file", help="Path to the GPX file", required=True)
     parser.add_argument("-t", "--time", help="Goal time in minutes to complete the course", required=True)
     parser.add_argument("-o", "--output", help="Output directory (default: current directory)", default="results")
     parser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("--timings", help="Enable instrumentation and save per-stage timings to this json file")
+    parser.add_argument("--trace-memory", action="store_true", help="With --timings, also record the peak traced memory of each stage (slower)")
+    parser.add_argument("--memory-budget", type=float, default=None, help="Megabytes the optimal paces may use, larger courses are refused up front")
+    parser.add_argument("--dem", default=None, help="Directory of SRTM .hgt tiles whose elevations replace the GPX elevations")
+    parser.add_argument("--elevation-tolerance", type=float, default=None, help="Meters, use variable length segments that follow the elevation profile within it")
+    parser.add_argument("--track-tolerance", type=float, default=None, help="Meters, simplify the raw GPX points within it before building the course")
     return parser
 
 
-def process_segments(course, methods, output_dir, verbose=False):
+def process_segments(course, methods, output_dir, verbose=False, context=None):
     """
-    Process the segments using the given segmenting methods.
+    Process the segments using the given segmenting methods, sharing the PlanningContext of the course.
     """
     segments = {}
 
     for method_name, method_class in methods.items():
         if verbose:
             print(f"Processing with segmenting method: {method_name}")
-        plan = method_class(course)
-        segment_indices = plan.calculate_segments()
+        with instrumentation.span(f"segments_{method_name}"):
+            plan = method_class(course, context)
+            segment_indices = plan.calculate_segments()
         segments[method_name] = segment_indices
 
         plot_path = os.path.join(output_dir, f"{method_name}_segments_plot.jpg")
-        plan.plot_segments(plot_path, title=f"Segments - {method_name}")
+        with instrumentation.span(f"plot_{method_name}"):
+            plan.plot_segments(plot_path, title=f"Segments - {method_name}")
         
         if verbose:
             print(f"Saved plot to {plot_path}")
@@ -82,10 +98,11 @@ def save_frontend_files(course, target_time, segments, optimal_paces, output_dir
     }
 
     # Save each key in separate JSON files for clarity
-    for key, value in frontend_data.items():
-        file_path = os.path.join(output_dir, f"{key}.json")
-        with open(file_path, "w") as json_file:
-            json.dump(value, json_file, indent=4)
+    with instrumentation.span("export"):
+        for key, value in frontend_data.items():
+            file_path = os.path.join(output_dir, f"{key}.json")
+            with open(file_path, "w") as json_file:
+                json.dump(value, json_file, indent=4)
 
     print("Frontend files saved successfully.")
 
@@ -97,9 +114,14 @@ def main():
     target_time = float(args.time)
     verbose = args.verbose
 
+    if args.timings:
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+        instrumentation.enable(trace_memory=args.trace_memory)
+
     # Parse the course
     course_name = os.path.basename(file_path).split('.')[0]
-    course = race_course.RealRaceCourse(course_name, file_path)
+    course = race_course.RealRaceCourse(course_name, file_path, elevation_tolerance=args.elevation_tolerance,
+                                        track_tolerance=args.track_tolerance, dem_directory=args.dem)
 
     output_dir = args.output
     if args.output == "results":
@@ -110,17 +132,32 @@ def main():
 
     if verbose:
         print(f"Parsed course: {course_name}")
-
-    # Calculate optimal paces
-    optimal_pace_calculator = OptimalPacingCalculator(course, target_time)
-    weighted_paces = optimal_pace_calculator.calculate_weighted_paces()
+        if not course.cleaning_report.is_clean():
+            print(course.cleaning_report)
+        if course.dem_report is not None:
+            print(course.dem_report)
+        if course.simplification_report is not None:
+            print(course.simplification_report)
+
+    # Calculate optimal paces (the weighted paces are built by the constructor)
+    with instrumentation.span("optimal_paces"):
+        context = PlanningContext(course, target_time)
+        if args.memory_budget is None:
+            optimal_pace_calculator = OptimalPacingCalculator(course, target_time, context=context)
+        else:
+            optimal_pace_calculator = OptimalPacingCalculator(course, target_time, int(args.memory_budget * 2**20), context)
+        weighted_paces = optimal_pace_calculator.get_weighted_paces()
 
     # Process segmenting methods
-    segments = process_segments(course, SEGMENTING_METHODS, output_dir, verbose=verbose)
+    segments = process_segments(course, SEGMENTING_METHODS, output_dir, verbose=verbose, context=context)
 
     # Save frontend files
     save_frontend_files(course, target_time, segments, weighted_paces, output_dir)
 
+    if args.timings:
+        instrumentation.save_spans(args.timings)
+        instrumentation.log_spans(logging.getLogger(__name__), course=course_name)
+
     print("Processing complete.")
 
 if __name__ == "__main__":
@@ -3,6 +3,7 @@ from utils import SegmentType, Unit, Conversions, calculate_grade
 import warnings
 from scipy.ndimage import gaussian_filter1d
 import scipy
+import simplify
 
 class SegmentView:
     def __init__(self, segment_type, lats, lons, segment_lengths, elevations, grades=None):
@@ -74,11 +75,31 @@ class SegmentViewInterpUniform(SegmentViewInterpolated):
     def __init__(self, view: SegmentViewMetric, n_segments):
         x_step = view.total_distance / n_segments
         full_distances = np.arange(n_segments+1) * x_step
+        full_distances[-1] = view.total_distance # avoid floating point overshoot of the interpolation range
         segment_lengths = np.full(n_segments, x_step)
         segment_type = SegmentType.UNIFORM
         should_interpolate = True
         super().__init__(view, should_interpolate, loaded_elevations=None, segment_type=segment_type, full_distances=full_distances, segment_lengths=segment_lengths)
 
+class SegmentViewAdaptive(SegmentViewInterpolated):
+    def __init__(self, view: SegmentViewMetric, tolerance, max_segment_length=None):
+        """
+        Variable length segments whose piecewise linear elevation profile stays within [tolerance]
+        (vertical, in the elevation units of the view) of every point of [view]. Segments longer
+        than [max_segment_length] are split evenly.
+        """
+        keep = simplify.simplify_profile(view.distances, view.elevations, tolerance)
+        full_distances = view.distances[keep]
+        if max_segment_length is not None:
+            n_splits = np.maximum(np.ceil(np.diff(full_distances) / max_segment_length).astype(int), 1)
+            starts = np.repeat(full_distances[:-1], n_splits)
+            fractions = np.arange(n_splits.sum()) - np.repeat(np.cumsum(n_splits) - n_splits, n_splits)
+            full_distances = np.append(starts + fractions * np.repeat(np.diff(full_distances) / n_splits, n_splits), full_distances[-1])
+        segment_lengths = np.diff(full_distances)
+        segment_type = SegmentType.VARIABLE
+        should_interpolate = True
+        super().__init__(view, should_interpolate, loaded_elevations=None, segment_type=segment_type, full_distances=full_distances, segment_lengths=segment_lengths)
+
 class SegmentViewSmoothed(SegmentViewInterpolated):
     def __init__(self, view: SegmentViewInterpolated, new_elevations):
         super().__init__(view, should_interpolate=False, loaded_elevations=new_elevations)
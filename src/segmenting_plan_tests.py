@@ -1,5 +1,6 @@
 from segmenting_plan import *
 from race_course import RealRaceCourse
+from planning_context import PlanningContext
 import os
 import shutil
 
@@ -40,10 +41,11 @@ def main():
 
     # Generate results for each course and method
     for course in courses:
+        context = PlanningContext(course)
         for method_name, plan_class in methods.items():
             try:
                 # Initialize the segmenting plan
-                plan = plan_class(course)
+                plan = plan_class(course, context)
 
                 # Create directory for this course and method
                 course_directory = os.path.join(base_directory, course.course_name)
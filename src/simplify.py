@@ -0,0 +1,124 @@
+import numpy as np
+
+def rdp(n_points, get_errors, tolerance):
+    """
+    Ramer-Douglas-Peucker over points 0..n_points-1. get_errors(start, end) returns the error of
+    each point strictly between [start] and [end] when they are replaced by the chord from start to
+    end. Ranges are split at their worst point until every error is within [tolerance].
+
+    Returns a boolean mask of the kept points; the first and last points are always kept.
+    """
+    keep = np.zeros(n_points, dtype=bool)
+    if n_points == 0:
+        return keep
+    keep[[0, -1]] = True
+    stack = [(0, n_points - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        errors = get_errors(start, end)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+def simplify_profile(distances, elevations, tolerance):
+    """
+    Returns the mask of the profile points to keep so that linear interpolation between kept points
+    stays within [tolerance] of every elevation (vertical error, in elevation units).
+    """
+    distances = np.asarray(distances, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+
+    def get_errors(start, end):
+        x = distances[start+1:end]
+        slope = (elevations[end] - elevations[start]) / (distances[end] - distances[start])
+        return np.abs(elevations[start+1:end] - (elevations[start] + slope * (x - distances[start])))
+
+    return rdp(len(distances), get_errors, tolerance)
+
+EARTH_RADIUS_METERS = 6371 * 1000
+
+def project_track(lats, lons, origin=None):
+    """
+    Local equirectangular projection of a track to planar x/y coordinates in meters, accurate
+    for tracks spanning up to a few hundred kilometers. [origin] is the (lat, lon) in degrees
+    mapped to (0, 0), the mean of the track by default.
+    """
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    lat0, lon0 = (lats.mean(), lons.mean()) if origin is None else np.radians(origin)
+    x = EARTH_RADIUS_METERS * (lons - lon0) * np.cos(lat0)
+    y = EARTH_RADIUS_METERS * (lats - lat0)
+    return x, y
+
+def get_chord_errors(points, start, end):
+    """
+    Returns the 3d distance of points[start+1:end] to the segment between points[start] and
+    points[end], and their vertical distance to the chord at the same position along it.
+    """
+    a = points[start]
+    ab = points[end] - a
+    ap = points[start+1:end] - a
+    length_squared = ab @ ab
+    t = np.zeros(len(ap)) if length_squared == 0 else np.clip(ap @ ab / length_squared, 0, 1)
+    offsets = ap - t[:, None] * ab
+    return np.sqrt(np.einsum('ij,ij->i', offsets, offsets)), np.abs(offsets[:, 2])
+
+class TrackSimplification:
+    """
+    Report of simplify_track: points kept and dropped, the largest 3d and vertical deviation of a
+    dropped point from the simplified track, and the change in 3d track length.
+    """
+    def __init__(self, keep, max_offset, max_elevation_error, length, simplified_length):
+        self.keep = keep
+        self.n_points = len(keep)
+        self.n_kept = int(keep.sum())
+        self.n_dropped = self.n_points - self.n_kept
+        self.max_offset = max_offset
+        self.max_elevation_error = max_elevation_error
+        self.length = length
+        self.simplified_length = simplified_length
+        self.length_error = length - simplified_length
+
+    def __repr__(self):
+        ratio = self.n_points / max(self.n_kept, 1)
+        return (f"Track simplification: kept {self.n_kept} of {self.n_points} points ({ratio:.1f}x fewer), "
+                f"max offset {self.max_offset:.2f} m, max elevation error {self.max_elevation_error:.2f} m, "
+                f"length {self.length:.1f} -> {self.simplified_length:.1f} m")
+
+def simplify_track(lats, lons, elevations, tolerance, elevation_tolerance=None):
+    """
+    3d Ramer-Douglas-Peucker simplification of a recorded track (elevations in meters). Every
+    dropped point lies within [tolerance] meters of the simplified track and within
+    [elevation_tolerance] meters (default: tolerance) of its elevation. Returns a
+    TrackSimplification whose keep mask selects the remaining points.
+    """
+    if elevation_tolerance is None:
+        elevation_tolerance = tolerance
+    x, y = project_track(lats, lons)
+    points = np.column_stack((x, y, np.asarray(elevations, dtype=float)))
+
+    def get_errors(start, end):
+        offsets, elevation_errors = get_chord_errors(points, start, end)
+        return np.maximum(offsets / tolerance, elevation_errors / elevation_tolerance)
+
+    keep = rdp(len(points), get_errors, 1)
+
+    # Measure the deviation of every dropped point from the chord that replaced it
+    kept_indices = np.flatnonzero(keep)
+    max_offset = 0.0
+    max_elevation_error = 0.0
+    for start, end in zip(kept_indices[:-1], kept_indices[1:]):
+        if end - start > 1:
+            offsets, elevation_errors = get_chord_errors(points, start, end)
+            max_offset = max(max_offset, offsets.max())
+            max_elevation_error = max(max_elevation_error, elevation_errors.max())
+
+    length = np.linalg.norm(np.diff(points, axis=0), axis=1).sum()
+    simplified_length = np.linalg.norm(np.diff(points[keep], axis=0), axis=1).sum()
+    return TrackSimplification(keep, max_offset, max_elevation_error, length, simplified_length)
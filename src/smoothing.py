@@ -0,0 +1,158 @@
+import numpy as np
+from scipy import ndimage
+
+def running_average(values, weights, window_size=3):
+    """
+    Centered moving average of [values] over [window_size] neighbouring segments, weighted by
+    [weights] (e.g. segment lengths). Windows shrink at the ends of the course. O(n) via prefix sums.
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    n = len(values)
+    half_window = window_size // 2
+    weight_sums = np.insert(np.cumsum(weights), 0, 0)
+    weighted_sums = np.insert(np.cumsum(weights * values), 0, 0)
+
+    idx = np.arange(n)
+    starts = np.maximum(idx - half_window, 0)
+    ends = np.minimum(idx + half_window + 1, n)
+    return (weighted_sums[ends] - weighted_sums[starts]) / (weight_sums[ends] - weight_sums[starts])
+
+def gaussian(values, sigma=3, weights=None):
+    """
+    Gaussian filter of [values] with a standard deviation of [sigma] segments. When [weights] are
+    given each segment contributes in proportion to its weight (normalized convolution), so long
+    segments are not under-represented on variable-length views.
+    """
+    values = np.asarray(values, dtype=float)
+    if weights is None:
+        return ndimage.gaussian_filter1d(values, sigma)
+    weights = np.asarray(weights, dtype=float)
+    return ndimage.gaussian_filter1d(weights * values, sigma) / ndimage.gaussian_filter1d(weights, sigma)
+
+def loess(x, values, bandwidth):
+    """
+    Local linear regression of [values] at each position [x] (sorted) using a tricube kernel of
+    fixed [bandwidth] (in the units of x). The weighted sums of every fit are accumulated one
+    neighbour offset at a time, so the cost is O(n * w) where w is the largest number of
+    neighbours within the bandwidth.
+    """
+    x = np.asarray(x, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n = len(x)
+    if bandwidth <= 0:
+        raise ValueError(f"LOESS bandwidth must be positive, got {bandwidth}")
+
+    idx = np.arange(n)
+    max_offset = int(np.max(np.searchsorted(x, x + bandwidth, side='left') - 1 - idx, initial=0))
+    max_offset = max(max_offset, int(np.max(idx - np.searchsorted(x, x - bandwidth, side='right'), initial=0)))
+
+    # Weighted moments of the local fits, centered on each x
+    s0 = np.zeros(n)
+    s1 = np.zeros(n)
+    s2 = np.zeros(n)
+    t0 = np.zeros(n)
+    t1 = np.zeros(n)
+    for offset in range(-max_offset, max_offset + 1):
+        lo, hi = max(0, -offset), min(n, n - offset)
+        if lo >= hi:
+            continue
+        dx = x[lo+offset:hi+offset] - x[lo:hi]
+        u = np.minimum(np.abs(dx) / bandwidth, 1)
+        w = (1 - u**3)**3
+        wy = w * values[lo+offset:hi+offset]
+        s0[lo:hi] += w
+        s1[lo:hi] += w * dx
+        s2[lo:hi] += w * dx**2
+        t0[lo:hi] += wy
+        t1[lo:hi] += wy * dx
+
+    det = s0 * s2 - s1**2
+    # Fall back to the local weighted mean where a line cannot be fit (a single neighbour)
+    is_degenerate = det <= 1e-12 * np.maximum(s0 * s2, 1e-300)
+    safe_det = np.where(is_degenerate, 1, det)
+    return np.where(is_degenerate, t0 / s0, (s2 * t0 - s1 * t1) / safe_det)
+
+def total_variation(values, weights, lam):
+    """
+    Weighted total variation denoising (1D fused lasso): the x minimizing
+    sum(weights * (x - values)**2) / 2 + lam * sum(|x[i+1] - x[i]|), which is piecewise constant
+    with fewer pieces for larger [lam]. Exact, using the dynamic programming algorithm of Johnson
+    (2013): the derivative of the partial objective is kept as a piecewise linear function whose
+    knots are only ever added or removed at its ends, so this is O(n) amortized.
+    """
+    y = np.asarray(values, dtype=float)
+    w = np.asarray(weights, dtype=float)
+    n = len(y)
+    if n <= 1 or lam <= 0:
+        return y.copy()
+    y = y.tolist()
+    w = w.tolist()
+
+    # Knots x[l..r] of the derivative, which changes by a*t + b at each knot
+    x = [0.0] * (2 * n)
+    a = [0.0] * (2 * n)
+    b = [0.0] * (2 * n)
+    # Below tm[k] / above tp[k] the optimal x[k] is clipped to them given x[k+1]
+    tm = [0.0] * (n - 1)
+    tp = [0.0] * (n - 1)
+
+    tm[0] = -lam / w[0] + y[0]
+    tp[0] = lam / w[0] + y[0]
+    l, r = n - 1, n
+    x[l], x[r] = tm[0], tp[0]
+    a[l], b[l] = w[0], -w[0] * y[0] + lam
+    a[r], b[r] = -w[0], w[0] * y[0] + lam
+    afirst, bfirst = w[1], -lam - w[1] * y[1]
+    alast, blast = -w[1], w[1] * y[1] - lam
+
+    for k in range(1, n - 1):
+        # Step up from the left until the derivative is above -lam
+        alo, blo = afirst, bfirst
+        lo = l
+        while lo <= r and alo * x[lo] + blo <= -lam:
+            alo += a[lo]
+            blo += b[lo]
+            lo += 1
+        tm[k] = (-lam - blo) / alo
+        l = lo - 1
+        x[l] = tm[k]
+
+        # Step down from the right until the derivative is below lam
+        ahi, bhi = alast, blast
+        hi = r
+        while hi >= lo and -ahi * x[hi] - bhi >= lam:
+            ahi += a[hi]
+            bhi += b[hi]
+            hi -= 1
+        tp[k] = (lam + bhi) / -ahi
+        r = hi + 1
+        x[r] = tp[k]
+
+        a[l], b[l] = alo, blo + lam
+        a[r], b[r] = ahi, bhi + lam
+        afirst, bfirst = w[k+1], -lam - w[k+1] * y[k+1]
+        alast, blast = -w[k+1], w[k+1] * y[k+1] - lam
+
+    # The last value is where the derivative is 0, the others follow from the clipping bounds
+    alo, blo = afirst, bfirst
+    lo = l
+    while lo <= r and alo * x[lo] + blo <= 0:
+        alo += a[lo]
+        blo += b[lo]
+        lo += 1
+    result = [0.0] * n
+    result[n-1] = -blo / alo
+    for k in range(n - 2, -1, -1):
+        result[k] = min(max(result[k+1], tm[k]), tp[k])
+    return np.array(result)
+
+def get_total_variation_max_lambda(values, weights):
+    """
+    The smallest lam for which total_variation(values, weights, lam) is constant (the weighted mean).
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    mean = np.dot(weights, values) / np.sum(weights)
+    residual_sums = np.cumsum(weights * (values - mean))[:-1]
+    return float(np.max(np.abs(residual_sums), initial=0.0))
@@ -0,0 +1,79 @@
+import math
+import numpy as np
+from utils import Conversions
+
+class Splits:
+    """
+    Split table of a pacing plan. Each split i covers [start_distances[i], end_distances[i]).
+    """
+    def __init__(self, end_distances, elapsed_times):
+        self.end_distances = end_distances
+        self.start_distances = np.insert(end_distances[:-1], 0, 0)
+        self.distances = self.end_distances - self.start_distances
+        self.elapsed_times = elapsed_times
+        self.times = np.diff(np.insert(elapsed_times, 0, 0))
+        self.paces = self.times / self.distances
+
+    def __len__(self):
+        return len(self.end_distances)
+
+class SplitEngine:
+    """
+    Cumulative time-vs-distance curve of a pacing plan. The curve is built once in O(n); the
+    elapsed time at any sorted set of k split distances is then found by binary search and linear
+    interpolation within the segment the split falls in.
+    """
+    def __init__(self, segment_lengths, paces):
+        self.paces = np.asarray(paces, dtype=float)
+        self.distances = np.insert(np.cumsum(segment_lengths), 0, 0) # n_segments + 1
+        self.elapsed_times = np.insert(np.cumsum(segment_lengths * self.paces), 0, 0) # n_segments + 1
+        self.total_distance = self.distances[-1]
+        self.total_time = self.elapsed_times[-1]
+
+    def get_elapsed_times(self, distances):
+        """
+        Returns the elapsed time of the plan at each of the given distances.
+        """
+        distances = np.clip(distances, 0, self.total_distance)
+        idx = np.searchsorted(self.distances, distances, side='right') - 1
+        idx = np.clip(idx, 0, len(self.paces) - 1)
+        return self.elapsed_times[idx] + (distances - self.distances[idx]) * self.paces[idx]
+
+    def get_splits(self, split_distances):
+        """
+        Returns the Splits ending at each of [split_distances] and at the finish. Split distances
+        at or beyond the end of the course are ignored.
+        """
+        split_distances = np.asarray(split_distances, dtype=float)
+        split_distances = split_distances[(split_distances > 0) & (split_distances < self.total_distance)]
+        end_distances = np.append(split_distances, self.total_distance)
+        elapsed_times = self.get_elapsed_times(end_distances)
+        elapsed_times[-1] = self.total_time
+        return Splits(end_distances, elapsed_times)
+
+def get_markers(total_distance, step):
+    """
+    Returns the distances of every [step] up to (excluding) the total distance.
+    """
+    n_markers = math.ceil(total_distance / step)
+    return np.arange(1, n_markers) * step
+
+def get_mile_markers(total_distance):
+    """Split distances of every mile, for a course measured in miles."""
+    return get_markers(total_distance, 1)
+
+def get_kilometer_markers(total_distance):
+    """Split distances of every kilometer, for a course measured in miles."""
+    return get_markers(total_distance * Conversions.MILES_TO_KM.value, 1) / Conversions.MILES_TO_KM.value
+
+def get_nearest_indices(end_distances, markers):
+    """
+    Returns the index of the segment whose end distance is closest to each marker, preferring the
+    earlier segment on ties. end_distances must be sorted.
+    """
+    if len(end_distances) == 1:
+        return np.zeros(len(markers), dtype=int)
+    idx = np.searchsorted(end_distances, markers, side='left')
+    idx = np.clip(idx, 1, len(end_distances) - 1)
+    prev_closer = np.abs(end_distances[idx - 1] - markers) <= np.abs(end_distances[idx] - markers)
+    return np.where(prev_closer, idx - 1, idx)
@@ -0,0 +1,79 @@
+import json
+import types
+from contextlib import contextmanager
+
+import numpy as np
+
+@contextmanager
+def open_output(target, mode='w'):
+    """
+    Yields a writable file for [target], which is either a path (opened and closed here) or an
+    already open file-like object such as a socket's makefile() (left open).
+    """
+    if hasattr(target, 'write'):
+        yield target
+    else:
+        with open(target, mode) as f:
+            yield f
+
+def iter_rows(columns, decimals=None, chunk_size=4096):
+    """
+    Yields the rows of the given equal-length column arrays as lists, converting [chunk_size] rows
+    at a time. [decimals] optionally gives the number of decimals to round each column to.
+    """
+    n_rows = len(columns[0])
+    for start in range(0, n_rows, chunk_size):
+        chunk = [column[start:start+chunk_size] for column in columns]
+        if decimals is not None:
+            chunk = [c if d is None else np.round(c, d) for c, d in zip(chunk, decimals)]
+        yield from np.stack(chunk, axis=-1).tolist()
+
+def iter_json(obj, indent=None, level=0):
+    """
+    Yields the json text of [obj] chunk by chunk. Dicts are encoded entry by entry and generators
+    are encoded as lists one item at a time, so streamed content is never held in memory. The
+    output is identical to json.dumps(obj, indent=indent) with the generators expanded to lists.
+    """
+    if isinstance(obj, dict):
+        entries = ((json.dumps(str(key)) + ': ', value) for key, value in obj.items())
+        yield from _iter_container(entries, '{', '}', indent, level)
+    elif isinstance(obj, types.GeneratorType):
+        entries = (('', value) for value in obj)
+        yield from _iter_container(entries, '[', ']', indent, level)
+    else:
+        text = json.dumps(obj, indent=indent)
+        if indent is not None and level:
+            text = text.replace('\n', '\n' + _get_pad(indent) * level)
+        yield text
+
+def _get_pad(indent):
+    return ' ' * indent if isinstance(indent, int) else indent
+
+def _iter_container(entries, open_bracket, close_bracket, indent, level):
+    pad = None if indent is None else _get_pad(indent)
+    is_first = True
+    for prefix, value in entries:
+        if is_first:
+            yield open_bracket if pad is None else open_bracket + '\n'
+            is_first = False
+        else:
+            yield ', ' if pad is None else ',\n'
+        if pad is not None:
+            yield pad * (level + 1)
+        yield prefix
+        yield from iter_json(value, indent, level + 1)
+
+    if is_first:
+        yield open_bracket + close_bracket
+    elif pad is None:
+        yield close_bracket
+    else:
+        yield '\n' + pad * level + close_bracket
+
+def write_json(target, obj, indent=None):
+    """
+    Streams the json encoding of [obj] (see iter_json) to a path or file-like object.
+    """
+    with open_output(target) as f:
+        for chunk in iter_json(obj, indent):
+            f.write(chunk)
@@ -71,7 +71,17 @@ def calculate_distance_scalar(start_lat, start_lon, end_lat, end_lon):
         distance = radius * c * 1000
         return distance
 
-calculate_distance = np.vectorize(calculate_distance_scalar)
+def calculate_distance(start_lats, start_lons, end_lats, end_lons):
+    """
+    Vectorized calculate_distance_scalar: haversine distance in meters between arrays of points.
+    """
+    radius = 6371
+    lat1, lon1, lat2, lon2 = map(np.radians, [start_lats, start_lons, end_lats, end_lons])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return radius * c * 1000
 
 def calculate_grade_scalar(elevation_change, distance):
         return elevation_change / distance * 100
@@ -88,6 +98,48 @@ def calculate_segment_grade(start, end, elevations, distances):
     total_elevation = sum(elevations[start:end+1])
     return calculate_grade_scalar(total_elevation, total_distance)
 
+def find_runs(mask):
+    """
+    Run-length encodes a boolean mask. Returns the (inclusive) start and end index of every run of
+    True values.
+    """
+    padded = np.concatenate(([False], np.asarray(mask, dtype=bool), [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[::2], changes[1::2] - 1
+
+class RangeMinMax:
+    """
+    Sparse table answering the min and max of [values] over any non-empty half-open index range
+    [start, end) in O(1), after an O(n log n) build. Queries are vectorized over arrays of ranges.
+    """
+    def __init__(self, values):
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        n_levels = max(n, 1).bit_length()
+        # level k holds the min/max over [i, i + 2**k), padded past the end of the array
+        self.mins = np.full((n_levels, n), np.inf)
+        self.maxs = np.full((n_levels, n), -np.inf)
+        self.mins[0] = values
+        self.maxs[0] = values
+        for k in range(1, n_levels):
+            half = 1 << (k - 1)
+            self.mins[k, :n-half] = np.minimum(self.mins[k-1, :n-half], self.mins[k-1, half:])
+            self.maxs[k, :n-half] = np.maximum(self.maxs[k-1, :n-half], self.maxs[k-1, half:])
+
+    def _get_levels(self, starts, ends):
+        lengths = np.asarray(ends) - np.asarray(starts)
+        assert np.all(lengths > 0), 'Ranges must be non-empty'
+        levels = np.floor(np.log2(lengths)).astype(int)
+        return levels, np.asarray(ends) - (1 << levels)
+
+    def min(self, starts, ends):
+        levels, second_starts = self._get_levels(starts, ends)
+        return np.minimum(self.mins[levels, starts], self.mins[levels, second_starts])
+
+    def max(self, starts, ends):
+        levels, second_starts = self._get_levels(starts, ends)
+        return np.maximum(self.maxs[levels, starts], self.maxs[levels, second_starts])
+
 def cprint(text: str, bkd_color: str = "cyan"):
     '''
     Prints colored bkd text to terminal.